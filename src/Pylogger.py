@@ -1,11 +1,12 @@
 import logging
 import os
 import sys
-import datetime
 
 _enable_logging = False
 _my_logger = logging.getLogger("logger")
-_my_logger.setLevel(logging.DEBUG)
+# 未啟用日誌時不輸出任何訊息，也不建立 LogRecord；由入口程式呼叫 logger_enable() 才寫入檔案
+_my_logger.setLevel(logging.WARNING)
+_my_logger.addHandler(logging.NullHandler())
 
 Levels = {
     #NOTSET: 0,  # 預設等級，未設定時使用
@@ -21,6 +22,7 @@ Levels = {
     "CUE_CONS": 5,
     "SHOW_PARSER": 6,
     "SHOW_CONS": 7,
+    "CUE_BIND": 8,
 }
 
 
@@ -39,6 +41,11 @@ def add_custom_log_levels(levels_dict):
         func_name = name.lower()
         setattr(logging.Logger, func_name, log_for_level)
 
+
+# 自訂等級的函式 (logger.lexer() 等) 在匯入時就註冊，模組不需要先啟用日誌
+add_custom_log_levels(Levels)
+
+
 def get_default_log_file():
     # 取得主執行檔完整路徑
     # sys.argv[0] 是執行的腳本路徑，若用 __file__ 會是模組本身路徑
@@ -48,9 +55,10 @@ def get_default_log_file():
     log_file_name = f"{name_without_ext}_run.log"       # 拼成 main_run.log
     return log_file_name
 
-def logger_enable(log_file_path=None):
-    add_custom_log_levels(Levels)
+def logger_enable(log_file_path=None, level=Levels['SHOW_PARSER']):
+    import datetime
     global _enable_logging
+    _my_logger.setLevel(level)
     if not _enable_logging:
         if log_file_path is None:
             log_file_path = get_default_log_file()
@@ -63,11 +71,14 @@ def logger_enable(log_file_path=None):
         print("Logging starts at", datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S,%f"))
 
 def logger_disable():
+    import datetime
     global _enable_logging
     if _enable_logging:
         for handler in _my_logger.handlers[:]:
-            _my_logger.removeHandler(handler)
-            handler.close()
+            if isinstance(handler, logging.FileHandler):
+                _my_logger.removeHandler(handler)
+                handler.close()
+        _my_logger.setLevel(logging.WARNING)
         _enable_logging = False
         print("Logging disabled")
         print("Logging stops at", datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S,%f"))
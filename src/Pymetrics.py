@@ -0,0 +1,224 @@
+import json
+import time
+from array import array
+from bisect import bisect_left
+
+# 與 Pylogger 相同的使用方式：模組層級的開關，關閉時所有記錄函式直接返回
+# 熱路徑請使用 now()/record()，只會產生 int，不會配置其他物件
+#     t0 = Pymetrics.now()
+#     ...
+#     Pymetrics.record('render', t0)
+enabled = False
+
+PHASES = ('lex', 'parse', 'func_compile', 'cue_bind', 'render', 'merge', 'send')
+FRAME_HISTOGRAMS = ('frame_jitter', 'frame_time')
+
+# 固定的 bucket 上限 (秒)：1us, 2us, 4us ... 約 8s
+BUCKET_BOUNDS = tuple(1e-6 * 2 ** i for i in range(24))
+
+
+class Histogram:
+    __slots__ = ('name', 'counts', 'total', 'count', 'max')
+
+    def __init__(self, name):
+        self.name = name
+        self.counts = array('Q', bytes(8 * (len(BUCKET_BOUNDS) + 1)))
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect_left(BUCKET_BOUNDS, value)] += 1
+        self.total += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def percentile(self, p):
+        # 以 bucket 上限估計百分位數
+        if not self.count:
+            return 0.0
+        target = p * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target and n:
+                return BUCKET_BOUNDS[i] if i < len(BUCKET_BOUNDS) else self.max
+        return self.max
+
+    def snapshot(self):
+        counts = self.counts.tolist()
+        return {
+            'count': self.count,
+            'total_sec': self.total,
+            'mean_sec': self.total / self.count if self.count else 0.0,
+            'max_sec': self.max,
+            'p50_sec': self.percentile(0.50),
+            'p90_sec': self.percentile(0.90),
+            'p99_sec': self.percentile(0.99),
+            'buckets': {f"{bound:.6g}": n for bound, n in zip(BUCKET_BOUNDS + (float('inf'),), counts) if n},
+            'bucket_counts': counts,
+        }
+
+
+_histograms = {name: Histogram(name) for name in PHASES + FRAME_HISTOGRAMS}
+_counters = {'frames': 0, 'deadline_misses': 0, 'dropped_frames': 0}
+_gauges = {}
+_started = time.monotonic()
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def is_enabled():
+    return enabled
+
+
+def now():
+    return time.perf_counter_ns() if enabled else 0
+
+
+def record(name, t0):
+    # 以 now() 取得的 t0 記錄一段經過時間
+    if not enabled or not t0:
+        return
+    histogram = _histograms.get(name)
+    if histogram is None:
+        histogram = _histograms[name] = Histogram(name)
+    histogram.add((time.perf_counter_ns() - t0) * 1e-9)
+
+
+def observe(name, seconds):
+    if not enabled:
+        return
+    histogram = _histograms.get(name)
+    if histogram is None:
+        histogram = _histograms[name] = Histogram(name)
+    histogram.add(seconds)
+
+
+def count(name, n=1):
+    if enabled:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def set_gauge(name, value):
+    if enabled:
+        _gauges[name] = value
+
+
+def frame_tick(deadline, start, end, period):
+    # deadline 為預定開始時間，start/end 為實際開始與完成時間 (皆為 time.monotonic)
+    if not enabled:
+        return
+    _histograms['frame_jitter'].add(abs(start - deadline))
+    _histograms['frame_time'].add(end - start)
+    _counters['frames'] += 1
+    if end > deadline + period:
+        _counters['deadline_misses'] += 1
+
+
+class _Span:
+    __slots__ = ('name', 't0')
+
+    def __init__(self, name):
+        self.name = name
+        self.t0 = 0
+
+    def __enter__(self):
+        self.t0 = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, self.t0)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_null_span = _NullSpan()
+
+
+def span(name):
+    # 非熱路徑使用的 context manager，關閉時回傳共用的空物件
+    return _Span(name) if enabled else _null_span
+
+
+def timed(name):
+    def decorator(func):
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            t0 = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, t0)
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        wrapper.__wrapped__ = func
+        return wrapper
+    return decorator
+
+
+def get_histogram(name):
+    return _histograms.get(name)
+
+
+def reset():
+    for histogram in _histograms.values():
+        histogram.reset()
+    for name in _counters:
+        _counters[name] = 0
+    _gauges.clear()
+
+
+def snapshot():
+    # 可在其他執行緒呼叫：list()/dict() 複製為單一步驟，不需要與記錄端共用 lock
+    return {
+        'enabled': enabled,
+        'uptime_sec': time.monotonic() - _started,
+        'histograms': {name: h.snapshot() for name, h in list(_histograms.items())},
+        'counters': dict(_counters),
+        'gauges': dict(_gauges),
+    }
+
+
+def export_json(path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot(), f, indent=2)
+    return path
+
+
+if __name__ == "__main__":
+    import pprint
+    enable()
+    for i in range(1000):
+        t0 = now()
+        sum(range(i))
+        record('render', t0)
+    with span('lex'):
+        time.sleep(0.01)
+    pprint.pprint(snapshot()['histograms']['render'])
+    pprint.pprint(snapshot()['histograms']['lex'])
@@ -0,0 +1,223 @@
+class Node:
+    # 所有語法節點的基底：以 __slots__ 存放欄位與來源位置 (開始行、開始列)
+    # pickle 時只存欄位值，可以直接在行程間傳遞
+    __slots__ = ('line', 'column')
+    fields = ()
+
+    def __init__(self, line=0, column=0, end_line=0):
+        self.line = line
+        self.column = column
+
+    @property
+    def end_line(self):
+        # 單行的節點 (指令、FUNC、CUE 呼叫、WAIT) 不另外存結束行
+        return self.line
+
+    @property
+    def span(self):
+        return self.line, self.column, self.end_line
+
+    def where(self, path=None):
+        # 錯誤訊息與 metrics 使用的位置，例如 cue_01.tw:12
+        return f"{path or '<input>'}:{self.line}"
+
+    def __reduce__(self):
+        return self.__class__, tuple(getattr(self, name) for name in self.fields) + self.span
+
+    def __eq__(self, other):
+        return type(other) is type(self) and self.__reduce__()[1] == other.__reduce__()[1]
+
+    __hash__ = None
+
+    def __repr__(self):
+        values = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.fields)
+        return f"{self.__class__.__name__}({values}, line={self.line})"
+
+
+class Block(Node):
+    # 可能跨越多行的節點，另外記錄結束行
+    __slots__ = ('end_line',)
+
+    def __init__(self, line=0, column=0, end_line=0):
+        super().__init__(line, column)
+        self.end_line = end_line or line
+
+
+class Func(Node):
+    # FUNC name(arg) = expr；函式在第一次使用時才以 sympy 建立，從 pickle 還原後也一樣
+    __slots__ = ('name', 'arg', 'expr', '_function')
+    fields = ('name', 'arg', 'expr')
+
+    def __init__(self, name, arg, expr, line=0, column=0, end_line=0, function=None):
+        super().__init__(line, column, end_line)
+        self.name = name
+        self.arg = arg
+        self.expr = expr
+        self._function = function
+
+    @property
+    def function(self):
+        if self._function is None:
+            from cue_parser import build_func
+            self._function = build_func(self.arg, self.expr)
+        return self._function
+
+
+class Command(Node):
+    # 一行指令，例如 'LIGHT . L DIMMER func wave1 from 0 to PI'，由 cue_instance.parse_command 拆解
+    __slots__ = ('text',)
+    fields = ('text',)
+
+    def __init__(self, text, line=0, column=0, end_line=0):
+        super().__init__(line, column, end_line)
+        self.text = text
+
+
+class Interval(Block):
+    # DIMMER / COLOR / STROBE 區塊中的 INTERVAL[start-end]{...}
+    __slots__ = ('start', 'end', 'commands')
+    fields = ('start', 'end', 'commands')
+
+    def __init__(self, start, end, commands, line=0, column=0, end_line=0):
+        super().__init__(line, column, end_line)
+        self.start = start
+        self.end = end
+        self.commands = commands
+
+    @property
+    def key(self):
+        return f"INTERVAL[{self.start}-{self.end}]"
+
+
+class Cue(Block):
+    # 具名 cue 檔案或 inline cue 的內容，name 為 None 表示 inline
+    # blocks 為 {'DIMMER': [Interval, ...], ...}，others 為 OTHERS{...} 的模式，未宣告時為 None
+    __slots__ = ('name', 'params', 'funcs', 'interval', 'blocks', 'others', 'path')
+    fields = ('name', 'params', 'funcs', 'interval', 'blocks', 'others', 'path')
+
+    def __init__(self, name, params=None, funcs=None, interval=None, blocks=None, others=None, path=None,
+                 line=0, column=0, end_line=0):
+        super().__init__(line, column, end_line)
+        self.name = name
+        self.params = params if params is not None else []
+        self.funcs = funcs if funcs is not None else {}
+        self.interval = interval
+        self.blocks = blocks if blocks is not None else {}
+        self.others = others
+        # 來源檔案，由載入的一方填入
+        self.path = path
+
+    def where(self, path=None):
+        return super().where(path or self.path)
+
+    def commands(self):
+        # 依檔案中的順序列出 (區塊, Interval, Command)
+        for block, intervals in self.blocks.items():
+            for interval in intervals:
+                for command in interval.commands:
+                    yield block, interval, command
+
+
+class CueCall(Node):
+    # SHOW 中的 CUE name(params) CUE END
+    __slots__ = ('name', 'params')
+    fields = ('name', 'params')
+
+    def __init__(self, name, params=None, line=0, column=0, end_line=0):
+        super().__init__(line, column, end_line)
+        self.name = name
+        self.params = params if params is not None else []
+
+
+class InlineCue(Block):
+    # SHOW 中的 CUE { ... } CUE END
+    __slots__ = ('cue',)
+    fields = ('cue',)
+
+    def __init__(self, cue, line=0, column=0, end_line=0):
+        super().__init__(line, column, end_line)
+        self.cue = cue
+
+
+class Wait(Node):
+    __slots__ = ('duration', 'unit')
+    fields = ('duration', 'unit')
+
+    def __init__(self, duration, unit, line=0, column=0, end_line=0):
+        super().__init__(line, column, end_line)
+        self.duration = duration
+        self.unit = unit
+
+
+class Show(Block):
+    # SHOW number START ... SHOW END，body 依順序為 CueCall / InlineCue / Wait
+    __slots__ = ('number', 'body')
+    fields = ('number', 'body')
+
+    def __init__(self, number, body, line=0, column=0, end_line=0):
+        super().__init__(line, column, end_line)
+        self.number = number
+        self.body = body
+
+
+class ShowScript(Block):
+    # show 檔案：SETTING、PLAYBACK 與所有 SHOW
+    __slots__ = ('setting', 'playback', 'shows', 'path')
+    fields = ('setting', 'playback', 'shows', 'path')
+
+    def __init__(self, setting=None, playback=None, shows=None, path=None, line=0, column=0, end_line=0):
+        super().__init__(line, column, end_line)
+        self.setting = setting
+        self.playback = playback
+        self.shows = shows if shows is not None else []
+        self.path = path
+
+
+class Fixture(Block):
+    __slots__ = ('fixture_type', 'number', 'aliases')
+    fields = ('fixture_type', 'number', 'aliases')
+
+    def __init__(self, fixture_type, number, aliases, line=0, column=0, end_line=0):
+        super().__init__(line, column, end_line)
+        self.fixture_type = fixture_type
+        self.number = number
+        self.aliases = aliases
+
+
+class Patch(Block):
+    # 一個 universe 的 patch，以 run 儲存：每個 run 為連續的 alias、起始位址與間隔
+    __slots__ = ('universe', 'aliases', 'run_count', 'run_start', 'run_stride')
+    fields = ('universe', 'aliases', 'run_count', 'run_start', 'run_stride')
+
+    def __init__(self, universe, aliases, run_count, run_start, run_stride, line=0, column=0, end_line=0):
+        super().__init__(line, column, end_line)
+        self.universe = universe
+        self.aliases = aliases
+        self.run_count = run_count
+        self.run_start = run_start
+        self.run_stride = run_stride
+
+
+class Group(Block):
+    __slots__ = ('name', 'types', 'aliases')
+    fields = ('name', 'types', 'aliases')
+
+    def __init__(self, name, types, aliases, line=0, column=0, end_line=0):
+        super().__init__(line, column, end_line)
+        self.name = name
+        self.types = types
+        self.aliases = aliases
+
+
+class Setting(Block):
+    # setting 檔案：LIBS、FIXTURE、PATCH 與 GROUP
+    __slots__ = ('libs', 'fixtures', 'patches', 'groups', 'path')
+    fields = ('libs', 'fixtures', 'patches', 'groups', 'path')
+
+    def __init__(self, libs=None, fixtures=None, patches=None, groups=None, path=None, line=0, column=0, end_line=0):
+        super().__init__(line, column, end_line)
+        self.libs = libs if libs is not None else []
+        self.fixtures = fixtures if fixtures is not None else []
+        self.patches = patches if patches is not None else []
+        self.groups = groups if groups is not None else []
+        self.path = path
@@ -0,0 +1,274 @@
+import os
+import sys
+import io
+import json
+import time
+import platform
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+import contextlib
+from show_generator import ShowGenerator
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_THRESHOLD = 0.10
+# 命令列 parse 扣掉 interpreter 啟動後，到輸出結果的目標時間 (秒)
+CLI_PARSE_TARGET = 0.100
+IMPORT_TOP = 12
+
+# 每個規模的產生參數，scale 會再乘上 fixtures / cues / show_calls
+SCALES = {
+    'fixtures': 2000,
+    'cues': 200,
+    'show_calls': 2000,
+    'intervals': 32,
+    'blocks_per_channel': 12,
+    'commands_per_block': 6,
+    'func_terms': 12,
+}
+
+
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SRC_DIR,
+                             capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Benchmark:
+    def __init__(self, scale=1.0, repeat=3, seed=0, keep_logging=False):
+        self.scale = scale
+        self.repeat = repeat
+        self.keep_logging = keep_logging
+        params = dict(SCALES)
+        for key in ('fixtures', 'cues', 'show_calls'):
+            params[key] = max(2, int(params[key] * scale))
+        self.params = params
+        self.gen = ShowGenerator(seed=seed, **params)
+        self.results = {}
+        self.imports = None
+
+    def setup(self):
+        # 日誌預設關閉，benchmark 只量測解析本身；keep_logging 時與命令列的 --log 相同寫入檔案
+        from lexer import Lexer
+        from cue_parser import CueParser
+        from show_parser import ShowParser
+        from setting_parser import SettingParser
+        import Pylogger
+        if self.keep_logging:
+            Pylogger.logger_enable()
+        self.Lexer, self.CueParser, self.ShowParser, self.SettingParser = Lexer, CueParser, ShowParser, SettingParser
+
+        gen = self.gen
+        lib_names = ['color_lib_gen', 'fixture_lib_gen', 'func_lib', 'playback_lib_gen']
+        self.cue_texts = [gen.cue_text(name) for name in gen.cue_names()]
+        self.setting_text = gen.setting_text(lib_names)
+        self.show_text = gen.show_text('setting', 'playback_lib_gen')
+        self.lex_text = ''.join(self.cue_texts)
+        self.cue_tokens = [list(Lexer(text).generate_tokens()) for text in self.cue_texts]
+        self.setting_tokens = list(Lexer(self.setting_text).generate_tokens())
+        self.show_tokens = list(Lexer(self.show_text).generate_tokens())
+
+    def cases(self):
+        Lexer, CueParser, ShowParser, SettingParser = self.Lexer, self.CueParser, self.ShowParser, self.SettingParser
+        lex_tokens = sum(len(t) for t in self.cue_tokens)
+        return {
+            'lexer.generate_tokens': (
+                lambda: list(Lexer(self.lex_text).generate_tokens()),
+                lex_tokens, 'tokens', len(self.lex_text)),
+            'cue_parser.parse': (
+                lambda: [CueParser(tokens).parse() for tokens in self.cue_tokens],
+                len(self.cue_tokens), 'cues', len(self.lex_text)),
+            'show_parser.parse': (
+                lambda: ShowParser(self.show_tokens).parse(),
+                len(self.show_tokens), 'tokens', len(self.show_text)),
+            'setting_parser.parse': (
+                lambda: SettingParser(self.setting_tokens).parse(),
+                len(self.setting_tokens), 'tokens', len(self.setting_text)),
+        }
+
+    def measure(self, name, func, items, unit, nbytes):
+        times = []
+        for _ in range(self.repeat):
+            with contextlib.redirect_stdout(io.StringIO()):
+                t0 = time.perf_counter()
+                func()
+                times.append(time.perf_counter() - t0)
+        tracemalloc.start()
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        seconds = statistics.median(times)
+        result = {
+            'seconds': seconds,
+            'min_seconds': min(times),
+            'items': items,
+            'unit': unit,
+            'throughput': items / seconds if seconds else 0.0,
+            'mb_per_sec': nbytes / seconds / 1e6 if seconds else 0.0,
+            'peak_kb': peak / 1024,
+        }
+        self.results[name] = result
+        print(f"{name:28s} {seconds * 1000:10.2f} ms  {result['throughput']:12.1f} {unit}/s  "
+              f"{result['mb_per_sec']:8.2f} MB/s  peak {result['peak_kb']:10.1f} KB")
+        return result
+
+    def measure_process(self, name, args, cwd):
+        # 以新的 interpreter 執行，量測到行程結束的時間
+        env = dict(os.environ, PYTHONPATH=SRC_DIR + os.pathsep + os.environ.get('PYTHONPATH', ''))
+        times = []
+        for _ in range(self.repeat):
+            t0 = time.perf_counter()
+            subprocess.run([sys.executable] + args, cwd=cwd, env=env,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            times.append(time.perf_counter() - t0)
+        seconds = statistics.median(times)
+        self.results[name] = {
+            'seconds': seconds, 'min_seconds': min(times), 'items': 1, 'unit': 'starts',
+            'throughput': 1 / seconds, 'mb_per_sec': 0.0, 'peak_kb': 0.0,
+        }
+        return seconds
+
+    def measure_startup(self, module='show_parser'):
+        # 在暫存目錄執行，避免覆蓋既有的 log 檔
+        # startup.python 是 interpreter 本身的啟動時間，其他項目扣掉它才是匯入與執行的時間
+        cli = os.path.join(SRC_DIR, 'twiskalq.py')
+        with tempfile.TemporaryDirectory() as tmp:
+            cue_path = os.path.join(tmp, 'cue.tw')
+            with open(cue_path, 'w', encoding='utf-8') as f:
+                f.write(self.cue_texts[0])
+            base = self.measure_process('startup.python', ['-c', 'pass'], tmp)
+            print(f"{'startup.python':28s} {base * 1000:10.2f} ms")
+            cases = (
+                (f'startup.import_{module}', ['-c', f'import {module}']),
+                ('startup.cli_parse', [cli, 'parse', cue_path]),
+            )
+            for name, args in cases:
+                seconds = self.measure_process(name, args, tmp) - base
+                print(f"{name:28s} {(seconds + base) * 1000:10.2f} ms  "
+                      f"{seconds * 1000:8.2f} ms after interpreter start")
+            status = 'ok' if seconds < CLI_PARSE_TARGET else 'over target'
+            print(f"{'':28s} parse target {CLI_PARSE_TARGET * 1000:.0f} ms after interpreter start: {status}")
+            self.imports = import_profile([cli, 'parse', cue_path], tmp)
+        print_imports(self.imports)
+
+    def run(self, only=None):
+        self.setup()
+        for name, (func, items, unit, nbytes) in self.cases().items():
+            if only and not any(o in name for o in only):
+                continue
+            self.measure(name, func, items, unit, nbytes)
+        if not only or any('startup' in o for o in only):
+            self.measure_startup()
+        return self.report()
+
+    def report(self):
+        return {
+            'meta': {
+                'commit': git_commit(),
+                'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'scale': self.scale,
+                'repeat': self.repeat,
+                'params': self.params,
+            },
+            'results': self.results,
+            'imports': self.imports,
+        }
+
+
+def import_profile(args, cwd, top=IMPORT_TOP):
+    # 以 -X importtime 執行，回傳匯入時間的統計 (微秒)
+    # modules 為最上層匯入 (由入口程式直接匯入) 依累計時間排序，包含其下所有匯入
+    env = dict(os.environ, PYTHONPATH=SRC_DIR + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    out = subprocess.run([sys.executable, '-X', 'importtime'] + args, cwd=cwd, env=env,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    modules = []
+    total = 0
+    for line in out.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative, name = line[len('import time:'):].split('|')
+        total += int(self_us)
+        # 名稱前的空白代表巢狀深度，最上層只有一個空白
+        if not name.startswith('  '):
+            modules.append((name.strip(), int(self_us), int(cumulative)))
+    modules.sort(key=lambda m: m[2], reverse=True)
+    return {'command': ' '.join(os.path.basename(a) for a in args), 'total_us': total,
+            'count': len(modules), 'modules': [list(m) for m in modules[:top]]}
+
+
+def print_imports(imports):
+    print(f"imports for '{imports['command']}': {imports['total_us'] / 1000:.2f} ms total")
+    for name, self_us, cumulative in imports['modules']:
+        print(f"    {name:26s} {cumulative / 1000:8.2f} ms  (self {self_us / 1000:.2f} ms)")
+
+
+def compare(old, new, threshold=DEFAULT_THRESHOLD):
+    # 回傳 (名稱, 指標, 舊值, 新值, 比例, 狀態) 串列，時間或記憶體增加超過 threshold 視為退步
+    rows = []
+    for name, new_result in new['results'].items():
+        old_result = old['results'].get(name)
+        if old_result is None:
+            continue
+        for metric in ('seconds', 'peak_kb'):
+            before, after = old_result.get(metric, 0.0), new_result.get(metric, 0.0)
+            if not before:
+                continue
+            ratio = after / before
+            if ratio > 1 + threshold:
+                status = 'REGRESSION'
+            elif ratio < 1 - threshold:
+                status = 'improved'
+            else:
+                status = 'ok'
+            rows.append((name, metric, before, after, ratio, status))
+    return rows
+
+
+def load_json(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Twiskalq parser benchmark")
+    sub = parser.add_subparsers(dest='command', required=True)
+    run_parser = sub.add_parser('run', help="run the benchmark and store JSON results")
+    run_parser.add_argument('--out', default=None, help="result JSON path")
+    run_parser.add_argument('--scale', type=float, default=1.0)
+    run_parser.add_argument('--repeat', type=int, default=3)
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--only', nargs='*', help="only run cases whose name contains one of these")
+    run_parser.add_argument('--keep-logging', action='store_true', help="write the parsers' log to <script>_run.log")
+    cmp_parser = sub.add_parser('compare', help="compare two result files")
+    cmp_parser.add_argument('old')
+    cmp_parser.add_argument('new')
+    cmp_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        bench = Benchmark(args.scale, args.repeat, args.seed, args.keep_logging)
+        report = bench.run(args.only)
+        out = args.out or f"bench_{report['meta']['commit'] or 'local'}.json"
+        with open(out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {out}")
+        return 0
+
+    old, new = load_json(args.old), load_json(args.new)
+    rows = compare(old, new, args.threshold)
+    print(f"{old['meta'].get('commit')} -> {new['meta'].get('commit')}")
+    for name, metric, before, after, ratio, status in rows:
+        print(f"{name:28s} {metric:8s} {before:12.4f} -> {after:12.4f}  x{ratio:5.2f}  {status}")
+    return 1 if any(row[5] == 'REGRESSION' for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
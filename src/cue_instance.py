@@ -0,0 +1,420 @@
+import math
+from collections import namedtuple
+import Pylogger
+import Pymetrics
+from ast_nodes import InlineCue
+
+logger = Pylogger.get_logger()
+
+# CUE 呼叫時未給的參數使用預設值
+# LIGHT 預設為 ALL，也就是 setting 中宣告的全部燈具
+DEFAULT_PARAMS = {
+    'BPM': '120',
+    'RATE': '1',
+    'LIGHT': 'ALL',
+}
+NUMERIC_PARAMS = {'BPM', 'RATE'}
+
+CHANNEL_TYPES = ('DIMMER', 'COLOR', 'STROBE')
+OTHERS_MODES = ('bypass', 'off', 'full')
+
+# from a to b 的端點常數
+CONSTANTS = {
+    'PI': math.pi,
+    'TAU': math.tau,
+    'E': math.e,
+}
+
+# 綁定後的單一指令
+# block: 所屬區塊 (DIMMER/COLOR/STROBE)
+# start, end: INTERVAL 範圍 (從 1 開始，包含 end)
+# aliases: 解析後的燈具 alias tuple
+# mode: 'value' 或 'func'
+# value: mode 為 value 時的值，mode 為 func 時為函式名稱
+# func: mode 為 func 時的函式
+# domain: mode 為 func 時的 (from, to)
+BoundCommand = namedtuple('BoundCommand', [
+    'block', 'start', 'end', 'aliases', 'channel', 'mode', 'value', 'func', 'domain'
+])
+
+
+class CueInstance:
+    def __init__(self, name, params, interval_count, commands, others, cue=None):
+        self.name = name
+        self.params = params
+        self.bpm = params.get('BPM', float(DEFAULT_PARAMS['BPM']))
+        self.rate = params.get('RATE', float(DEFAULT_PARAMS['RATE']))
+        if self.bpm <= 0 or self.rate <= 0:
+            raise ValueError(f"BPM and RATE must be positive in cue {name}, got BPM={self.bpm}, RATE={self.rate}")
+        # INTERVAL = 1/(BPM*RATE) 分鐘，BPM = 60、RATE = 2 時為八分音符
+        self.interval_sec = 60.0 / (self.bpm * self.rate)
+        self.interval_count = interval_count
+        self.duration = self.interval_sec * interval_count
+        self.commands = commands
+        self.others = others
+        self.cue = cue
+
+    def interval_at(self, t):
+        # 回傳 cue 內相對時間 t 所在的 INTERVAL (從 1 開始)，超出範圍回傳 None
+        if t < 0 or t >= self.duration:
+            return None
+        return int(t / self.interval_sec) + 1
+
+    def __repr__(self):
+        return (f"CueInstance(name={self.name!r}, params={self.params!r}, "
+                f"interval_sec={self.interval_sec:.4f}, intervals={self.interval_count}, "
+                f"commands={len(self.commands)})")
+
+
+class SelectorResolver:
+    def __init__(self, setting):
+        # setting 為 SettingParser.parse 的結果
+        self.groups = {}
+        self.all_aliases = []
+        for fixture in setting.fixtures:
+            self.all_aliases.extend(fixture.aliases)
+        for group in setting.groups:
+            self.groups[group.name] = (tuple(group.aliases), set(group.types))
+        self.all_aliases = tuple(self.all_aliases)
+        self._cache = {}
+
+    def resolve(self, selector):
+        aliases = self._cache.get(selector)
+        if aliases is None:
+            aliases = self._resolve(selector)
+            self._cache[selector] = aliases
+        return aliases
+
+    def _resolve(self, selector):
+        parts = selector.split('.')
+        name = parts[0]
+        if name == 'ALL' and name not in self.groups:
+            aliases, types = self.all_aliases, {'LR', 'OE'}
+        elif name in self.groups:
+            aliases, types = self.groups[name]
+        elif name in self.all_aliases and len(parts) == 1:
+            return (name,)
+        else:
+            logger.error(f"Unknown selector {selector!r}")
+            raise ValueError(f"Unknown selector {selector!r}")
+        for part in parts[1:]:
+            if part in ('L', 'R') and 'LR' not in types:
+                raise ValueError(f"Group {name} is not declared with <LR>, cannot use {selector!r}")
+            if part in ('O', 'E') and 'OE' not in types:
+                raise ValueError(f"Group {name} is not declared with <OE>, cannot use {selector!r}")
+            aliases = select_part(aliases, part, selector)
+        return aliases
+
+
+def select_part(aliases, part, selector=None):
+    # 對燈具陣列取 ALL / L / R / O / E
+    if part == 'ALL':
+        return aliases
+    if part == 'L':
+        return aliases[:len(aliases) // 2]
+    if part == 'R':
+        return aliases[len(aliases) // 2:]
+    if part == 'O':
+        return aliases[0::2]
+    if part == 'E':
+        return aliases[1::2]
+    raise ValueError(f"Unknown light subset {part!r} in {selector or part!r}")
+
+
+def split_domain(args):
+    # func 指令的 'name from a to b' -> (a, b) 的文字，端點可以是由多個 token 組成的運算式；格式不符時回傳 None
+    words = [arg.lower() for arg in args]
+    if len(args) < 5 or words[1] != 'from' or 'to' not in words[3:-1]:
+        return None
+    to = words.index('to', 3)
+    return ' '.join(args[2:to]), ' '.join(args[to + 1:])
+
+
+def parse_command(text):
+    # 將 CueParser 產生的指令字串拆成 (selector, channel, mode, args)
+    # 例如 'LIGHT . L DIMMER func wave1 from 0 to PI'
+    items = text.split()
+    selector_parts = []
+    idx = 0
+    while idx < len(items) and items[idx].upper() not in CHANNEL_TYPES:
+        if items[idx] != '.':
+            selector_parts.append(items[idx])
+        idx += 1
+    if not selector_parts or idx + 2 > len(items):
+        raise ValueError(f"Invalid command {text!r}")
+    channel = items[idx].upper()
+    mode = items[idx + 1].lower()
+    args = items[idx + 2:]
+    return '.'.join(selector_parts), channel, mode, args
+
+
+# 端點運算式只允許數字、常數與 + - * /，例如 PI / 2、2 * PI、-PI
+_ENDPOINT_OPS = {
+    'Add': lambda a, b: a + b,
+    'Sub': lambda a, b: a - b,
+    'Mult': lambda a, b: a * b,
+    'Div': lambda a, b: a / b,
+    'USub': lambda a: -a,
+    'UAdd': lambda a: a,
+}
+_constant_cache = {}
+
+
+def resolve_constant(text):
+    if text in CONSTANTS:
+        return CONSTANTS[text]
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    value = _constant_cache.get(text)
+    if value is None:
+        value = _constant_cache[text] = eval_endpoint(text)
+    return value
+
+
+def eval_endpoint(text):
+    # 綁定時只計算一次，之後以快取取用
+    import ast as pyast
+
+    def evaluate(node):
+        op = _ENDPOINT_OPS.get(type(getattr(node, 'op', None)).__name__)
+        if isinstance(node, pyast.Constant) and isinstance(node.value, (int, float)):
+            return float(node.value)
+        if isinstance(node, pyast.Name) and node.id in CONSTANTS:
+            return CONSTANTS[node.id]
+        if isinstance(node, pyast.BinOp) and op is not None:
+            return op(evaluate(node.left), evaluate(node.right))
+        if isinstance(node, pyast.UnaryOp) and op is not None:
+            return op(evaluate(node.operand))
+        raise ValueError(f"Cannot resolve value {text!r}")
+
+    try:
+        value = evaluate(pyast.parse(text, mode='eval').body)
+    except (SyntaxError, ZeroDivisionError):
+        raise ValueError(f"Cannot resolve value {text!r}")
+    if not math.isfinite(value):
+        raise ValueError(f"Cannot resolve value {text!r}")
+    return value
+
+
+class CueBinder:
+    def __init__(self, resolver, func_lib=None):
+        self.resolver = resolver
+        self.func_lib = func_lib or {}
+        # 兩層快取：原始參數 tuple -> 實例；正規化參數 tuple -> 實例
+        self._raw_cache = {}
+        self._cache = {}
+        # 綁定結果的 hash-consing：內容相同的燈具 tuple、指令與指令串列在所有 cue 之間只保留一份
+        # 同一個 cue 以不同 BPM / RATE 綁定，或兩個內容相同的 cue，會得到同一個指令 tuple
+        self._aliases = {}
+        self._commands = {}
+        self._command_lists = {}
+        self.hits = 0
+        self.misses = 0
+
+    def bind(self, cue, params=None):
+        if isinstance(cue, InlineCue):
+            cue = cue.cue
+        cue_key = cue.name if cue.name is not None else ('<inline>', id(cue))
+        raw_key = (cue_key, tuple(params) if params else ())
+        instance = self._raw_cache.get(raw_key)
+        if instance is not None:
+            self.hits += 1
+            return instance
+
+        bound = self.bind_params(cue.name, cue.params, params or [])
+        key = (cue_key, tuple(bound.items()))
+        instance = self._cache.get(key)
+        if instance is None:
+            self.misses += 1
+            logger.cue_bind(f"Binding cue {cue.name} with params {bound}")
+            t0 = Pymetrics.now()
+            instance = self.build_instance(cue, bound)
+            Pymetrics.record('cue_bind', t0)
+            self._cache[key] = instance
+        else:
+            self.hits += 1
+        self._raw_cache[raw_key] = instance
+        return instance
+
+    def invalidate(self, cue_name=None):
+        # 清除快取，cue_name 為 None 時全部清除
+        if cue_name is None:
+            self._raw_cache.clear()
+            self._cache.clear()
+            self._aliases.clear()
+            self._commands.clear()
+            self._command_lists.clear()
+            return
+        for cache in (self._raw_cache, self._cache):
+            for key in [k for k in cache if k[0] == cue_name]:
+                del cache[key]
+
+    def instances(self):
+        return list({id(instance): instance for instance in self._cache.values()}.values())
+
+    def mark(self):
+        # 快取的複本，hot reload 失敗時以 rollback 還原
+        return [dict(cache) for cache in self.caches()]
+
+    def rollback(self, mark):
+        for cache, saved in zip(self.caches(), mark):
+            cache.clear()
+            cache.update(saved)
+
+    def caches(self):
+        return self._raw_cache, self._cache, self._aliases, self._commands, self._command_lists
+
+    def bind_params(self, cue_name, in_params, params):
+        values = {}
+        positional = True
+        for param in params:
+            if isinstance(param, tuple):
+                positional = False
+                key, value = param
+                if key not in in_params:
+                    raise ValueError(f"Unknown parameter {key!r} for cue {cue_name}, expected one of {in_params}")
+                if key in values:
+                    raise ValueError(f"Parameter {key!r} given more than once for cue {cue_name}")
+                values[key] = value
+            else:
+                if not positional:
+                    raise ValueError(f"Positional parameter {param!r} after keyword parameter in cue {cue_name}")
+                if len(values) >= len(in_params):
+                    raise ValueError(f"Too many parameters for cue {cue_name}, expected {len(in_params)}")
+                values[in_params[len(values)]] = param
+        bound = {}
+        for name in in_params:
+            if name in values:
+                value = values[name]
+            elif name in DEFAULT_PARAMS:
+                value = DEFAULT_PARAMS[name]
+            else:
+                raise ValueError(f"Missing parameter {name!r} for cue {cue_name}")
+            bound[name] = self.normalize_value(cue_name, name, value)
+        return bound
+
+    def normalize_value(self, cue_name, name, value):
+        if isinstance(value, str):
+            value = value.strip('"')
+        if name in NUMERIC_PARAMS:
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"Parameter {name} of cue {cue_name} must be a number, got {value!r}")
+        return value
+
+    def build_instance(self, cue, bound):
+        # 錯誤訊息前加上來源位置，例如 cue_01.tw:12: Unknown selector ...
+        interval_count = cue.interval
+        if interval_count is None:
+            raise ValueError(f"{cue.where()}: Cue {cue.name} does not declare INTERVAL")
+        # FUNC 在解析時不編譯，綁定時才檢查運算式
+        for func in cue.funcs.values():
+            try:
+                func.function
+            except ValueError as e:
+                raise ValueError(f"{func.where(cue.path)}: {e}")
+        # 參數中的燈具陣列，例如 LIGHT=FACE.ALL
+        arrays = {}
+        commands = []
+        for block in CHANNEL_TYPES:
+            for interval in cue.blocks.get(block, ()):
+                start, end = interval.start, interval.end
+                if start < 1 or end < start or end > interval_count:
+                    raise ValueError(f"{interval.where(cue.path)}: {interval.key} out of range in cue {cue.name} "
+                                     f"with INTERVAL {interval_count}")
+                for command in interval.commands:
+                    if not command.text:
+                        continue
+                    try:
+                        bound_command = self.bind_command(cue, block, start, end, command.text, bound, arrays)
+                    except ValueError as e:
+                        raise ValueError(f"{command.where(cue.path)}: {e}")
+                    commands.append(self._commands.setdefault(bound_command, bound_command))
+        others = cue.others or 'bypass'
+        if others not in OTHERS_MODES:
+            raise ValueError(f"{cue.where()}: Unknown OTHERS mode {others!r} in cue {cue.name}")
+        commands = tuple(commands)
+        commands = self._command_lists.setdefault(commands, commands)
+        return CueInstance(cue.name, bound, interval_count, commands, others, cue)
+
+    def bind_command(self, cue, block, start, end, text, bound, arrays):
+        selector, channel, mode, args = parse_command(text)
+        aliases = self.resolve_selector(selector, bound, arrays)
+        aliases = self._aliases.setdefault(aliases, aliases)
+        if mode == 'value':
+            if len(args) != 1:
+                raise ValueError(f"Expected one value in command {text!r} of cue {cue.name}")
+            value = args[0].strip('"')
+            if channel != 'COLOR':
+                value = resolve_constant(value)
+            return BoundCommand(block, start, end, aliases, channel, mode, value, None, None)
+        if mode == 'func':
+            fname = args[0] if args else None
+            local = cue.funcs.get(fname)
+            func = local.function if local is not None else self.func_lib.get(fname)
+            if func is None:
+                raise ValueError(f"Undefined FUNC {fname!r} in command {text!r} of cue {cue.name}")
+            domain = (0.0, 1.0)
+            endpoints = split_domain(args)
+            if endpoints is not None:
+                domain = (resolve_constant(endpoints[0]), resolve_constant(endpoints[1]))
+            elif len(args) != 1:
+                raise ValueError(f"Invalid func arguments in command {text!r} of cue {cue.name}")
+            return BoundCommand(block, start, end, aliases, channel, mode, fname, func, domain)
+        raise ValueError(f"Unknown command mode {mode!r} in command {text!r} of cue {cue.name}")
+
+    def resolve_selector(self, selector, bound, arrays):
+        parts = selector.split('.')
+        name = parts[0]
+        if name not in bound:
+            return self.resolver.resolve(selector)
+        aliases = arrays.get(name)
+        if aliases is None:
+            aliases = self.resolver.resolve(bound[name])
+            arrays[name] = aliases
+        for part in parts[1:]:
+            aliases = select_part(aliases, part, selector)
+        return aliases
+
+
+if __name__ == "__main__":
+    import pprint
+    from lexer import Lexer
+    from cue_parser import CueParser
+
+    cue_text = '''
+CUE cross_back_01 START
+    IN BPM, RATE, LIGHT
+    FUNC wave2(x) = 1-sin(x)
+    INTERVAL 4
+    DIMMER{
+        INTERVAL[1-4]{
+            LIGHT.L DIMMER func wave2 from 0 to PI
+            LIGHT.R DIMMER func wave2 from 0 to PI
+        }
+    }
+    COLOR{
+        INTERVAL[1]{
+            LIGHT.L COLOR value "red_a"
+        }
+        INTERVAL[3-4]{
+            LIGHT.ALL COLOR value "green_a"
+        }
+    }
+    OTHERS{bypass}
+CUE END
+'''
+    from ast_nodes import Setting, Fixture, Group
+    setting = Setting(fixtures=[Fixture('PAR_4W54', 8, list('ABCDEFGH'))], groups=[Group('FACE', ['LR'], ['A', 'B'])])
+    cue_ast = CueParser(list(Lexer(cue_text).generate_tokens())).parse()
+    binder = CueBinder(SelectorResolver(setting))
+    params = ['120', ('RATE', '2'), ('LIGHT', 'FACE.ALL')]
+    instance = binder.bind(cue_ast, params)
+    print(instance)
+    pprint.pprint(instance.commands)
+    assert binder.bind(cue_ast, params) is instance
+    assert binder.bind(cue_ast, ['120.0', ('RATE', '2'), ('LIGHT', 'FACE.ALL')]) is instance
+    print(f"hits={binder.hits}, misses={binder.misses}")
@@ -1,262 +1,260 @@
 from collections import namedtuple
-import sympy as sp
 import Pylogger
+import Pymetrics
+from ast_nodes import Cue, Func, Interval, Command
+from parser_core import (ParserCore, TOKEN_IDS, T_EOF, T_ID, T_OP, T_LBRACE, T_RBRACE, T_LSQUARE, T_RSQUARE,
+                         T_LPAREN, T_RPAREN, T_COMMA, T_NUMBER, T_NEWLINE, T_CUE, T_IN, T_FUNC, T_INTERVAL,
+                         T_DIMMER, T_COLOR, T_STROBE, T_OTHERS, T_START, T_END)
 
 logger = Pylogger.get_logger()
-Pylogger.logger_enable()  # 啟用日誌記錄
 logger_showtoken = False  # 是否顯示 Token 日誌
 enable_lexer_log = True  # 啟用 Lexer 日誌記錄
 
-if not enable_lexer_log:
-    logger.setLevel(Pylogger.Levels['CUE_PARSER'])  # 如果不啟用 Lexer 日誌，則設定為 PARSER 級別
-else:
-    logger.setLevel(Pylogger.Levels['LEXER'])  # 啟用 Lexer 日誌記錄
-
 # Token 定義
 Token = namedtuple('Token', ['type', 'value', 'line', 'column'])
+# FUNC 運算式可以使用的 sympy 函式與常數；sympy 匯入很慢，第一次編譯 FUNC 時才匯入
+ALLOWED_FUNCS = ('sin', 'cos', 'pi', 'tan', 'exp', 'sqrt', 'Abs', 'log', 'Max', 'Min')
+# 相同的 (變數, 運算式) 只以 sympy 編譯一次，所有 cue 與 func_lib 共用同一個函式
+_funcs = {}
 
-class CueParser:
-    def __init__(self, tokens):
-        self.tokens = tokens
-        self.pos = 0
 
-    def current_token(self):
-        if self.pos < len(self.tokens):
-            return self.tokens[self.pos]
-        return None
+def build_func(arg, expr_str):
+    func = _funcs.get((arg, expr_str))
+    if func is None:
+        func = _funcs[(arg, expr_str)] = compile_func(arg, expr_str)
+    return func
 
-    def consume(self, expected_type=None, expected_value=None):
-        token = self.current_token()
-        if token.type == 'NEWLINE':
-            logger.cue_cons(f"\t\t\t Consume ('NEWLINE','\\n') at pos {self.pos}")
-        else:
-            logger.cue_cons(f"\t\t\t Consume ('{token.type}','{token.value}') at pos {self.pos}")
-        if not token:
-            logger.error(f"Unexpected end of input at pos {self.pos}")
-            raise ValueError("Unexpected end of input")
-        if expected_type and token.type != expected_type:
-            logger.error(f"Expected {expected_type} but got {token.type} at line {token.line}, column {token.column}")
-            raise ValueError(f"Expected {expected_type} but got {token.type} at line {token.line}")
-        if expected_value and token.value != expected_value:
-            logger.error(f"Expected {expected_value} but got {token.value} at line {token.line}")
-            raise ValueError(f"Expected {expected_value} but got {token.value} at line {token.line}")
-        self.pos += 1
-        return token
+
+def compile_func(arg, expr_str):
+    import sympy as sp
+    logger.info(f"Building function with sympy: '{expr_str}'")
+    t0 = Pymetrics.now()
+    x = sp.symbols(arg)
+    try:
+        expr = sp.sympify(expr_str, locals={name: getattr(sp, name) for name in ALLOWED_FUNCS})
+    except sp.SympifyError as e:
+        raise ValueError(f"Failed to parse expression '{expr_str}': {e}")
+    func = sp.lambdify(x, expr, modules=["math"])
+    Pymetrics.record('func_compile', t0)
+    logger.info(f"Function '{expr_str}' built successfully")
+    return func
+
+
+class CueParser(ParserCore):
+    trace_level = 'CUE_CONS'
 
     def parse(self, inline=False):
         logger.info(f"Starting parse with inline={inline}")
-        self.consume('CUE')
+        start = self.pos
+        self.consume(T_CUE)
         if inline:
             # 僅解析區塊，無 cue_name、無 START
             logger.debug("Parsing inline 'CUE' block")
-            self.consume('LBRACE')
-            body = self.parse_block(inline=True)
-            self.consume('RBRACE')
-            self.consume('CUE')
-            self.consume('END')
+            self.consume(T_LBRACE)
+            cue = Cue(None)
+            self.parse_block(cue, inline=True)
+            self.consume(T_RBRACE)
+            self.consume(T_CUE)
+            self.consume(T_END)
             logger.info("End of inline 'CUE' block")
-            return {'CUE': {'name': None, 'body': body}}
         else:
             # 正常解析帶名稱與 START 的 Cue
             logger.debug("Parsing full 'CUE' block")
-            cue_name = self.consume('ID').value
-            logger.info(f"Parsing CUE with name: {cue_name}")
-            self.consume('START')
-            body = self.parse_block()
-            self.consume('CUE')
-            self.consume('END')
+            cue = Cue(self.consume(T_ID).value)
+            logger.info(f"Parsing CUE with name: {cue.name}")
+            self.consume(T_START)
+            self.parse_block(cue)
+            self.consume(T_CUE)
+            self.consume(T_END)
             logger.info("End of 'CUE' block")
-            return {'CUE': {'name': cue_name, 'body': body}}
+        cue.line, cue.column, cue.end_line = self.span(start)
+        return cue
 
-    def parse_block(self,inline=False):
-        result = {}
+    def parse_block(self, cue, inline=False):
+        types = self.types
+        handlers = self.BLOCK_HANDLERS
         while True:
-            token = self.current_token()
-            if token is None:
+            tid = types[self.pos]
+            if tid == T_EOF:
                 break
             # CUE end 是區塊結束標誌
-            if inline and token.type == 'RBRACE':
+            if inline and tid == T_RBRACE:
                 logger.debug("Detect 'RBRACE' and end inline CUE block")
                 break
             # 如果是 CUE 區塊結束，則跳出迴圈
-            if token.type == 'CUE':
-                next_token = self.tokens[self.pos + 1] if self.pos + 1 < len(self.tokens) else None
-                if next_token and next_token.type == 'END':
-                    logger.debug("Detect 'CUE' 'END' and end 'CUE' block")
-                    break
-            if token.type == 'IN':
-                result['IN'] = self.parse_in()
-            elif token.type == 'FUNC':
-                if 'FUNC' not in result:
-                    result['FUNC'] = {}
-                result['FUNC'].update(self.parse_func())
-            elif token.type == 'INTERVAL':
-                result['INTERVAL'] = self.parse_interval()
-            elif token.type in ('DIMMER', 'COLOR', 'STROBE', 'OTHERS'):
-                result[token.type] = self.parse_command_block(token.type)
-            elif token.type == 'NEWLINE':
-                logger.debug("Skipping 'NEWLINE' token")
-                self.consume('NEWLINE')
-            else:
-                logger.error(f"Unexpected token {token.type} at line {token.line}")
-                raise ValueError(f"Unexpected token {token.type} at line {token.line}")
-        return result
+            if tid == T_CUE and types[self.pos + 1] == T_END:
+                logger.debug("Detect 'CUE' 'END' and end 'CUE' block")
+                break
+            start = self.pos
+            try:
+                handler = handlers.get(tid)
+                if handler is None:
+                    raise self.unexpected(self.tokens[start])
+                handler(self, cue)
+            except ValueError as e:
+                if self.errors is None:
+                    raise
+                self.recover(e, start, BLOCK_STARTS)
+        return cue
+
+    def block_in(self, cue):
+        cue.params = self.parse_in()
+
+    def block_func(self, cue):
+        func = self.parse_func()
+        cue.funcs[func.name] = func
+
+    def block_interval(self, cue):
+        cue.interval = self.parse_interval()
+
+    def block_command(self, cue):
+        block_type = self.tokens[self.pos].type
+        intervals, mode = self.parse_command_block(block_type)
+        if intervals:
+            cue.blocks.setdefault(block_type, []).extend(intervals)
+        if mode is not None:
+            cue.others = mode
+
+    def block_newline(self, cue):
+        self.pos += 1
 
     def parse_in(self):
         logger.info("Parsing 'IN' block")
-        self.consume('IN')
-        params = []
-        while True:
-            token = self.consume('ID')
-            params.append(token.value)
-            if self.current_token() and self.current_token().type == 'COMMA':
-                self.consume('COMMA')
-            else:
-                break
-        logger.debug(f"IN params: {params}")
+        self.consume(T_IN)
+        params = self.comma_list(T_ID)
+        logger.debug("IN params: %s", params)
         logger.info("End of 'IN' block")
         return params
 
     def parse_func(self):
         logger.info("Parsing 'FUNC' block")
-        self.consume('FUNC')
-        func_name = self.consume('ID').value
-        logger.debug(f"Function name: {func_name}")
-        self.consume('LPAREN')
-        arg = self.consume('ID').value
-        logger.debug(f"Function argument: {arg}")
-        self.consume('RPAREN')
-        self.consume('OP', '=')
-        expr_tokens = []
+        start = self.pos
+        self.consume(T_FUNC)
+        func_name = self.consume(T_ID).value
+        self.consume(T_LPAREN)
+        arg = self.consume(T_ID).value
+        self.consume(T_RPAREN)
+        self.consume(T_OP, '=')
         # 收集等號後直到換行或區塊開始的 tokens 為函式表達式
-        while True:
-            token = self.current_token()
-            if token is None or token.type in ('NEWLINE', 'DIMMER', 'COLOR', 'STROBE', 'OTHERS', 'IN', 'INTERVAL', 'CUE', 'FUNC'):
-                logger.debug(f"Get token ('{token.type}','{token.value}')end function block")
-                break
-            expr_tokens.append(token.value)
-            self.pos += 1
-        expr_str = ''.join(expr_tokens)
-        logger.debug(f"Function expression: '{expr_str}'")
-        func = self.build_func_with_sympy(arg, expr_str)
+        types = self.types
+        expr_start = pos = self.pos
+        while types[pos] not in FUNC_END:
+            pos += 1
+        self.pos = pos
+        expr_str = ''.join(token.value for token in self.tokens[expr_start:pos])
+        logger.debug("Function %s(%s) expression: '%s'", func_name, arg, expr_str)
+        # 函式在第一次使用 func.function 時才以 sympy 編譯，單純解析不需要匯入 sympy
+        func = Func(func_name, arg, expr_str, *self.span(start))
         logger.info(f"Function '{func_name}' parsed successfully")
-        return {func_name: func}
+        return func
 
     def build_func_with_sympy(self, arg, expr_str):
-        logger.info(f"Building function with sympy: '{expr_str}'")
-        x = sp.symbols(arg)
-        allowed_funcs = {
-            'sin': sp.sin,
-            'cos': sp.cos,
-            'pi': sp.pi,
-            'tan': sp.tan,
-            'exp': sp.exp,
-            'sqrt': sp.sqrt,
-            'Abs': sp.Abs,
-            'log': sp.log,
-            'Max': sp.Max,
-            'Min': sp.Min,
-        }
-        try:
-            expr = sp.sympify(expr_str, locals=allowed_funcs)
-        except sp.SympifyError as e:
-            raise ValueError(f"Failed to parse expression '{expr_str}': {e}")
-        func = sp.lambdify(x, expr, modules=["math"])
-        logger.info(f"Function '{expr_str}' built successfully")
-        return func
+        return build_func(arg, expr_str)
 
     def parse_interval(self):
-        self.consume('INTERVAL')
-        logger.info("Parsing 'INTERVAL' block")
-        number = int(self.consume('NUMBER').value)
-        logger.debug(f"Interval number: {number}")
-        logger.info("End of 'INTERVAL' block")
+        self.consume(T_INTERVAL)
+        number = self.parse_int()
+        logger.debug("Interval number: %d", number)
         return number
 
+    def parse_int(self):
+        token = self.consume(T_NUMBER)
+        if not token.value.isdigit():
+            raise self.expected_error('an integer', token, token.value)
+        return int(token.value)
+
     def parse_command_block(self, block_type):
+        # 回傳 (Interval 串列, OTHERS 的模式)
         logger.info(f"Parsing '{block_type}' block")
-        self.consume(block_type)
-        self.consume('LBRACE')
-
-        block_content = {}
+        self.consume(TOKEN_IDS[block_type])
+        self.consume(T_LBRACE)
 
+        intervals = []
+        mode = None
+        types = self.types
         while True:
-            token = self.current_token()
-            if token is None:
-                logger.error(f"Unexpected end of input inside {block_type} block")
-                raise ValueError(f"Unexpected end of input inside {block_type} block")
-            if token.type == 'RBRACE':
-                self.consume('RBRACE')
+            tid = types[self.pos]
+            if tid == T_RBRACE:
+                self.pos += 1
                 break
-            elif token.type == 'NEWLINE':
-                self.consume('NEWLINE')  # 跳過換行
-                continue
-            elif token.type == 'INTERVAL':
-                interval_key, cmds = self.parse_interval_block()
-                logger.debug(f"Parsed interval block {interval_key} with cmds {cmds}")
-                block_content[interval_key] = cmds
-            elif block_type == 'OTHERS' and token.type == 'ID':
-                cmd = self.parse_command_line()  # 會得到 ('cmd', 'bypass') 這樣的元組
-                logger.debug(f"Add OTHERS command: {cmd}")
-                # 將狀態字串直接取出，並存在 block_content['OTHERS']，不必用列表
-                # 因為 OTHERS 區塊通常只會有一種狀態
-                block_content[block_type] = cmd[1]  # 取元組中的字串部分
+            elif tid == T_NEWLINE:
+                self.pos += 1  # 跳過換行
+            elif tid == T_INTERVAL:
+                intervals.append(self.parse_interval_block())
+            elif block_type == 'OTHERS' and tid == T_ID:
+                # OTHERS 區塊通常只會有一種狀態，直接存字串
+                mode = self.parse_command_line().text
                 break
+            elif tid == T_EOF:
+                raise self.unexpected(None, f" inside {block_type} block")
             else:
-                logger.error(f"Unexpected token {token.type} inside {block_type} block at line {token.line}")
-                raise ValueError(f"Unexpected token {token.type} inside {block_type} block at line {token.line}")
+                raise self.unexpected(self.tokens[self.pos], f" inside {block_type} block")
 
-        logger.info(f"End of '{block_type}' block with content: {block_content}")
-        return block_content
+        logger.debug("End of '%s' block with content: %s", block_type, intervals)
+        return intervals, mode
 
     def parse_interval_block(self):
-        logger.info("Parsing 'INTERVAL[...]' block")
-        self.consume('INTERVAL')
-        self.consume('LSQUARE')
-        start = self.consume('NUMBER').value
+        block_start = self.pos
+        self.consume(T_INTERVAL)
+        self.consume(T_LSQUARE)
+        start = self.parse_int()
         end = start
-        if self.current_token() and self.current_token().type == 'OP' and self.current_token().value == '-':
-            self.consume('OP')
-            end = self.consume('NUMBER').value
-            logger.debug(f"Interval range: {start}-{end}")
-        self.consume('RSQUARE')
-        self.consume('LBRACE')
+        if self.accept(T_OP, '-'):
+            end = self.parse_int()
+        self.consume(T_RSQUARE)
+        self.consume(T_LBRACE)
         cmds = []
+        types = self.types
         while True:
-            token = self.current_token()
-            if token is None:
-                logger.error("Unexpected end of input inside interval block")
-                raise ValueError("Unexpected end of input inside interval block")
-            if token.type == 'RBRACE':
-                self.consume('RBRACE')
+            tid = types[self.pos]
+            if tid == T_RBRACE:
+                self.pos += 1
                 break
-            parsed_cmd = self.parse_command_line()
-            cmds.append(parsed_cmd)
-            logger.debug(f"Add command: {parsed_cmd}")
-        logger.info(f"End of 'INTERVAL[{start}-{end}]' block with commands: {cmds}")
-        return f"INTERVAL[{start}-{end}]", cmds
+            if tid == T_EOF:
+                raise self.unexpected(None, " inside interval block")
+            cmds.append(self.parse_command_line())
+        logger.debug("End of 'INTERVAL[%s-%s]' block with commands: %s", start, end, cmds)
+        return Interval(start, end, cmds, *self.span(block_start))
 
     def parse_command_line(self):
-        logger.info("Parsing command line")
+        types = self.types
+        tokens = self.tokens
         items = []
+        start = pos = self.pos
         while True:
-            token = self.current_token()
-            if token is None or token.type in ('NEWLINE', 'RBRACE'):
-                # 如果是換行或區塊結束，則結束該指令
-                logger.debug(f"End of command line with token: {token}")
-                self.consume(token.type) if token else None
+            tid = types[pos]
+            if tid in COMMAND_END:
+                # 換行或區塊結束時吃掉該 token 並結束指令
+                if tid != T_EOF:
+                    pos += 1
                 break
-            if token.type == 'COMMA':
-                self.consume('COMMA')  # 忽略逗號
-                continue
-            items.append(self.consume().value)
-        # 將指令拆成 key-value 或原始字串
-        # 這裡簡單回傳該行字串，也可進一步解析
-        logger.debug(f"Command line items: {items}")
-        return ('cmd', ' '.join(items))
+            if tid != T_COMMA:  # 忽略逗號
+                items.append(tokens[pos].value)
+            pos += 1
+        self.pos = pos
+        token = tokens[min(start, len(tokens) - 1)]
+        return Command(' '.join(items), token.line, token.column)
+
+
+CueParser.BLOCK_HANDLERS = {
+    T_IN: CueParser.block_in,
+    T_FUNC: CueParser.block_func,
+    T_INTERVAL: CueParser.block_interval,
+    T_DIMMER: CueParser.block_command,
+    T_COLOR: CueParser.block_command,
+    T_STROBE: CueParser.block_command,
+    T_OTHERS: CueParser.block_command,
+    T_NEWLINE: CueParser.block_newline,
+}
+# 錯誤恢復時可重新開始解析的敘述
+BLOCK_STARTS = frozenset((T_IN, T_FUNC, T_INTERVAL, T_DIMMER, T_COLOR, T_STROBE, T_OTHERS))
+FUNC_END = frozenset((T_EOF, T_NEWLINE, T_DIMMER, T_COLOR, T_STROBE, T_OTHERS, T_IN, T_INTERVAL, T_CUE, T_FUNC))
+COMMAND_END = frozenset((T_EOF, T_NEWLINE, T_RBRACE))
 
 
 if __name__ == "__main__":
+    # 啟用日誌記錄
+    Pylogger.logger_enable(level=Pylogger.Levels['LEXER' if enable_lexer_log else 'CUE_PARSER'])
     sample_text = """
    CUE cross_back_01 START
     IN BPM, RATE, LIGHT
@@ -312,8 +310,6 @@ CUE END
 
 
     # 示範呼叫解析後的函式
-    if 'FUNC' in result['CUE']['body']:
-        funcs = result['CUE']['body']['FUNC']
-        for fname, f in funcs.items():
-            print(f"{fname}(0) =", f(0))
-            print(f"{fname}(pi/2) =", f(3.1415/2))
\ No newline at end of file
+    for fname, f in result.funcs.items():
+        print(f"{fname}(0) =", f.function(0))
+        print(f"{fname}(pi/2) =", f.function(3.1415/2))
\ No newline at end of file
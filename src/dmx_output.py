@@ -0,0 +1,102 @@
+import time
+import socket
+import struct
+from frame_file import UNIVERSE_SIZE
+import Pylogger
+
+logger = Pylogger.get_logger()
+
+ARTNET_PORT = 6454
+ARTNET_HEADER = b'Art-Net\x00'
+ARTNET_OP_DMX = 0x5000
+ARTNET_PROTOCOL = 14
+# 沒有改變的 universe 至少每隔這個秒數重送一次，避免接收端判定訊號中斷
+ARTNET_REFRESH = 1.0
+
+
+class OutputDriver:
+    # 所有輸出裝置的基底類別，frame 為所有 universe 串接的 bytes-like
+    # dirty 為每個 universe 是否與上一個 frame 不同 (FrameRenderer.dirty_universes)，None 表示全部視為改變
+    def __init__(self, universes):
+        self.universes = list(universes)
+        self.frame_size = UNIVERSE_SIZE * len(self.universes)
+        self.frames_sent = 0
+
+    def send(self, frame, timestamp=None, dirty=None):
+        self.frames_sent += 1
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class NullOutput(OutputDriver):
+    def __init__(self, universes, keep_last=False):
+        super().__init__(universes)
+        self.keep_last = keep_last
+        self.last_frame = None
+
+    def send(self, frame, timestamp=None, dirty=None):
+        if self.keep_last:
+            self.last_frame = bytes(frame)
+        self.frames_sent += 1
+
+
+class ArtNetOutput(OutputDriver):
+    def __init__(self, universes, host='255.255.255.255', port=ARTNET_PORT, universe_ids=None,
+                 refresh=ARTNET_REFRESH):
+        super().__init__(universes)
+        # 只送出有改變的 universe，其餘每 refresh 秒重送一次；refresh 為 0 時每個 frame 都送出全部
+        self.refresh = refresh
+        self.packets_sent = 0
+        self._last_sent = [0.0] * len(self.universes)
+        # universe_ids 為每個 universe 的 Art-Net port address，預設依序為 0, 1, 2...
+        self.universe_ids = list(universe_ids) if universe_ids else list(range(len(self.universes)))
+        self.address = (host, port)
+        self.sequence = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self._headers = [
+            ARTNET_HEADER + struct.pack('<H', ARTNET_OP_DMX) + struct.pack('>H', ARTNET_PROTOCOL)
+            for _ in self.universe_ids
+        ]
+
+    def send(self, frame, timestamp=None, dirty=None):
+        self.sequence = self.sequence % 255 + 1
+        view = memoryview(frame)
+        now = time.monotonic()
+        for i, universe_id in enumerate(self.universe_ids):
+            if self.refresh and dirty is not None and not dirty[i] and now - self._last_sent[i] < self.refresh:
+                continue
+            self._last_sent[i] = now
+            self.packets_sent += 1
+            packet = (self._headers[i] + struct.pack('<BBH', self.sequence, 0, universe_id)
+                      + struct.pack('>H', UNIVERSE_SIZE) + view[i * UNIVERSE_SIZE:(i + 1) * UNIVERSE_SIZE])
+            self.sock.sendto(packet, self.address)
+        self.frames_sent += 1
+
+    def close(self):
+        self.sock.close()
+
+
+class RecordingOutput(OutputDriver):
+    # 包裝其他輸出裝置，送出的同時交給 FrameRecorder 記錄
+    def __init__(self, driver, recorder):
+        super().__init__(driver.universes)
+        self.driver = driver
+        self.recorder = recorder
+
+    def send(self, frame, timestamp=None, dirty=None):
+        self.driver.send(frame, timestamp, dirty)
+        # 以實際送出的時間記錄，重播時能重現當下的時序
+        self.recorder.submit(frame)
+        self.frames_sent += 1
+
+    def close(self):
+        self.driver.close()
+        self.recorder.close()
@@ -0,0 +1,103 @@
+import numpy as np
+from show_ir import CHANNEL_KINDS, NO_UNIVERSE
+from frame_file import UNIVERSE_SIZE
+import Pylogger
+
+logger = Pylogger.get_logger()
+
+# 燈具屬性，順序與 CHANNEL_KINDS 去掉 'other' 相同，值域皆為 0~255
+ATTRS = CHANNEL_KINDS[1:]
+A_DIMMER = ATTRS.index('dimmer')
+A_R = ATTRS.index('r')
+A_WHITE = ATTRS.index('white')
+A_STROBE = ATTRS.index('strobe')
+
+
+class FixtureKernel:
+    # 一種燈具類型的通道配置，每種類型只建立一次
+    # offsets 為有對應屬性的通道在燈具內的位置，attrs 為該通道讀取的屬性，輸出值為 min + 屬性值 * scale
+    # capabilities 為這種燈具能輸出的屬性，例如 FOG 只有 dimmer，COB 的顏色只有 amber 與 white
+    def __init__(self, ir, type_id):
+        ch0 = ir.type_channel_offset[type_id]
+        self.name = ir.type_alias[type_id]
+        self.width = ir.type_channel_count[type_id]
+        kinds = [ir.ch_kind[ch0 + c] for c in range(self.width)]
+        present = [c for c, kind in enumerate(kinds) if kind]
+        self.offsets = np.array(present, dtype=np.intp)
+        self.attrs = np.array([kinds[c] - 1 for c in present], dtype=np.intp)
+        self.min = np.array([ir.ch_min[ch0 + c] for c in present], dtype=np.float32)
+        self.scale = np.array([ir.ch_max[ch0 + c] - ir.ch_min[ch0 + c] for c in present], dtype=np.float32) / 255.0
+        self.capabilities = np.zeros(len(ATTRS), dtype=bool)
+        self.capabilities[self.attrs] = True
+
+    def compile(self, fixtures, bases):
+        # 這種類型的所有燈具一次展開：回傳每個輸出通道的 (frame 位置, 屬性索引, min, scale)
+        # fixtures 為燈具 id，bases 為各燈具第一個通道在 frame 中的位置
+        index = (bases[:, None] + self.offsets).ravel()
+        keys = (fixtures[:, None] * len(ATTRS) + self.attrs).ravel()
+        return index, keys, np.tile(self.min, len(fixtures)), np.tile(self.scale, len(fixtures))
+
+    def __repr__(self):
+        names = [ATTRS[a] for a in np.flatnonzero(self.capabilities)]
+        return f"FixtureKernel({self.name!r}, {self.width} channels, {names})"
+
+
+class RigKernel:
+    # 將所有燈具類型的 kernel 合併成一個，依 (燈具, 屬性) 排序
+    # 不論燈具類型如何混合，整個 frame 都以一次 gather / 縮放 / scatter 算出
+    # slot_start[key]:slot_start[key + 1] 為屬性 key (燈具 * len(ATTRS) + 屬性) 對應的輸出通道
+    def __init__(self, ir):
+        self.types = [FixtureKernel(ir, t) for t in range(len(ir.type_alias))]
+        fix_type = np.frombuffer(ir.fix_type, dtype=np.uint16).astype(np.intp)
+        universe = np.frombuffer(ir.fix_universe, dtype=np.uint16).astype(np.intp)
+        address = np.frombuffer(ir.fix_address, dtype=np.uint16).astype(np.intp)
+        patched = universe != NO_UNIVERSE
+        widths = np.array([kernel.width for kernel in self.types], dtype=np.intp)[fix_type]
+        bad = np.flatnonzero(patched & ((address < 1) | (address - 1 + widths > UNIVERSE_SIZE)))
+        if bad.size:
+            fix = int(bad[0])
+            raise ValueError(f"Fixture {ir.fix_alias[fix]} at address {ir.fix_address[fix]} "
+                             f"with {widths[fix]} channels does not fit in a universe")
+        bases = universe * UNIVERSE_SIZE + address - 1
+        blocks = []
+        for t, kernel in enumerate(self.types):
+            fixtures = np.flatnonzero(patched & (fix_type == t))
+            if fixtures.size and kernel.offsets.size:
+                blocks.append(kernel.compile(fixtures, bases[fixtures]))
+        if blocks:
+            index, keys, mins, scale = (np.concatenate(column) for column in zip(*blocks))
+        else:
+            index = keys = np.zeros(0, dtype=np.intp)
+            mins = scale = np.zeros(0, dtype=np.float32)
+        order = np.argsort(keys, kind='stable')
+        self.index = index[order]
+        self.key = keys[order]
+        self.min = mins[order]
+        self.scale = scale[order]
+        size = len(ir.fix_alias) * len(ATTRS)
+        self.slot_start = np.zeros(size + 1, dtype=np.intp)
+        np.cumsum(np.bincount(keys, minlength=size), out=self.slot_start[1:])
+        logger.info(f"Fixture kernels: {self.types}, {len(self.index)} output channels")
+
+    def output_keys(self, keys):
+        # 只保留有輸出通道的屬性，燈具沒有的屬性 (例如 FOG 的顏色) 與沒有 patch 的燈具不需要寫入
+        return keys[self.slot_start[keys + 1] > self.slot_start[keys]]
+
+    def slots(self, keys):
+        # 屬性 key -> 輸出通道的位置
+        starts = self.slot_start[keys]
+        counts = self.slot_start[keys + 1] - starts
+        if counts.min(initial=1) == 1 and counts.max(initial=1) == 1:
+            return starts
+        starts, counts = starts[counts > 0], counts[counts > 0]
+        first = np.repeat(np.cumsum(counts) - counts, counts)
+        return np.repeat(starts, counts) + np.arange(first.size) - first
+
+    def write(self, values, frame, slots=slice(None)):
+        # values 為攤平的屬性值 (0~255)，重算 slots 的輸出通道並寫入 frame，回傳值有改變的通道
+        # 屬性值在寫入時已限制在 0~255，輸出一定落在通道的 min~max 之間
+        index = self.index[slots]
+        new = np.rint(self.min[slots] + values[self.key[slots]] * self.scale[slots]).astype(np.uint8)
+        changed = index[new != frame[index]]
+        frame[index] = new
+        return changed
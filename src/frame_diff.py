@@ -0,0 +1,234 @@
+import os
+import sys
+import time
+import numpy as np
+from frame_file import FrameFileReader, UNIVERSE_SIZE
+from show_ir import CHANNEL_KINDS, NO_UNIVERSE
+import Pylogger
+
+logger = Pylogger.get_logger()
+
+# 比較兩個 frame 串流 (.twf 錄製或由 show 算出)，確認最佳化前後的輸出完全相同
+# 兩個檔案的 chunk 範圍與 codec 相同時先比較未解碼的資料，相同就跳過整個 chunk，
+# 不同的 chunk 才解碼成 (frame, 通道) 陣列一次比較
+SHOW_EXTS = ('.tw', '.twc')
+DEFAULT_TOP = 20
+
+
+class FrameDiff:
+    # 比較結果；max_error / changed_frames 為每個通道的最大差值與不同的 frame 數
+    def __init__(self, path_a, path_b, a, b):
+        self.paths = (path_a, path_b)
+        self.frame_counts = (a.frame_count, b.frame_count)
+        self.universes = list(a.universes)
+        self.fps = a.fps
+        self.compared = min(a.frame_count, b.frame_count)
+        self.first = None
+        self.first_time = None
+        self.differing_frames = 0
+        self.max_error = np.zeros(a.frame_size, dtype=np.uint8)
+        self.changed_frames = np.zeros(a.frame_size, dtype=np.int64)
+        self.chunks = 0
+        self.skipped_chunks = 0
+        self.elapsed = 0.0
+
+    def add(self, reader, first, rows, max_error, changed_frames):
+        # 依 frame 順序加入一段 diff_chunk 的結果
+        if self.first is None:
+            self.first = first + int(rows[0])
+            self.first_time = reader.timestamp(self.first)
+        self.differing_frames += rows.size
+        np.maximum(self.max_error, max_error, out=self.max_error)
+        self.changed_frames += changed_frames
+
+    @property
+    def identical(self):
+        return self.differing_frames == 0 and self.frame_counts[0] == self.frame_counts[1]
+
+    def channels(self):
+        # 有差異的通道，差值大的在前
+        changed = np.flatnonzero(self.max_error)
+        return changed[np.argsort(-self.max_error[changed].astype(np.int16), kind='stable')]
+
+    def fixtures(self, ir):
+        # 依燈具彙整：[(alias, 最大差值, 不同的 frame 數, [(通道, 燈具內第幾個通道, 種類)])]，差值大的在前
+        owner, offset, kind = channel_map(ir, self.universes)
+        summary = {}
+        for channel in self.channels().tolist():
+            fix = int(owner[channel])
+            entry = summary.setdefault(fix, [ir.fix_alias[fix] if fix >= 0 else None, 0, 0, []])
+            entry[1] = max(entry[1], int(self.max_error[channel]))
+            entry[2] = max(entry[2], int(self.changed_frames[channel]))
+            entry[3].append((channel, int(offset[channel]) + 1, kind[channel]))
+        return sorted((tuple(entry) for entry in summary.values()), key=lambda entry: -entry[1])
+
+    def channel_name(self, channel):
+        return f"{self.universes[channel // UNIVERSE_SIZE]}:{channel % UNIVERSE_SIZE + 1}"
+
+    def report(self, ir=None, top=DEFAULT_TOP):
+        a, b = self.paths
+        lines = [f"{a} vs {b}: {self.compared} frames compared in {self.elapsed:.2f}s "
+                 f"({self.skipped_chunks}/{self.chunks} chunks identical without decoding)"]
+        if self.frame_counts[0] != self.frame_counts[1]:
+            lines.append(f"frame counts differ: {self.frame_counts[0]} vs {self.frame_counts[1]}")
+        if not self.differing_frames:
+            lines.append("no differences" if self.identical else "no differences in the common frames")
+            return lines
+        at = f" ({self.first_time:.3f}s)" if self.first_time is not None else ''
+        channels = self.channels()
+        lines.append(f"{self.differing_frames} frames differ, first at frame {self.first}{at}; "
+                     f"{len(channels)} channels, max error {int(self.max_error.max())}")
+        if ir is None:
+            for channel in channels[:top].tolist():
+                lines.append(f"  {self.channel_name(channel):10s} max error {int(self.max_error[channel]):3d} "
+                             f"in {int(self.changed_frames[channel])} frames")
+        else:
+            fixtures = self.fixtures(ir)
+            lines.append(f"{len(fixtures)} fixtures affected:")
+            for alias, error, frames, fixture_channels in fixtures[:top]:
+                names = ', '.join(f"{self.channel_name(channel)} ch{number} {kind}"
+                                  for channel, number, kind in fixture_channels)
+                lines.append(f"  {alias or '(unpatched)':12s} max error {error:3d} in {frames} frames: {names}")
+        if len(channels) > top:
+            lines.append(f"  ... {len(channels) - top} more channels")
+        return lines
+
+
+def channel_map(ir, universes):
+    # frame 中每個通道屬於哪個燈具 (-1 為沒有燈具)、是燈具的第幾個通道與通道種類，依 frame 檔案的 universe 順序
+    size = len(universes) * UNIVERSE_SIZE
+    owner = np.full(size, -1, dtype=np.int64)
+    offset = np.zeros(size, dtype=np.int64)
+    kind = [''] * size
+    position = {name: u for u, name in enumerate(universes)}
+    for fix, alias in enumerate(ir.fix_alias):
+        if ir.fix_universe[fix] == NO_UNIVERSE:
+            continue
+        u = position.get(ir.universes[ir.fix_universe[fix]])
+        if u is None:
+            continue
+        t = ir.fix_type[fix]
+        ch0 = ir.type_channel_offset[t]
+        base = u * UNIVERSE_SIZE + ir.fix_address[fix] - 1
+        for c in range(ir.type_channel_count[t]):
+            owner[base + c] = fix
+            offset[base + c] = c
+            kind[base + c] = CHANNEL_KINDS[ir.ch_kind[ch0 + c]]
+    return owner, offset, kind
+
+
+def read_range(reader, start, stop):
+    # 解碼 start~stop 的 frame，兩個檔案的 chunk 範圍不同時使用
+    blocks = []
+    pos = start
+    while pos < stop:
+        chunk_id = reader.chunk_for(pos)
+        first, count, offset = reader.chunks[chunk_id]
+        end = min(stop, first + count)
+        blocks.append(reader.chunk_array(chunk_id)[pos - first:end - first])
+        pos = end
+    return blocks[0] if len(blocks) == 1 else np.concatenate(blocks)
+
+
+def same_data(x, y):
+    return len(x) == len(y) and np.array_equal(np.frombuffer(x, dtype=np.uint8), np.frombuffer(y, dtype=np.uint8))
+
+
+def diff_chunk(a, b, job):
+    # 比較一段 frame，回傳 (第一個 frame, 不同的 frame 在這段中的位置, 每個通道的最大差值, 每個通道不同的 frame 數)
+    # 未解碼的資料相同時回傳 None
+    chunk_id, first, stop, b_id = job
+    if b_id is not None:
+        _, _, codec_a, data_a = a.chunk_data(chunk_id)
+        _, _, codec_b, data_b = b.chunk_data(b_id)
+        if codec_a == codec_b and same_data(data_a, data_b):
+            return None
+        frames_b = b.chunk_array(b_id)[:stop - first]
+    else:
+        frames_b = read_range(b, first, stop)
+    frames_a = a.chunk_array(chunk_id)[:stop - first]
+    rows = np.flatnonzero((frames_a != frames_b).any(axis=1))
+    if not rows.size:
+        return first, rows, None, None
+    x, y = frames_a[rows], frames_b[rows]
+    error = np.maximum(x, y) - np.minimum(x, y)
+    return first, rows, error.max(axis=0), np.count_nonzero(error, axis=0)
+
+
+def diff_files(path_a, path_b, workers=None):
+    # zlib 解壓與 numpy 比較都會釋放 GIL，多個 chunk 以執行緒同時比較
+    from concurrent.futures import ThreadPoolExecutor
+    t0 = time.perf_counter()
+    a, b = FrameFileReader(path_a), FrameFileReader(path_b)
+    try:
+        if a.universes != b.universes or a.frame_size != b.frame_size:
+            raise ValueError(f"{path_a} and {path_b} have different universes: {a.universes} vs {b.universes}")
+        result = FrameDiff(path_a, path_b, a, b)
+        b_chunks = {chunk[:2]: chunk_id for chunk_id, chunk in enumerate(b.chunks)}
+        jobs = [(chunk_id, first, min(first + count, result.compared), b_chunks.get((first, count)))
+                for chunk_id, (first, count, offset) in enumerate(a.chunks) if first < result.compared]
+        result.chunks = len(jobs)
+        with ThreadPoolExecutor(workers or os.cpu_count() or 1) as pool:
+            for chunk in pool.map(lambda job: diff_chunk(a, b, job), jobs):
+                if chunk is None:
+                    result.skipped_chunks += 1
+                elif chunk[2] is not None:
+                    result.add(a, *chunk)
+    finally:
+        a.close()
+        b.close()
+    result.elapsed = time.perf_counter() - t0
+    return result
+
+
+def render_frames(ir, out_path, show_number=None, fps=None, workers=None):
+    from offline_render import render_show, DEFAULT_FPS
+    stats = render_show(ir, out_path, show_number, fps or DEFAULT_FPS, workers)
+    logger.info(f"Rendered {stats['frames']} frames to {out_path} in {stats['wall_sec']:.3f}s")
+    return out_path
+
+
+def main(argv=None):
+    import argparse
+    import tempfile
+    from offline_render import load_ir
+    parser = argparse.ArgumentParser(description="Compare two DMX frame streams. Each input is a frame file "
+                                     "(.twf) or a show (.tw/.twc) that is rendered first.")
+    parser.add_argument('a', help="reference frame file or show")
+    parser.add_argument('b', help="frame file or show to compare")
+    parser.add_argument('--show', default=None,
+                        help="show used to map channels to fixtures (default: the first input that is a show)")
+    parser.add_argument('--show-number', type=int, default=None)
+    parser.add_argument('--fps', type=float, default=None, help="render fps (default: the frame file's)")
+    parser.add_argument('--workers', type=int, default=None, help="render processes and compare threads")
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP, help="fixtures or channels to list")
+    args = parser.parse_args(argv)
+
+    shows = [path for path in (args.show, args.a, args.b) if path and path.endswith(SHOW_EXTS)]
+    irs = {}
+    ir = None
+    if shows:
+        irs[shows[0]] = ir = load_ir(shows[0])
+    fps = args.fps
+    if fps is None:
+        # 與另一邊的錄製相同的 fps
+        recordings = [path for path in (args.a, args.b) if not path.endswith(SHOW_EXTS)]
+        if recordings:
+            reader = FrameFileReader(recordings[0])
+            fps = reader.fps or None
+            reader.close()
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for n, path in enumerate((args.a, args.b)):
+            if path.endswith(SHOW_EXTS):
+                show_ir = irs.get(path) or irs.setdefault(path, load_ir(path))
+                path = render_frames(show_ir, os.path.join(tmp, f"{n}.twf"), args.show_number, fps, args.workers)
+            paths.append(path)
+        result = diff_files(*paths, workers=args.workers)
+    result.paths = (args.a, args.b)
+    print('\n'.join(result.report(ir, args.top)))
+    return 0 if result.identical else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+import os
+import mmap
+import struct
+import zlib
+from array import array
+import Pylogger
+
+logger = Pylogger.get_logger()
+
+# DMX 影格檔 (.twf)
+# header: magic, version, codec, universe 數量, frame 大小, fps, index 位置, frame 數量, chunk 數量
+# 接著是 universe 名稱，之後依序為 chunk：
+#   chunk header (magic, 第一個 frame, frame 數量, codec, 資料長度) + 每個 frame 的時間戳 + 資料
+# 檔尾為 index：每個 chunk 的 (第一個 frame, frame 數量, chunk 位置)
+# index 遺失時 (例如錄製中斷) 可以逐一掃描 chunk header 重建
+TWF_MAGIC = b'TWF\x00'
+TWF_VERSION = 1
+HEADER = struct.Struct('<4sHHHIdQII')
+CHUNK = struct.Struct('<4sIIHxxQ')
+CHUNK_MAGIC = b'TWCK'
+INDEX_ENTRY = struct.Struct('<IIQ')
+UNIVERSE_SIZE = 512
+
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+CODEC_DELTA = 2
+CODECS = {'raw': CODEC_RAW, 'zlib': CODEC_ZLIB, 'delta': CODEC_DELTA}
+
+
+def encode_chunk(frames, codec, level=1):
+    # frames 為同樣長度的 bytes 串列
+    if codec == CODEC_RAW:
+        return b''.join(frames)
+    if codec == CODEC_ZLIB:
+        return zlib.compress(b''.join(frames), level)
+    if codec == CODEC_DELTA:
+        # 第一個 frame 原樣保存，之後與前一個 frame 做 XOR，未變動的通道成為 0 方便壓縮
+        out = [frames[0]]
+        prev = int.from_bytes(frames[0], 'little')
+        size = len(frames[0])
+        for frame in frames[1:]:
+            cur = int.from_bytes(frame, 'little')
+            out.append((cur ^ prev).to_bytes(size, 'little'))
+            prev = cur
+        return zlib.compress(b''.join(out), level)
+    raise ValueError(f"Unknown frame codec {codec}")
+
+
+def decode_chunk(data, codec, frame_size, count):
+    if codec == CODEC_RAW:
+        return bytes(data)
+    raw = zlib.decompress(data)
+    if codec == CODEC_ZLIB:
+        return raw
+    if codec == CODEC_DELTA:
+        out = bytearray(raw)
+        prev = int.from_bytes(raw[:frame_size], 'little')
+        for i in range(1, count):
+            cur = prev ^ int.from_bytes(raw[i * frame_size:(i + 1) * frame_size], 'little')
+            out[i * frame_size:(i + 1) * frame_size] = cur.to_bytes(frame_size, 'little')
+            prev = cur
+        return bytes(out)
+    raise ValueError(f"Unknown frame codec {codec}")
+
+
+def decode_chunk_array(data, codec, frame_size, count):
+    # decode_chunk 的 numpy 版本，回傳 (count, frame_size) 的 uint8 陣列
+    # delta 以整個 frame 為單位 XOR 還原 (frame 大小為 512 的倍數，以 uint64 計算)；raw 直接指向 data 不複製
+    import numpy as np
+    if codec == CODEC_RAW:
+        return np.frombuffer(data, dtype=np.uint8, count=count * frame_size).reshape(count, frame_size)
+    if codec not in (CODEC_ZLIB, CODEC_DELTA):
+        raise ValueError(f"Unknown frame codec {codec}")
+    frames = np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(count, frame_size)
+    if codec == CODEC_DELTA:
+        delta = frames.view(np.uint64)
+        words = np.empty_like(delta)
+        words[0] = delta[0]
+        for i in range(1, count):
+            np.bitwise_xor(words[i - 1], delta[i], out=words[i])
+        frames = words.view(np.uint8)
+    return frames
+
+
+class FrameFileWriter:
+    def __init__(self, path, universes, fps=0.0, codec='delta', chunk_frames=256):
+        self.path = path
+        self.universes = list(universes)
+        self.frame_size = UNIVERSE_SIZE * len(self.universes)
+        self.fps = fps
+        self.codec = CODECS[codec] if isinstance(codec, str) else codec
+        self.chunk_frames = chunk_frames
+        self.frame_count = 0
+        self.index = []
+        self._frames = []
+        self._times = []
+        self._f = open(path, 'wb')
+        self._f.write(HEADER.pack(TWF_MAGIC, TWF_VERSION, self.codec, len(self.universes),
+                                  self.frame_size, fps, 0, 0, 0))
+        names = '\0'.join(self.universes).encode('utf-8')
+        self._f.write(struct.pack('<I', len(names)) + names)
+
+    def write_frame(self, frame, timestamp=None):
+        frame = bytes(frame)
+        if len(frame) != self.frame_size:
+            raise ValueError(f"Frame size {len(frame)} does not match {self.frame_size}")
+        if timestamp is None:
+            timestamp = self.frame_count / self.fps if self.fps else 0.0
+        self._frames.append(frame)
+        self._times.append(timestamp)
+        self.frame_count += 1
+        if len(self._frames) >= self.chunk_frames:
+            self.flush_chunk()
+
+    def flush_chunk(self):
+        if not self._frames:
+            return
+        data = encode_chunk(self._frames, self.codec)
+        self.write_encoded_chunk(self.frame_count - len(self._frames), len(self._frames), self._times, data)
+        self._frames = []
+        self._times = []
+
+    def write_encoded_chunk(self, first, count, times, data, codec=None):
+        # 已編碼好的 chunk (例如由其他 process 算好) 直接寫入
+        codec = self.codec if codec is None else codec
+        offset = self._f.tell()
+        self._f.write(CHUNK.pack(CHUNK_MAGIC, first, count, codec, len(data)))
+        self._f.write(array('d', times).tobytes())
+        self._f.write(data)
+        self.index.append((first, count, offset))
+        self.frame_count = max(self.frame_count, first + count)
+
+    def close(self):
+        if self._f is None:
+            return
+        self.flush_chunk()
+        index_offset = self._f.tell()
+        for entry in self.index:
+            self._f.write(INDEX_ENTRY.pack(*entry))
+        self._f.seek(0)
+        self._f.write(HEADER.pack(TWF_MAGIC, TWF_VERSION, self.codec, len(self.universes),
+                                  self.frame_size, self.fps, index_offset, self.frame_count, len(self.index)))
+        self._f.close()
+        self._f = None
+        logger.info(f"Wrote {self.frame_count} frames in {len(self.index)} chunks to {self.path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FrameFileReader:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.codec, universe_count, self.frame_size, self.fps, index_offset, \
+            self.frame_count, chunk_count = HEADER.unpack_from(self._mm, 0)
+        if magic != TWF_MAGIC:
+            raise ValueError(f"{path} is not a frame file")
+        if version != TWF_VERSION:
+            raise ValueError(f"{path} has frame file version {version}, expected {TWF_VERSION}")
+        (names_len,) = struct.unpack_from('<I', self._mm, HEADER.size)
+        names_start = HEADER.size + 4
+        names = bytes(self._mm[names_start:names_start + names_len]).decode('utf-8')
+        self.universes = names.split('\0') if names else []
+        self._data_start = names_start + names_len
+        if index_offset:
+            self.chunks = [INDEX_ENTRY.unpack_from(self._mm, index_offset + i * INDEX_ENTRY.size)
+                           for i in range(chunk_count)]
+        else:
+            logger.info(f"{path} has no index, scanning chunks")
+            self.chunks = self.scan_chunks()
+            self.frame_count = sum(c[1] for c in self.chunks)
+        self._chunk_firsts = [c[0] for c in self.chunks]
+        self._cache = (None, None)
+
+    def scan_chunks(self):
+        chunks = []
+        pos = self._data_start
+        size = len(self._mm)
+        while pos + CHUNK.size <= size:
+            magic, first, count, codec, nbytes = CHUNK.unpack_from(self._mm, pos)
+            end = pos + CHUNK.size + count * 8 + nbytes
+            if magic != CHUNK_MAGIC or end > size:
+                break
+            chunks.append((first, count, pos))
+            pos = end
+        return chunks
+
+    def __len__(self):
+        return self.frame_count
+
+    def chunk_for(self, frame_index):
+        from bisect import bisect_right
+        if not 0 <= frame_index < self.frame_count:
+            raise IndexError(f"Frame {frame_index} out of range 0-{self.frame_count - 1}")
+        return bisect_right(self._chunk_firsts, frame_index) - 1
+
+    def read_chunk(self, chunk_id):
+        if self._cache[0] == chunk_id:
+            return self._cache[1]
+        first, count, offset = self.chunks[chunk_id]
+        magic, first, count, codec, nbytes = CHUNK.unpack_from(self._mm, offset)
+        times_start = offset + CHUNK.size
+        times = memoryview(self._mm)[times_start:times_start + count * 8].cast('d')
+        data_start = times_start + count * 8
+        data = memoryview(self._mm)[data_start:data_start + nbytes]
+        if codec == CODEC_RAW:
+            frames = data
+        else:
+            frames = decode_chunk(data, codec, self.frame_size, count)
+        result = (first, count, times, frames)
+        self._cache = (chunk_id, result)
+        return result
+
+    def chunk_data(self, chunk_id):
+        # 未解碼的 chunk：(第一個 frame, frame 數量, codec, 資料的 memoryview)
+        first, count, offset = self.chunks[chunk_id]
+        magic, first, count, codec, nbytes = CHUNK.unpack_from(self._mm, offset)
+        data_start = offset + CHUNK.size + count * 8
+        return first, count, codec, memoryview(self._mm)[data_start:data_start + nbytes]
+
+    def chunk_array(self, chunk_id):
+        # chunk 中所有 frame 的 (frame 數量, frame 大小) uint8 陣列
+        first, count, codec, data = self.chunk_data(chunk_id)
+        return decode_chunk_array(data, codec, self.frame_size, count)
+
+    def frame(self, index):
+        first, count, times, frames = self.read_chunk(self.chunk_for(index))
+        i = index - first
+        return frames[i * self.frame_size:(i + 1) * self.frame_size]
+
+    def timestamp(self, index):
+        first, count, times, frames = self.read_chunk(self.chunk_for(index))
+        return times[index - first]
+
+    def iter_frames(self, start=0):
+        # 依序產生 (frame 索引, 時間戳, frame)
+        if self.frame_count == 0:
+            return
+        for chunk_id in range(self.chunk_for(start), len(self.chunks)):
+            first, count, times, frames = self.read_chunk(chunk_id)
+            for i in range(max(0, start - first), count):
+                yield first + i, times[i], frames[i * self.frame_size:(i + 1) * self.frame_size]
+
+    def close(self):
+        self._cache = (None, None)
+        try:
+            self._mm.close()
+        except BufferError:
+            # 仍有外部持有 frame 的 memoryview，交給 GC 處理
+            pass
@@ -0,0 +1,117 @@
+import time
+import queue
+import threading
+from frame_file import FrameFileWriter, FrameFileReader
+import Pylogger
+
+logger = Pylogger.get_logger()
+
+
+class FrameRecorder:
+    # 輸出執行緒只做一次 bytes 複製與 put，壓縮與寫檔都在背景執行緒
+    def __init__(self, path, universes, fps=0.0, codec='delta', chunk_frames=256):
+        self.path = path
+        self.writer = FrameFileWriter(path, universes, fps, codec, chunk_frames)
+        self._queue = queue.SimpleQueue()
+        self._t0 = None
+        self.frames_submitted = 0
+        self._thread = threading.Thread(target=self._run, name='frame-recorder', daemon=True)
+        self._thread.start()
+
+    def submit(self, frame, timestamp=None):
+        if timestamp is None:
+            now = time.monotonic()
+            if self._t0 is None:
+                self._t0 = now
+            timestamp = now - self._t0
+        self._queue.put((bytes(frame), timestamp))
+        self.frames_submitted += 1
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            frame, timestamp = item
+            self.writer.write_frame(frame, timestamp)
+        self.writer.close()
+
+    def close(self):
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        logger.info(f"Recorded {self.frames_submitted} frames to {self.path}")
+
+
+class ReplayDriver:
+    # 以 mmap 讀取錄製檔，依原本的時間戳 (或 speed 倍速) 送到輸出裝置
+    def __init__(self, path, output, speed=1.0, loop=False):
+        if speed <= 0:
+            raise ValueError(f"Replay speed must be positive, got {speed}")
+        self.reader = FrameFileReader(path)
+        if output.frame_size != self.reader.frame_size:
+            raise ValueError(f"Output has {len(output.universes)} universes but recording has "
+                             f"{len(self.reader.universes)}")
+        self.output = output
+        self.speed = speed
+        self.loop = loop
+        self.late_frames = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run(self, start_frame=0):
+        reader = self.reader
+        if len(reader) == 0:
+            return
+        while not self._stop.is_set():
+            ts0 = reader.timestamp(start_frame)
+            t_origin = time.monotonic()
+            for index, timestamp, frame in reader.iter_frames(start_frame):
+                if self._stop.is_set():
+                    return
+                deadline = t_origin + (timestamp - ts0) / self.speed
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    self._stop.wait(delay)
+                elif delay < -0.001:
+                    self.late_frames += 1
+                self.output.send(frame, timestamp)
+            if not self.loop:
+                return
+            start_frame = 0
+
+    def start(self, start_frame=0):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, args=(start_frame,), name='frame-replay', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        self.stop()
+        self.reader.close()
+
+
+if __name__ == "__main__":
+    import sys
+    from dmx_output import ArtNetOutput, NullOutput
+    path = sys.argv[1]
+    speed = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    reader = FrameFileReader(path)
+    output = ArtNetOutput(reader.universes) if '--artnet' in sys.argv else NullOutput(reader.universes)
+    replay = ReplayDriver(path, output, speed)
+    t0 = time.monotonic()
+    replay.run()
+    print(f"Replayed {output.frames_sent} frames in {time.monotonic() - t0:.3f}s, {replay.late_frames} late")
+    replay.close()
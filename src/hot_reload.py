@@ -0,0 +1,172 @@
+import os
+import time
+import threading
+from show_project import ShowProject, parse_show
+from show_compiler import ShowCompiler
+from show_ir import IRBuilder
+import Pylogger
+import Pymetrics
+
+logger = Pylogger.get_logger()
+
+DEFAULT_POLL_INTERVAL = 0.02
+
+
+def file_state(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class FileWatcher:
+    # 以輪詢 mtime/size 偵測變更，不依賴平台的檔案通知
+    def __init__(self, paths, callback, interval=DEFAULT_POLL_INTERVAL):
+        self.callback = callback
+        self.interval = interval
+        self._states = {path: file_state(path) for path in paths}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def watch(self, path):
+        self._states.setdefault(path, file_state(path))
+
+    def poll(self):
+        changed = []
+        for path, state in list(self._states.items()):
+            current = file_state(path)
+            if current != state:
+                self._states[path] = current
+                if current is not None:
+                    changed.append(path)
+        return changed
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            changed = self.poll()
+            if changed:
+                self.callback(changed)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name='file-watcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class HotReloader:
+    # 編輯中的 show/cue 檔案存檔後，只重新解析該檔案、只重新綁定受影響的 cue
+    # 新的 timeline 由 renderer 在下一個 INTERVAL 邊界換上，輸出不中斷
+    def __init__(self, show_path, interval=DEFAULT_POLL_INTERVAL):
+        self.project = ShowProject(show_path)
+        self.compiler = ShowCompiler(self.project)
+        # 保留同一個 IRBuilder，未變更的 cue instance 沿用原本的 id 與已取樣的函式表
+        self.builder = IRBuilder(self.project)
+        self.ir = self.builder.build(self.compiler.compile())
+        # 最新編譯的 timeline；renderer 在 INTERVAL 邊界換上之前 ir.timelines 仍是播放中的 timeline
+        self.timelines = dict(self.ir.timelines)
+        self.renderers = []
+        self.reloads = 0
+        self.last_latency = None
+        self.watcher = FileWatcher(self.project.source_files(), self.on_change, interval)
+
+    def attach(self, renderer):
+        if renderer.ir is not self.ir:
+            raise ValueError("Renderer was not built from this reloader's IR")
+        self.renderers.append(renderer)
+        return renderer
+
+    def start(self):
+        self.watcher.start()
+        logger.info(f"Watching {len(self.watcher._states)} files for changes")
+        return self
+
+    def close(self):
+        self.watcher.stop()
+
+    def on_change(self, paths):
+        try:
+            self.reload(paths)
+        except Exception as e:
+            # 存檔到一半或語法錯誤時保留目前的演出
+            logger.error(f"Hot reload of {paths} failed, keeping the running show: {e}")
+
+    def reload(self, paths):
+        # 解析、綁定或寫入 IR 時出錯，還原 show、cue、綁定快取與 IR 欄位，播放中的演出不受影響
+        project = self.project
+        marks = (project.show, project.cues.mark(), project.binder.mark(), self.builder.mark())
+        cue_paths = set(project.cues.files.values())
+        try:
+            timelines = self.rebuild(paths, cue_paths)
+        except Exception:
+            project.show = marks[0]
+            project.cues.rollback(marks[1])
+            project.binder.rollback(marks[2])
+            self.builder.rollback(marks[3])
+            raise
+        for path in set(project.cues.files.values()) - cue_paths:
+            self.watcher.watch(path)
+
+        swapped = {}
+        for number, new in timelines.items():
+            old = self.timelines.get(number)
+            if old is not None and list(old.instances) == list(new.instances) and old.starts == new.starts:
+                continue
+            self.timelines[number] = new
+            renderers = [renderer for renderer in self.renderers if renderer.show_number == number]
+            for renderer in renderers:
+                swapped[number] = renderer.schedule_timeline(new)
+            if not renderers:
+                # 沒有 renderer 播放的 SHOW 直接換上，有 renderer 時由 renderer 換上時寫入
+                self.ir.timelines[number] = new
+        self.reloads += 1
+        latest = max(os.stat(path).st_mtime_ns for path in paths) / 1e9
+        self.last_latency = time.time() - latest
+        Pymetrics.observe('reload', self.last_latency)
+        logger.info(f"Hot reload ready {self.last_latency * 1000:.1f} ms after save, swaps at {swapped}")
+        return swapped
+
+    def rebuild(self, paths, cue_paths):
+        # 重新解析變更的檔案並編譯，回傳 {SHOW 編號: 寫入 IR 的 timeline}
+        project = self.project
+        reparse_show = False
+        for path in paths:
+            if path == project.show_path:
+                reparse_show = True
+            elif path in cue_paths:
+                cue, names = project.cues.reload(path)
+                for name in set(names):
+                    project.binder.invalidate(name)
+                logger.info(f"Reloaded cue file {path}: {sorted(set(names))}")
+            else:
+                # setting 與 LIBS 會改變 patch 與輸出配置，需要重新啟動
+                logger.warning(f"{path} changed, setting and library changes take effect after a restart")
+        if reparse_show:
+            project.show = parse_show(project.show_path, project.pool)
+            logger.info(f"Reloaded show file {project.show_path}")
+        return {number: self.builder.add_timeline(timeline) for number, timeline in self.compiler.compile().items()}
+
+
+if __name__ == "__main__":
+    import sys
+    from show_player import ShowPlayer
+    from dmx_output import NullOutput
+    reloader = HotReloader(sys.argv[1] if len(sys.argv) > 1 else "../example/show250601/show/show1.tw")
+    player = ShowPlayer(reloader.ir, NullOutput(reloader.ir.universes))
+    reloader.attach(player.renderer)
+    reloader.start()
+    print("Playing, edit the show or cue files to reload; Ctrl-C to stop")
+    try:
+        player.run()
+    except KeyboardInterrupt:
+        pass
+    reloader.close()
+    player.close()
+    print(f"{reloader.reloads} reloads, last {reloader.last_latency}")
@@ -0,0 +1,200 @@
+import sys
+import types
+from ast_nodes import Node, Command, Func, Interval, Cue, CueCall, InlineCue, Wait, ShowScript
+import Pylogger
+
+logger = Pylogger.get_logger()
+
+
+class InternPool:
+    # 解析結果的 hash-consing：結構 (含來源位置) 相同的子樹只保留一份，字串與參數串列也共用
+    # 節點的 key 以子節點的 id 組成，子節點已先換成共用的那一份，因此 id 相同即代表結構相同
+    # 共用之後的節點與串列都視為唯讀
+    def __init__(self):
+        self._table = {}
+        self._strings = {}
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key, value):
+        shared = self._table.get(key)
+        if shared is None:
+            self.misses += 1
+            self._table[key] = value
+            return value
+        self.hits += 1
+        return shared
+
+    def string(self, text):
+        if not isinstance(text, str):
+            return text
+        return self._strings.setdefault(text, text)
+
+    def params(self, params):
+        # CUE 的 IN 參數或呼叫參數，元素為字串或 (名稱, 值)
+        items = tuple(tuple(map(self.string, p)) if isinstance(p, tuple) else self.string(p) for p in params)
+        return self.lookup(('params', items), list(items))
+
+    def share(self, node):
+        # 回傳與 node 結構相同的共用節點；Cue / ShowScript 本身帶有檔名，只共用其中的內容
+        if isinstance(node, Command):
+            text = self.string(node.text)
+            return self.lookup((Command, text) + node.span, node)
+        if isinstance(node, Func):
+            return self.lookup((Func, node.name, node.arg, node.expr) + node.span, node)
+        if isinstance(node, Interval):
+            node.commands = [self.share(command) for command in node.commands]
+            key = (Interval, node.start, node.end, tuple(map(id, node.commands))) + node.span
+            return self.lookup(key, node)
+        if isinstance(node, Cue):
+            self.share_cue(node)
+            return node
+        if isinstance(node, InlineCue):
+            self.share_cue(node.cue)
+            return node
+        if isinstance(node, CueCall):
+            node.params = self.params(node.params)
+            return self.lookup((CueCall, self.string(node.name), id(node.params)) + node.span, node)
+        if isinstance(node, Wait):
+            return self.lookup((Wait, node.duration, node.unit) + node.span, node)
+        if isinstance(node, ShowScript):
+            for show in node.shows:
+                show.body = [self.share(item) for item in show.body]
+            return node
+        return node
+
+    def share_cue(self, cue):
+        cue.params = self.params(cue.params)
+        funcs = {name: self.share(func) for name, func in cue.funcs.items()}
+        cue.funcs = self.lookup(('funcs', tuple((name, id(f)) for name, f in funcs.items())), funcs)
+        blocks = {}
+        for block, intervals in cue.blocks.items():
+            intervals = [self.share(interval) for interval in intervals]
+            blocks[block] = self.lookup(('intervals', tuple(map(id, intervals))), intervals)
+        cue.blocks = self.lookup(('blocks', tuple((b, id(i)) for b, i in blocks.items())), blocks)
+
+    def clear(self):
+        self._table.clear()
+        self._strings.clear()
+
+
+def deep_size(obj, seen=None, atoms=()):
+    # 物件與其引用的所有內容佔用的 bytes；seen 為 None 時每一次引用都算一份，也就是沒有共用時的大小
+    # atoms 中的型別不計入，用於本來就由其他地方共用的內容，例如 setting 中的 alias 字串
+    if obj is None or isinstance(obj, (type, types.FunctionType, types.ModuleType) + atoms):
+        return 0
+    if seen is not None:
+        if id(obj) in seen:
+            return 0
+        seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen, atoms) + deep_size(v, seen, atoms) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(v, seen, atoms) for v in obj)
+    elif isinstance(obj, Node):
+        for cls in type(obj).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if name != '_function':
+                    size += deep_size(getattr(obj, name, None), seen, atoms)
+    return size
+
+
+def memory_report(project, builder=None, renderer=None):
+    # 回傳 [(項目, 引用數, 實際保存數, 節省的 bytes)]，節省的 bytes 是與每個引用各自保存一份相比
+    # bytes 為 None 表示只比較數量
+    rows = []
+    trees = [project.show] + project.cues.loaded()
+    shared = deep_size(trees, set())
+    rows.append(('AST (show + cue files)', len(trees), len(trees), deep_size(trees) - shared))
+
+    funcs = [f for tree in trees for f in iter_funcs(tree)]
+    compiled = {id(f.function) for f in funcs} | {id(f) for f in project.funcs.values()}
+    rows.append(('FUNC compiles', len(funcs) + len(project.funcs), len(compiled), None))
+
+    instances = project.binder.instances()
+    commands = [c for inst in instances for c in inst.commands]
+    lists = [inst.commands for inst in instances]
+    scalars = (str, int, float)
+    rows.append(('bound commands', len(commands), len({id(c) for c in commands}),
+                 deep_size(lists, atoms=scalars) - deep_size(lists, set(), scalars)))
+
+    if builder is not None:
+        ir = builder.ir
+        row_bytes = sum(getattr(ir, name).itemsize for name in (
+            'cmd_channel', 'cmd_mode', 'cmd_start', 'cmd_end', 'cmd_fix_offset', 'cmd_fix_count', 'cmd_value',
+            'cmd_lut'))
+        referenced = sum(ir.inst_cmd_count)
+        rows.append(('IR command rows', referenced, len(ir.cmd_channel),
+                     (referenced - len(ir.cmd_channel)) * row_bytes))
+        fixtures = sum(ir.cmd_fix_count[c] for inst in range(ir.instance_count)
+                       for c in range(ir.inst_cmd_offset[inst], ir.inst_cmd_offset[inst] + ir.inst_cmd_count[inst]))
+        rows.append(('IR command fixtures', fixtures, len(ir.cmd_fixtures),
+                     (fixtures - len(ir.cmd_fixtures)) * ir.cmd_fixtures.itemsize))
+        luts = sum(1 for c in commands if c.func is not None)
+        rows.append(('function tables', luts, len(ir.lut_name),
+                     None if not luts else (luts - len(ir.lut_name)) * 256 * ir.lut_values.itemsize))
+    if renderer is not None:
+        baked = list(renderer._prepared.values())
+        rows.append(('baked segments', len(baked), len({id(b) for b in baked}),
+                     deep_size(baked) - deep_size(baked, set())))
+    return rows
+
+
+def iter_funcs(tree):
+    if isinstance(tree, Cue):
+        yield from tree.funcs.values()
+    elif isinstance(tree, ShowScript):
+        for show in tree.shows:
+            for item in show.body:
+                if isinstance(item, InlineCue):
+                    yield from item.cue.funcs.values()
+
+
+def print_report(title, rows):
+    print(title)
+    total = 0
+    for name, referenced, stored, saved in rows:
+        total += saved or 0
+        saved_text = f"{saved / 1024:10.1f} KB saved" if saved is not None else ''
+        print(f"    {name:24s} {referenced:8d} refs -> {stored:8d} stored  {saved_text}")
+    print(f"    {'total':24s} {total / 1024:37.1f} KB saved")
+
+
+def main(argv=None):
+    import argparse
+    import logging
+    import tempfile
+    from show_project import ShowProject
+    from show_compiler import ShowCompiler
+    from show_ir import IRBuilder
+    from renderer import FrameRenderer
+    from show_generator import ShowGenerator
+    parser = argparse.ArgumentParser(description="Report memory saved by sharing identical cue data")
+    parser.add_argument('shows', nargs='*', help="show files, defaults to the example show")
+    parser.add_argument('--generated', type=int, default=0, metavar='N',
+                        help="also report a generated project with N show calls")
+    args = parser.parse_args(argv)
+    Pylogger.get_logger().setLevel(logging.WARNING)
+
+    def report(path):
+        project = ShowProject(path)
+        builder = IRBuilder(project)
+        ir = builder.build(ShowCompiler(project).compile())
+        renderer = FrameRenderer(ir)
+        for number, timeline in ir.timelines.items():
+            for inst in set(timeline.instances):
+                renderer.prepare(inst)
+        print_report(path, memory_report(project, builder, renderer))
+
+    paths = args.shows or ([] if args.generated else ["../example/show250601/show/show1.tw"])
+    for path in paths:
+        report(path)
+    if args.generated:
+        with tempfile.TemporaryDirectory() as root:
+            report(ShowGenerator(show_calls=args.generated).write_project(root))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
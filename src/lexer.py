@@ -1,12 +1,18 @@
 import re
+from bisect import bisect_left
 from collections import namedtuple
 import Pylogger
 
 logger = Pylogger.get_logger()
-Pylogger.logger_enable()  # 啟用日誌記錄
 
 Token = namedtuple('Token', ['type', 'value', 'line', 'column'])
 
+# 增量 lexing 每隔 CHECKPOINT 個 token 記錄一次掃描狀態
+CHECKPOINT = 32
+# (下一個 token 索引, 文字位置, line, column, keep_newline, recent 長度, recent 最後 7 個)
+Checkpoint = namedtuple('Checkpoint', ['index', 'pos', 'line', 'column', 'keep_newline',
+                                       'recent_len', 'recent_tail'])
+
 class Lexer:
     def __init__(self, text):
         self.text = text
@@ -15,6 +21,7 @@ class Lexer:
             'CUE', 'IN', 'FUNC', 'INTERVAL', 'DIMMER', 'COLOR',
             'STROBE', 'OTHERS', 'START', 'END', 'VALUE', 'FROM', 'TO',
             'SETTING', 'PLAYBACK', 'SHOW', 'WAIT',
+            'LIBS', 'FIXTURE', 'PATCH', 'GROUP',
             # 其他你需要的關鍵字
         }
         self.token_specification = [
@@ -28,6 +35,8 @@ class Lexer:
             ('LSQUARE',  r'\['),
             ('RSQUARE',  r'\]'),
             ('COMMA',    r','),
+            ('LT',       r'<'),
+            ('GT',       r'>'),
             ('LPAREN',   r'\('),
             ('RPAREN',   r'\)'),
             ('STRING',   r'"[^"]*"'),
@@ -41,8 +50,15 @@ class Lexer:
         ))
         self.line = 1
         self.column = 1
-        self.keep_newline = False
+        # INTERVAL[...]{ 區塊內產生 NEWLINE token；值為進入區塊後尚未關閉的大括號數，0 表示不產生
+        self.keep_newline = 0
         self._recent_tokens = []
+        self.pos = 0
+        self._tokens = None
+        self._checkpoints = None
+        # update 之後尚未套用的位移 [checkpoint 索引, token 索引位移, 文字位置位移, 行數位移]：
+        # 該 checkpoint 之後的 checkpoint 與 token 都還要加上這個位移，需要時才套用
+        self._shift = None
 
     def _last_tokens_look_like_interval(self):
         tokens = self._recent_tokens
@@ -100,9 +116,13 @@ class Lexer:
             logger.lexer("IndexError in function _last_tokens_look_like_interval")
             return False
 
-    def generate_tokens(self):
-        self._recent_tokens = []
-        for mo in self.token_regex.finditer(self.text):
+    def generate_tokens(self, pos=None, text=None):
+        # pos 不為 None 時從該位置以目前的 line/column/keep_newline 狀態繼續掃描
+        # text 為 None 時掃描 self.text
+        if pos is None:
+            self._recent_tokens = []
+            pos = 0
+        for mo in self.token_regex.finditer(self.text if text is None else text, pos):
             kind = mo.lastgroup
             value = mo.group()
 
@@ -115,6 +135,7 @@ class Lexer:
                     token = Token(kind, value, self.line, self.column)
                     logger.gene(f'\tGenerated token: {token}')
                     self._recent_tokens.append(token)
+                    self.pos = mo.end()
                     yield token
                 continue
 
@@ -142,22 +163,186 @@ class Lexer:
                 # 進入 INTERVAL[...] 區塊時開啟 keep_newline
                 if kind == 'LBRACE':
                     logger.lexer(f'Enter block with LBRACE,detecting INTERVAL-like structure')
-                    if self._last_tokens_look_like_interval():
-                        self.keep_newline = True
-
-                # 離開區塊時關閉 keep_newline
-                if kind == 'RBRACE':
-                    # 簡單判斷是否還有未閉合大括號
-                    logger.lexer(f'Detected RBRACE,detecting left braces')
-                    if not any(t.type == 'LBRACE' for t in self._recent_tokens):
-                        logger.lexer(f'No more LBRACE tokens, setting keep_newline to False')
-                        self.keep_newline = False
-                    else:
-                        logger.lexer(f'Still have LBRACE tokens, keeping keep_newline True')
-                yield token
+                    if self.keep_newline:
+                        self.keep_newline += 1
+                    elif self._last_tokens_look_like_interval():
+                        self.keep_newline = 1
+
+                # 關閉 INTERVAL[...] 區塊的大括號時關閉 keep_newline
+                # 以大括號數判斷，最近的 token 中是否還有 LBRACE 無法判斷 (例如 OTHERS{bypass} 之後的 CUE END)
+                if kind == 'RBRACE' and self.keep_newline:
+                    self.keep_newline -= 1
+                    if not self.keep_newline:
+                        logger.lexer(f'Interval block closed, setting keep_newline to False')
                 self.column += len(value)
+                self.pos = mo.end()
+                yield token
+
+    def checkpoint(self, index):
+        # _recent_tokens 只有最後 7 個 token 會影響之後的結果
+        recent = self._recent_tokens
+        return Checkpoint(index, self.pos, self.line, self.column, self.keep_newline, len(recent),
+                          tuple(recent[-7:]))
+
+    def restore(self, cp):
+        self.line = cp.line
+        self.column = cp.column
+        self.keep_newline = cp.keep_newline
+        # 只還原會影響結果的部分，其餘位置以不會被檢查的 token 填補
+        filler = Token('NEWLINE', '\n', 0, 0)
+        self._recent_tokens = [filler] * (cp.recent_len - len(cp.recent_tail)) + list(cp.recent_tail)
+
+    @staticmethod
+    def same_state(a, b):
+        return (a.column == b.column and a.keep_newline == b.keep_newline and a.recent_len == b.recent_len
+                and [(t.type, t.value) for t in a.recent_tail] == [(t.type, t.value) for t in b.recent_tail])
+
+    def tokenize(self):
+        # 完整掃描並保留 checkpoint，之後可用 update() 增量更新
+        self.line, self.column, self.keep_newline, self.pos = 1, 1, 0, 0
+        self._recent_tokens = []
+        tokens = []
+        checkpoints = [self.checkpoint(0)]
+        for token in self.generate_tokens():
+            tokens.append(token)
+            if len(tokens) % CHECKPOINT == 0:
+                checkpoints.append(self.checkpoint(len(tokens)))
+        self._tokens = tokens
+        self._checkpoints = checkpoints
+        self._shift = None
+        return tokens
+
+    @property
+    def tokens(self):
+        if self._shift is not None:
+            self.settle(len(self._checkpoints))
+        return self._tokens
+
+    @property
+    def checkpoints(self):
+        if self._shift is not None:
+            self.settle(len(self._checkpoints))
+        return self._checkpoints
+
+    def checkpoint_at(self, i):
+        # 第 i 個 checkpoint 加上尚未套用的位移
+        cp = self._checkpoints[i]
+        shift = self._shift
+        if shift is None or i < shift[0]:
+            return cp
+        return cp._replace(index=cp.index + shift[1], pos=cp.pos + shift[2], line=cp.line + shift[3])
+
+    def find_checkpoint(self, offset):
+        # 文字位置 offset 之前 (不含) 最後一個 checkpoint 的索引
+        cps = self._checkpoints
+        shift = self._shift
+        split = len(cps) if shift is None else shift[0]
+        i = bisect_left(cps, offset, 0, split, key=lambda cp: cp.pos)
+        if i == split and shift is not None:
+            i = bisect_left(cps, offset - shift[2], split, len(cps), key=lambda cp: cp.pos)
+        return max(0, i - 1)
+
+    def shift_lines(self, lo, hi, d_line):
+        # tokens[lo:hi] 的行數加上 d_line
+        if not d_line:
+            return
+        tokens = self._tokens
+        for k in range(lo, hi):
+            t = tokens[k]
+            tokens[k] = Token(t.type, t.value, t.line + d_line, t.column)
+
+    def shift_checkpoints(self, lo, hi, d_index, d_pos, d_line):
+        cps = self._checkpoints
+        cps[lo:hi] = [cp._replace(index=cp.index + d_index, pos=cp.pos + d_pos, line=cp.line + d_line)
+                      for cp in cps[lo:hi]]
+
+    def settle(self, upto):
+        # 把尚未套用的位移套用到第 upto 個 checkpoint 之前，花費與套用的範圍成正比
+        shift = self._shift
+        if shift is None or upto <= shift[0]:
+            return
+        cps = self._checkpoints
+        upto = min(upto, len(cps))
+        lo, d_index, d_pos, d_line = shift
+        end = cps[upto].index + d_index if upto < len(cps) else len(self._tokens)
+        self.shift_lines(cps[lo].index + d_index, end, d_line)
+        self.shift_checkpoints(lo, upto, d_index, d_pos, d_line)
+        self._shift = None if upto >= len(cps) else [upto, d_index, d_pos, d_line]
+
+    def update(self, offset, deleted, inserted):
+        # 套用一次編輯 (offset, 刪除長度, 插入文字)，只重新掃描受影響的範圍
+        # 回傳 (起始 token 索引, 被取代的舊 token 數, 新 token 串列)
+        # 編輯之後的 token 與 checkpoint 的位移記在 _shift，下一次在其他位置編輯或讀取 tokens 時才套用，
+        # 新增或刪除換行不需要重建之後所有的 token
+        if self._tokens is None:
+            self.tokenize()
+        old_text = self.text
+        if offset < 0 or deleted < 0 or offset + deleted > len(old_text):
+            raise ValueError(f"Edit ({offset}, {deleted}) out of range for text of length {len(old_text)}")
+        delta = len(inserted) - deleted
+        edit_end = offset + deleted
+        text = old_text[:offset] + inserted + old_text[edit_end:]
+
+        # 從編輯位置之前最近的 checkpoint 開始；該位置之前的 token 不受影響
+        ci = self.find_checkpoint(offset)
+        self.settle(ci + 1)
+        cps = self._checkpoints
+        start = cps[ci]
+        self.restore(start)
+        # 之後可以重新同步的舊 checkpoint
+        mi = ci + 1
+        while mi < len(cps) and self.checkpoint_at(mi).pos < edit_end:
+            mi += 1
+        target = self.checkpoint_at(mi) if mi < len(cps) else None
+
+        scanned = []
+        new_cps = []
+        resync = None
+        for token in self.generate_tokens(start.pos if ci else None, text):
+            scanned.append(token)
+            pos = self.pos
+            while target is not None and target.pos + delta < pos:
+                mi += 1
+                target = self.checkpoint_at(mi) if mi < len(cps) else None
+            if target is not None and target.pos + delta == pos:
+                cp = self.checkpoint(start.index + len(scanned))
+                if self.same_state(cp, target):
+                    resync = target
+                    break
+            if len(scanned) % CHECKPOINT == 0:
+                new_cps.append(self.checkpoint(start.index + len(scanned)))
+        # 掃描成功後才換上新的文字，掃描出錯時保持原本的文字、token 與 checkpoint
+        self.text = text
+
+        first = start.index
+        tokens = self._tokens
+        if resync is None:
+            removed = len(tokens) - first
+            tokens[first:] = scanned
+            cps[ci + 1:] = new_cps
+            self._shift = None
+        else:
+            removed = resync.index - first
+            shift = first + len(scanned) - resync.index
+            line_shift = self.line - resync.line
+            lo, d_index, d_pos, d_line = self._shift or (mi, 0, 0, 0)
+            if lo > mi:
+                # 編輯位置與尚未套用的位移之間的 checkpoint 與 token 直接加上這次的位移
+                end = self.checkpoint_at(lo).index if lo < len(cps) else len(tokens)
+                self.shift_lines(resync.index, end, line_shift)
+                self.shift_checkpoints(mi, lo, shift, delta, line_shift)
+            tokens[first:resync.index] = scanned
+            cps[ci + 1:mi] = new_cps
+            lo = max(lo, mi) + len(new_cps) - (mi - ci - 1)
+            self._shift = ([lo, d_index + shift, d_pos + delta, d_line + line_shift]
+                           if lo < len(cps) else None)
+        logger.lex_info(f"Incremental lex at {offset}: rescanned {len(scanned)} tokens, "
+                        f"replaced {removed}, resync={'yes' if resync else 'no'}")
+        return first, removed, scanned
 
 if __name__ == "__main__":
+    import logging
+    Pylogger.logger_enable(level=logging.DEBUG)  # 啟用日誌記錄
     sample_text = '''
 CUE cross_back_01 START
     # input BPM, BPM scale rate, lights
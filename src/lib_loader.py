@@ -0,0 +1,382 @@
+import os
+import json
+import hashlib
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from show_ir import CHANNEL_KIND_NAMES, parse_color
+import Pylogger
+
+logger = Pylogger.get_logger()
+
+# LIBS 中的名稱前綴決定函式庫種類
+LIB_KINDS = ('color_lib', 'fixture_lib', 'func_lib', 'playback_lib')
+CACHE_DIR = '__twcache__'
+CACHE_VERSION = 2
+# 同一個 process 中載入過的 snapshot，多個 show 使用相同的函式庫檔案時共用同一份
+_snapshots = {}
+
+
+def lib_kind(name):
+    for kind in LIB_KINDS:
+        if name.startswith(kind):
+            return kind
+    raise ValueError(f"Unknown library kind for {name!r}, expected a name starting with one of {LIB_KINDS}")
+
+
+class ColorRecord:
+    __slots__ = ('id', 'alias', 'values', 'description')
+
+    def __init__(self, id, alias, values, description=''):
+        self.id = id
+        self.alias = alias
+        self.values = values  # (r, g, b, amber, white)
+        self.description = description
+
+    def __repr__(self):
+        return f"ColorRecord({self.id}, {self.alias!r}, {self.values})"
+
+
+class ChannelRecord:
+    __slots__ = ('id', 'name', 'kind', 'min', 'max')
+
+    def __init__(self, id, name, kind, min, max):
+        self.id = id
+        self.name = name
+        self.kind = kind  # show_ir.CHANNEL_KINDS 的索引
+        self.min = min
+        self.max = max
+
+    def __repr__(self):
+        return f"ChannelRecord({self.id}, {self.name!r}, {self.min}-{self.max})"
+
+
+class FixtureTypeRecord:
+    __slots__ = ('id', 'alias', 'fixture', 'manufacturer', 'type', 'enabled', 'channels')
+
+    def __init__(self, id, alias, fixture, manufacturer, type, enabled, channels):
+        self.id = id
+        self.alias = alias
+        self.fixture = fixture
+        self.manufacturer = manufacturer
+        self.type = type
+        self.enabled = enabled
+        self.channels = channels  # 依 channel id 排序的 ChannelRecord tuple
+
+    def __repr__(self):
+        return f"FixtureTypeRecord({self.id}, {self.alias!r}, {len(self.channels)} channels)"
+
+
+class FuncRecord:
+    __slots__ = ('id', 'name', 'alias', 'arg', 'expr', 'description')
+
+    def __init__(self, id, name, alias, arg, expr, description=''):
+        self.id = id
+        self.name = name
+        self.alias = alias
+        self.arg = arg
+        self.expr = expr
+        self.description = description
+
+    def __repr__(self):
+        return f"FuncRecord({self.id}, {self.name!r}, {self.expr!r})"
+
+
+class CueFileRecord:
+    __slots__ = ('id', 'name', 'alias', 'file', 'description')
+
+    def __init__(self, id, name, alias, file, description=''):
+        self.id = id
+        self.name = name
+        self.alias = alias
+        self.file = file
+        self.description = description
+
+    def __repr__(self):
+        return f"CueFileRecord({self.id}, {self.name!r}, {self.file!r})"
+
+
+class LibrarySnapshot:
+    # 所有 LIBS 正規化後的結果，每種記錄以 id 為索引存放，alias 另有索引表
+    def __init__(self):
+        self.colors = []
+        self.fixture_types = []
+        self.funcs = []
+        self.playback = []
+        self.color_values = array('B')  # 每個顏色 5 個值，與 ColorRecord.id 對應
+        self.color_index = {}
+        self.fixture_type_index = {}
+        self.sources = []  # [(path, mtime_ns, size, sha256)]
+
+    def color(self, alias):
+        return self.colors[self.color_index[alias]]
+
+    def fixture_type(self, alias):
+        return self.fixture_types[self.fixture_type_index[alias]]
+
+    def to_data(self):
+        # 只含 list / dict / 字串 / 數字的資料，供快取以 JSON 存放
+        return {
+            'colors': [record_data(record) for record in self.colors],
+            'fixture_types': [record_data(record)[:-1] + [[record_data(channel) for channel in record.channels]]
+                              for record in self.fixture_types],
+            'funcs': [record_data(record) for record in self.funcs],
+            'playback': [record_data(record) for record in self.playback],
+            'color_values': self.color_values.tobytes().hex(),
+            'color_index': self.color_index,
+            'fixture_type_index': self.fixture_type_index,
+            'sources': self.sources,
+        }
+
+    @classmethod
+    def from_data(cls, data):
+        # to_data 的反向；資料格式不符時丟出 ValueError
+        try:
+            snapshot = cls()
+            snapshot.colors = [ColorRecord(*fields[:2], tuple(fields[2]), *fields[3:]) for fields in data['colors']]
+            snapshot.fixture_types = [
+                FixtureTypeRecord(*fields[:-1], tuple(ChannelRecord(*channel) for channel in fields[-1]))
+                for fields in data['fixture_types']]
+            snapshot.funcs = [FuncRecord(*fields) for fields in data['funcs']]
+            snapshot.playback = [CueFileRecord(*fields) for fields in data['playback']]
+            snapshot.color_values = array('B', bytes.fromhex(data['color_values']))
+            snapshot.color_index = dict(data['color_index'])
+            snapshot.fixture_type_index = dict(data['fixture_type_index'])
+            snapshot.sources = [tuple(source) for source in data['sources']]
+        except (KeyError, TypeError, ValueError, IndexError) as e:
+            raise ValueError(f"Invalid library snapshot data: {e}")
+        return snapshot
+
+
+def record_data(record):
+    return [getattr(record, name) for name in record.__slots__]
+
+
+def require(entry, key, kind, where, default=None):
+    value = entry.get(key, default)
+    if value is None:
+        raise ValueError(f"{where}: missing {key!r}")
+    if not isinstance(value, kind):
+        raise ValueError(f"{where}: {key!r} should be {kind.__name__}, got {value!r}")
+    return value
+
+
+def to_int(value, where, key):
+    # JSON 中的數值可能寫成字串，例如 "amber": "125"
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{where}: {key!r} should be an integer, got {value!r}")
+
+
+def load_colors(snapshot, entries, path, start=0):
+    for i, entry in enumerate(entries, start):
+        where = f"{path}[{i}]"
+        alias = require(entry, 'alias', str, where)
+        if alias in snapshot.color_index:
+            raise ValueError(f"{where}: duplicate color alias {alias!r}")
+        try:
+            values = tuple(parse_color(entry))
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"{where}: invalid color: {e}")
+        record = ColorRecord(len(snapshot.colors), alias, values, entry.get('description', ''))
+        snapshot.color_index[alias] = record.id
+        snapshot.colors.append(record)
+        snapshot.color_values.extend(values)
+
+
+def load_fixture_types(snapshot, entries, path, start=0):
+    enabled = {}
+    for i, entry in enumerate(entries, start):
+        where = f"{path}[{i}]"
+        if 'enable_list' in entry:
+            # [{"PAR_4W54": 1}, {"COB": 0}, ...]
+            for item in require(entry, 'enable_list', list, where):
+                if not isinstance(item, dict):
+                    raise ValueError(f"{where}: enable_list items should be objects, got {item!r}")
+                for alias, flag in item.items():
+                    enabled[alias] = bool(to_int(flag, where, alias))
+            continue
+        alias = require(entry, 'alias', str, where)
+        if alias in snapshot.fixture_type_index:
+            raise ValueError(f"{where}: duplicate fixture type alias {alias!r}")
+        channels = []
+        ids = set()
+        for j, channel in enumerate(require(entry, 'channels', list, where)):
+            cwhere = f"{where}.channels[{j}]"
+            cid = to_int(channel.get('id', j), cwhere, 'id')
+            if cid in ids:
+                raise ValueError(f"{cwhere}: duplicate channel id {cid}")
+            ids.add(cid)
+            name = require(channel, 'name', str, cwhere)
+            low = to_int(channel.get('min', 0), cwhere, 'min')
+            high = to_int(channel.get('max', 255), cwhere, 'max')
+            if not 0 <= low <= high <= 255:
+                raise ValueError(f"{cwhere}: invalid range {low}-{high}")
+            channels.append(ChannelRecord(cid, name, CHANNEL_KIND_NAMES.get(name.lower(), 0), low, high))
+        if 'channel_number' in entry and to_int(entry['channel_number'], where, 'channel_number') != len(channels):
+            raise ValueError(f"{where}: channel_number {entry['channel_number']} does not match "
+                             f"{len(channels)} channels")
+        channels.sort(key=lambda c: c.id)
+        record = FixtureTypeRecord(len(snapshot.fixture_types), alias, entry.get('fixture', alias),
+                                   entry.get('manufacturer', ''), entry.get('type', ''), True, tuple(channels))
+        snapshot.fixture_type_index[alias] = record.id
+        snapshot.fixture_types.append(record)
+    for record in snapshot.fixture_types:
+        record.enabled = enabled.get(record.alias, True)
+
+
+def load_funcs(snapshot, entries, path, start=0):
+    for i, entry in enumerate(entries, start):
+        where = f"{path}[{i}]"
+        snapshot.funcs.append(FuncRecord(
+            len(snapshot.funcs), require(entry, 'name', str, where), entry.get('alias'),
+            require(entry, 'arg', str, where, 'x'), require(entry, 'func', str, where),
+            entry.get('description', '')))
+
+
+def load_playback(snapshot, entries, path, start=0):
+    for i, entry in enumerate(entries, start):
+        where = f"{path}[{i}]"
+        snapshot.playback.append(CueFileRecord(
+            len(snapshot.playback), entry.get('name'), entry.get('alias'),
+            require(entry, 'file', str, where), entry.get('description', '')))
+
+
+LOADERS = {
+    'color_lib': load_colors,
+    'fixture_lib': load_fixture_types,
+    'func_lib': load_funcs,
+    'playback_lib': load_playback,
+}
+
+
+def read_source(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    st = os.stat(path)
+    return data, (path, st.st_mtime_ns, st.st_size, hashlib.sha256(data).hexdigest())
+
+
+def read_json(path):
+    data, source = read_source(path)
+    try:
+        entries = json.loads(data)
+    except ValueError as e:
+        raise ValueError(f"{path}: invalid JSON: {e}")
+    if not isinstance(entries, list):
+        raise ValueError(f"{path}: a library should be a JSON array")
+    for i, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            raise ValueError(f"{path}[{i}]: entries should be objects, got {entry!r}")
+    return entries, source
+
+
+def load_libraries(lib_paths):
+    # lib_paths: {LIBS 名稱: 路徑}，所有檔案同時讀取與解析 JSON，再依序正規化
+    names = list(lib_paths)
+    with ThreadPoolExecutor(max(1, min(8, len(names)))) as pool:
+        results = list(pool.map(read_json, [lib_paths[name] for name in names]))
+    snapshot = LibrarySnapshot()
+    for name, (entries, source) in zip(names, results):
+        LOADERS[lib_kind(name)](snapshot, entries, source[0])
+        snapshot.sources.append(source)
+    logger.info(f"Loaded {len(names)} libraries: {len(snapshot.colors)} colors, "
+                f"{len(snapshot.fixture_types)} fixture types, {len(snapshot.funcs)} funcs, "
+                f"{len(snapshot.playback)} cue files")
+    return snapshot
+
+
+def unchanged(snapshot):
+    # 來源檔案的 mtime/size 都沒有改變
+    for path, mtime_ns, size, digest in snapshot.sources:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        if (st.st_mtime_ns, st.st_size) != (mtime_ns, size):
+            return False
+    return True
+
+
+class LibraryCache:
+    # 正規化後的 snapshot 以 JSON 存放，來源檔案的 mtime/size 相同時直接使用
+    # mtime 改變但內容 hash 相同 (例如 touch 或重新 checkout) 時也視為有效
+    # 快取放在 show 目錄中，lint 也會讀取別人的目錄，因此不使用 pickle 這類載入時會執行程式的格式
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path_for(self, lib_paths):
+        key = hashlib.sha1('\n'.join(f"{name}={os.path.abspath(path)}"
+                                     for name, path in lib_paths.items()).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.directory, f"libs-{key}.json")
+
+    def load(self, lib_paths):
+        key = tuple((name, os.path.abspath(path)) for name, path in lib_paths.items())
+        snapshot = _snapshots.get(key)
+        if snapshot is not None and unchanged(snapshot):
+            return snapshot
+        cache_path = self.path_for(lib_paths)
+        snapshot = self.read(cache_path, lib_paths)
+        if snapshot is None:
+            snapshot = load_libraries(lib_paths)
+            self.write(cache_path, snapshot)
+        _snapshots[key] = snapshot
+        return snapshot
+
+    def read(self, cache_path, lib_paths):
+        try:
+            with open(cache_path, 'rb') as f:
+                data = json.load(f)
+            if not isinstance(data, dict) or data.get('version') != CACHE_VERSION:
+                return None
+            snapshot = LibrarySnapshot.from_data(data.get('snapshot'))
+        except (OSError, ValueError):
+            return None
+        if [s[0] for s in snapshot.sources] != [lib_paths[name] for name in lib_paths]:
+            return None
+        refreshed = []
+        for path, mtime_ns, size, digest in snapshot.sources:
+            try:
+                st = os.stat(path)
+            except OSError:
+                return None
+            if (st.st_mtime_ns, st.st_size) == (mtime_ns, size):
+                refreshed.append((path, mtime_ns, size, digest))
+                continue
+            data, source = read_source(path)
+            if source[3] != digest:
+                logger.info(f"Library {path} changed, rebuilding the library cache")
+                return None
+            refreshed.append(source)
+        if refreshed != snapshot.sources:
+            snapshot.sources = refreshed
+            self.write(cache_path, snapshot)
+        logger.info(f"Loaded libraries from cache {cache_path}")
+        return snapshot
+
+    def write(self, cache_path, snapshot):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = cache_path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'version': CACHE_VERSION, 'snapshot': snapshot.to_data()}, f, separators=(',', ':'))
+            os.replace(tmp, cache_path)
+        except OSError as e:
+            # 唯讀的目錄不使用快取
+            logger.warning(f"Cannot write library cache {cache_path}: {e}")
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    from show_project import ShowProject
+    project = ShowProject(sys.argv[1] if len(sys.argv) > 1 else "../example/show250601/show/show1.tw")
+    for use_cache in (False, True, True):
+        t0 = time.perf_counter()
+        if use_cache:
+            snapshot = LibraryCache(os.path.join(project.show_dir, CACHE_DIR)).load(project.lib_paths)
+        else:
+            snapshot = load_libraries(project.lib_paths)
+        print(f"{'cache' if use_cache else 'json '} {(time.perf_counter() - t0) * 1000:.2f} ms")
+    print(snapshot.colors)
+    print(snapshot.fixture_types)
@@ -0,0 +1,424 @@
+import os
+import re
+import sys
+import time
+from collections import namedtuple
+from parser_core import ParseError
+from cue_parser import FUNC_END
+from setting_parser import expand_patch
+from tw_source import read_text, parse_source, format_error
+from ast_nodes import Setting, Cue, CueCall, InlineCue
+from cue_instance import (SelectorResolver, CueBinder, CHANNEL_TYPES, OTHERS_MODES,
+                          parse_command, split_domain, resolve_constant)
+from lib_loader import LOADERS, LibrarySnapshot, lib_kind, read_json
+from show_project import locate, locate_playback_dir
+import Pylogger
+
+logger = Pylogger.get_logger()
+
+Diagnostic = namedtuple('Diagnostic', ['path', 'line', 'column', 'severity', 'message'])
+
+DMX_CHANNELS = 512
+
+
+def lint_file(path):
+    # 在 worker 行程中解析單一 .tw 檔案，回傳 (path, kind, ast, errors)
+    # 語法樹可以直接 pickle 傳回，FUNC 的函式不會跟著傳遞
+    kind, parser, ast, errors = parse_source(path)
+    if ast is not None:
+        check_funcs(parser, ast, errors)
+    return path, kind, ast, errors
+
+
+def check_funcs(parser, ast, errors):
+    # 解析時不編譯 FUNC，這裡逐一編譯；錯誤標在運算式之後的 token，與解析錯誤相同
+    # 無法編譯的 FUNC 從 cue 中移除，使用它的指令會回報 Undefined FUNC
+    cues = [ast] if isinstance(ast, Cue) else [item.cue for show in getattr(ast, 'shows', ())
+                                               for item in show.body if isinstance(item, InlineCue)]
+    positions = None
+    for cue in cues:
+        for name, func in list(cue.funcs.items()):
+            try:
+                func.function
+            except ValueError as e:
+                if positions is None:
+                    positions = {(token.line, token.column): i for i, token in enumerate(parser.tokens)}
+                pos = positions[(func.line, func.column)] + 1
+                while parser.types[pos] not in FUNC_END:
+                    pos += 1
+                token = parser.tokens[pos]
+                errors.append(ParseError(token.line, token.column, str(e)))
+                del cue.funcs[name]
+
+
+# 一個 show 的檢查環境：setting 與 LIBS 決定可用的燈具、顏色、FUNC 與 cue 檔案
+LintContext = namedtuple('LintContext', ['key', 'setting', 'library', 'cue_files', 'funcs', 'binder'])
+
+
+class ShowDirLinter:
+    # 一次解析整個 show 目錄，收集所有語法錯誤與跨檔案的問題
+    def __init__(self, root, jobs=None):
+        self.root = os.path.abspath(root)
+        self.jobs = jobs or os.cpu_count() or 1
+        self.files = {}  # path -> (kind, ast)
+        self.diagnostics = set()
+        self._libs = {}
+        self._texts = {}
+        self._checked = set()
+        self.broken = set()  # 有語法錯誤的檔案
+
+    def report(self, path, line, column, severity, message):
+        self.diagnostics.add(Diagnostic(path, line, column, severity, message))
+
+    def discover(self):
+        tw_paths, json_paths = [], []
+        for directory, dirs, names in os.walk(self.root):
+            # 略過 __twcache__、__pycache__ 與隱藏目錄
+            dirs[:] = sorted(d for d in dirs if not d.startswith(('.', '__')))
+            for name in sorted(names):
+                if name.endswith('.tw'):
+                    tw_paths.append(os.path.join(directory, name))
+                elif name.endswith('.json'):
+                    json_paths.append(os.path.join(directory, name))
+        return tw_paths, json_paths
+
+    def parse_all(self, paths):
+        if self.jobs > 1 and len(paths) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            workers = min(self.jobs, len(paths))
+            with ProcessPoolExecutor(workers) as pool:
+                results = list(pool.map(lint_file, paths, chunksize=max(1, len(paths) // (workers * 4))))
+        else:
+            results = [lint_file(path) for path in paths]
+        for path, kind, ast, errors in results:
+            self.files[path] = (kind, ast)
+            if errors:
+                self.broken.add(path)
+            for error in errors:
+                self.report(path, error.line, error.column, 'error', error.message)
+
+    def run(self):
+        tw_paths, json_paths = self.discover()
+        self.parse_all(tw_paths)
+        for path in json_paths:
+            self.library_entries(path)
+        for path, (kind, ast) in sorted(self.files.items()):
+            if kind == 'show' and ast is not None:
+                self.check_show(path, ast)
+        return sorted(self.diagnostics)
+
+    def text(self, path):
+        text = self._texts.get(path)
+        if text is None:
+            try:
+                text = read_text(path)
+            except (OSError, ValueError):
+                text = ''
+            self._texts[path] = text
+        return text
+
+    def find_line(self, path, *needles):
+        # 跨檔案的問題沒有 token 位置，以文字搜尋找出第一個出現的行
+        text = self.text(path)
+        for needle in needles:
+            if not needle:
+                continue
+            m = re.search(r'(?<![\w.])' + re.escape(needle) + r'(?!\w)', text)
+            if m is not None:
+                return text.count('\n', 0, m.start()) + 1
+        return 0
+
+    def library_entries(self, path):
+        # 每個 JSON 函式庫只讀一次，逐筆驗證，保留可以使用的項目
+        entries = self._libs.get(path)
+        if entries is not None:
+            return entries
+        name = os.path.splitext(os.path.basename(path))[0]
+        try:
+            kind = lib_kind(name)
+        except ValueError:
+            self._libs[path] = entries = (None, [])
+            return entries
+        valid = []
+        try:
+            data, _ = read_json(path)
+        except (OSError, ValueError) as e:
+            self.report(path, 0, 0, 'error', str(e))
+            data = []
+        for i, entry in enumerate(data):
+            try:
+                LOADERS[kind](LibrarySnapshot(), [entry], path, i)
+            except ValueError as e:
+                self.report(path, 0, 0, 'error', str(e))
+            else:
+                valid.append((i, entry))
+        self._libs[path] = entries = (kind, valid)
+        return entries
+
+    def load_library(self, lib_paths):
+        snapshot = LibrarySnapshot()
+        for path in lib_paths:
+            kind, entries = self.library_entries(path)
+            for i, entry in entries:
+                try:
+                    LOADERS[kind](snapshot, [entry], path, i)
+                except ValueError as e:
+                    # 不同函式庫之間重複的 alias
+                    self.report(path, 0, 0, 'error', str(e))
+        return snapshot
+
+    def check_show(self, path, show):
+        show_dir = os.path.dirname(path)
+        setting, setting_path = None, None
+        if show.setting:
+            setting_path = locate(show_dir, show.setting, '.tw')
+            if setting_path is None:
+                self.report(path, self.find_line(path, f'"{show.setting}"'), 0, 'error',
+                            f"Cannot find setting {show.setting}.tw")
+            else:
+                kind, setting = self.files.get(setting_path, (None, None))
+                if kind not in ('setting', None):
+                    self.report(path, self.find_line(path, f'"{show.setting}"'), 0, 'error',
+                                f"{show.setting}.tw is a {kind} file, not a setting")
+                    setting = None
+        setting = setting or Setting()
+
+        lib_paths = []
+        lib_names = [(name, setting_path) for name in setting.libs]
+        if show.playback and show.playback not in setting.libs:
+            lib_names.append((show.playback, path))
+        for name, source in lib_names:
+            lib_path = locate(show_dir, name, '.json')
+            if lib_path is None:
+                self.report(source, self.find_line(source, f'"{name}"'), 0, 'error', f"Cannot find library {name}.json")
+            else:
+                lib_paths.append(lib_path)
+        library = self.load_library(lib_paths)
+        if setting_path is not None:
+            self.check_setting(setting_path, setting, library)
+
+        playback_dir = locate_playback_dir(show_dir)
+        cue_files = {}
+        for record in library.playback:
+            cue_path = os.path.join(playback_dir, record.file)
+            if not os.path.isfile(cue_path):
+                source = next(p for p in lib_paths if p in self._libs and self._libs[p][0] == 'playback_lib')
+                self.report(source, self.find_line(source, f'"{record.file}"'), 0, 'error',
+                            f"Cue file {record.file} not found in {playback_dir}")
+                continue
+            stem = os.path.splitext(record.file)[0]
+            for key in (stem, record.name, record.alias):
+                if key:
+                    cue_files[key] = cue_path
+        funcs = set()
+        for record in library.funcs:
+            funcs.add(record.name)
+            if record.alias:
+                funcs.add(record.alias)
+        context = LintContext((setting_path, tuple(lib_paths)), setting, library, cue_files, funcs,
+                              CueBinder(SelectorResolver(setting)))
+
+        for block in show.shows:
+            for call in block.body:
+                if isinstance(call, InlineCue):
+                    self.check_cue(path, call.cue, context, [], path)
+                    continue
+                if not isinstance(call, CueCall):
+                    continue
+                name = call.name
+                cue_path = cue_files.get(name)
+                if cue_path is None:
+                    self.report(path, call.line, call.column, 'error', f"Unknown cue {name!r} in SHOW {block.number}")
+                    continue
+                kind, cue = self.files.get(cue_path, (None, None))
+                if kind != 'cue' or cue is None:
+                    # 語法錯誤已在解析時回報
+                    if kind not in ('cue', None):
+                        self.report(path, call.line, call.column, 'error',
+                                    f"Cue {name!r} refers to a {kind} file {cue_path}")
+                    continue
+                self.check_cue(cue_path, cue, context, call.params, path, call.line)
+
+    def check_cue(self, path, cue, context, params, site, site_line=0):
+        name = cue.name or 'inline cue'
+        key = (path, name, cue.line, context.key)
+        if key not in self._checked:
+            self._checked.add(key)
+            self.check_cue_body(path, cue, context)
+        try:
+            bound = context.binder.bind_params(cue.name, cue.params, params)
+        except ValueError as e:
+            self.report(site, site_line, 0, 'error', str(e))
+            return
+        # 選擇器依呼叫參數解析，相同參數只檢查一次
+        key = (path, name, cue.line, context.key, tuple(bound.items()))
+        if key in self._checked:
+            return
+        self._checked.add(key)
+        arrays = {}
+        for block, interval, command in cue.commands():
+            if block not in CHANNEL_TYPES or not command.text:
+                continue
+            try:
+                selector = parse_command(command.text)[0]
+                context.binder.resolve_selector(selector, bound, arrays)
+            except ValueError as e:
+                # 同一行指令的同一個錯誤只回報第一個呼叫的位置
+                key = (path, command.line, command.column, str(e))
+                if key in self._checked:
+                    continue
+                self._checked.add(key)
+                if site_line:
+                    e = f"{e} (called from {os.path.relpath(site, self.root)}:{site_line})"
+                self.command_error(path, command, str(e))
+
+    def check_cue_body(self, path, cue, context):
+        name = cue.name or 'inline cue'
+        interval = cue.interval
+        if interval is None:
+            self.report(path, cue.line, cue.column, 'error', f"Cue {name} does not declare INTERVAL")
+        others = cue.others or 'bypass'
+        if others not in OTHERS_MODES:
+            self.report(path, self.find_line(path, 'OTHERS'), 0, 'error',
+                        f"Unknown OTHERS mode {others!r} in cue {name}")
+        for block, span, command in cue.commands():
+            if block not in CHANNEL_TYPES or not command.text:
+                continue
+            text = command.text
+            try:
+                selector, channel, mode, args = parse_command(text)
+            except ValueError as e:
+                self.command_error(path, command, f"{e} in cue {name}")
+                continue
+            if interval is not None and (span.start < 1 or span.end < span.start or span.end > interval):
+                self.report(path, span.line, span.column, 'error',
+                            f"{span.key} out of range in cue {name} with INTERVAL {interval}")
+            if mode == 'value':
+                if len(args) != 1:
+                    self.command_error(path, command, f"Expected one value in command {text!r} of cue {name}")
+                elif channel == 'COLOR':
+                    color = args[0].strip('"')
+                    if color not in context.library.color_index:
+                        self.command_error(path, command, f"Unknown color {color!r} in cue {name}")
+                else:
+                    self.check_constants(path, command, name, args)
+            elif mode == 'func':
+                fname = args[0] if args else None
+                if fname not in cue.funcs and fname not in context.funcs:
+                    self.command_error(path, command, f"Undefined FUNC {fname!r} in cue {name}")
+                endpoints = split_domain(args)
+                if endpoints is not None:
+                    self.check_constants(path, command, name, endpoints)
+                elif len(args) != 1:
+                    self.command_error(path, command, f"Invalid func arguments in command {text!r} of cue {name}")
+            else:
+                self.command_error(path, command, f"Unknown command mode {mode!r} in command {text!r} of cue {name}")
+
+    def check_constants(self, path, command, name, values):
+        for value in values:
+            try:
+                resolve_constant(value)
+            except ValueError as e:
+                self.command_error(path, command, f"{e} in cue {name}")
+
+    def command_error(self, path, command, message):
+        self.report(path, command.line, command.column, 'error', message)
+
+    def check_setting(self, path, setting, library):
+        key = (path, tuple(s[0] for s in library.sources), len(library.fixture_types))
+        if key in self._checked:
+            return
+        self._checked.add(key)
+        # 有語法錯誤時部分宣告會遺失，不檢查 alias 是否宣告或 patch，避免連鎖錯誤
+        complete = path not in self.broken
+        declared = {}
+        for fixture in setting.fixtures:
+            fixture_type = fixture.fixture_type
+            if fixture_type not in library.fixture_type_index:
+                self.report(path, fixture.line, fixture.column, 'error', f"Unknown fixture type {fixture_type!r}")
+            if fixture.aliases and len(fixture.aliases) != fixture.number:
+                self.report(path, fixture.line, fixture.column, 'warning',
+                            f"FIXTURE {fixture_type} declares {fixture.number} fixtures "
+                            f"but {len(fixture.aliases)} aliases")
+            for alias in fixture.aliases:
+                if alias in declared:
+                    self.report(path, self.alias_line(path, alias, fixture), 0, 'error',
+                                f"Fixture alias {alias!r} declared more than once")
+                declared[alias] = fixture
+        widths = {alias: len(library.fixture_type(fixture.fixture_type).channels)
+                  for alias, fixture in declared.items() if fixture.fixture_type in library.fixture_type_index}
+
+        patched = set()
+        for patch in setting.patches:
+            universe = patch.universe
+            for alias in patch.aliases:
+                if complete and alias not in declared:
+                    self.report(path, self.alias_line(path, alias, patch), 0, 'error',
+                                f"Patched alias {alias!r} in universe {universe} is not a declared fixture")
+            try:
+                aliases, addresses = expand_patch(patch, widths)
+            except ValueError as e:
+                self.report(path, patch.line, patch.column, 'error', f"{e} in universe {universe}")
+                continue
+            owners = [None] * (DMX_CHANNELS + 1)
+            for alias, address in zip(aliases, addresses):
+                line = self.alias_line(path, alias, patch)
+                if alias in patched:
+                    self.report(path, line, 0, 'error', f"Fixture {alias!r} is patched more than once")
+                patched.add(alias)
+                width = widths.get(alias, 1)
+                if address < 1 or address + width - 1 > DMX_CHANNELS:
+                    self.report(path, line, 0, 'error', f"Fixture {alias!r} at {universe}/{address} with {width} "
+                                                        f"channels does not fit in {DMX_CHANNELS} channels")
+                    continue
+                overlap = {owners[a] for a in range(address, address + width) if owners[a] is not None}
+                if overlap:
+                    self.report(path, line, 0, 'error', f"Fixture {alias!r} at {universe}/{address} overlaps "
+                                                        f"{', '.join(sorted(overlap))}")
+                owners[address:address + width] = [alias] * width
+        for alias, fixture in declared.items():
+            if complete and alias not in patched:
+                self.report(path, self.alias_line(path, alias, fixture), 0, 'warning',
+                            f"Fixture {alias!r} is not patched")
+        for group in setting.groups:
+            for alias in group.aliases:
+                if complete and alias not in declared:
+                    self.report(path, group.line, group.column, 'error',
+                                f"Group {group.name} uses undeclared fixture {alias!r}")
+
+    def alias_line(self, path, alias, node):
+        # 在宣告的行範圍內找 "alias"，由範圍展開的 alias 找不到時使用宣告開頭的行
+        needle = f'"{alias}"'
+        lines = self.text(path).split('\n')[node.line - 1:node.end_line]
+        for i, line in enumerate(lines):
+            if needle in line:
+                return node.line + i
+        return node.line
+
+    def format(self, diagnostic):
+        return format_error(os.path.relpath(diagnostic.path, self.root), *diagnostic[1:])
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Check every show, setting, cue and library file in a show directory")
+    parser.add_argument('root', nargs='?', default='.', help="show directory (containing show/, show_lib/, ...)")
+    parser.add_argument('--jobs', '-j', type=int, default=None, help="parser processes (default: CPU count)")
+    parser.add_argument('--keep-logging', action='store_true', help="write the parsers' log to <script>_run.log")
+    args = parser.parse_args(argv)
+    if args.keep_logging:
+        Pylogger.logger_enable()
+
+    t0 = time.perf_counter()
+    linter = ShowDirLinter(args.root, args.jobs)
+    diagnostics = linter.run()
+    for diagnostic in diagnostics:
+        print(linter.format(diagnostic))
+    errors = sum(1 for d in diagnostics if d.severity == 'error')
+    print(f"{len(linter.files)} files checked in {time.perf_counter() - t0:.2f} s: "
+          f"{errors} errors, {len(diagnostics) - errors} warnings")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
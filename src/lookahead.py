@@ -0,0 +1,130 @@
+import time
+import threading
+from bisect import bisect_right
+from show_compiler import ShowCompiler, Timeline, tempo_sections
+from show_ir import IRBuilder
+import Pylogger
+import Pymetrics
+
+logger = Pylogger.get_logger()
+
+DEFAULT_LOOKAHEAD = 4
+POLL_INTERVAL = 0.005
+
+
+class LookaheadCompiler:
+    # 播放時才編譯：背景執行緒依 SHOW 內容順序解析、編譯 FUNC、綁定並取樣 cue
+    # 隨時維持播放位置之後有 lookahead 個 cue 已經準備好
+    # 只支援從頭往後播放，已結束的 cue 不保留在 timeline 中
+    def __init__(self, project, show_number=None, lookahead=DEFAULT_LOOKAHEAD):
+        self.project = project
+        self.compiler = ShowCompiler(project)
+        self.show = self.compiler.find_show(show_number)
+        self.show_number = self.show.number
+        self.lookahead = lookahead
+        self.builder = IRBuilder(project)
+        self.ir = self.builder.build({})
+        self.ir.timelines[self.show_number] = Timeline(self.show_number, [])
+        self.renderer = None
+
+        self.events = []  # (開始時間, 長度, instance id)，依開始時間排序
+        self.starts = []
+        # BPM 有改變的 cue (開始時間, BPM)，已結束的 cue 也保留，速度段才能從頭換算
+        self.tempo_changes = []
+        # frontier 之前開始的 cue 都已經準備好
+        self.frontier = 0.0
+        self.done = False
+        self.error = None
+        self.playhead = 0.0
+        self.misses = 0
+        self.compiled = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def attach(self, renderer):
+        if renderer.ir is not self.ir:
+            raise ValueError("Renderer was not built from this compiler's IR")
+        self.renderer = renderer
+        return renderer
+
+    def ahead(self):
+        return len(self.starts) - bisect_right(self.starts, self.playhead)
+
+    def run(self):
+        try:
+            for start, duration, instance in self.compiler.iter_events(self.show):
+                while self.ahead() >= self.lookahead and not self._stop.is_set():
+                    self._wake.wait(POLL_INTERVAL)
+                    self._wake.clear()
+                if self._stop.is_set():
+                    return
+                t0 = Pymetrics.now()
+                inst_id = self.builder.add_instance(instance)
+                Pymetrics.record('cue_bake', t0)
+                self.events.append((start, duration, inst_id))
+                self.starts.append(start)
+                if not self.tempo_changes or self.tempo_changes[-1][1] != instance.bpm:
+                    self.tempo_changes.append((start, instance.bpm))
+                self.compiled += 1
+                self.frontier = start
+                self.publish()
+        except Exception as e:
+            logger.error(f"Lookahead compile of SHOW {self.show_number} failed: {e}")
+            self.error = e
+        self.frontier = float('inf')
+        self.done = True
+        self.publish()
+        logger.info(f"Lookahead compiled {self.compiled} cues for SHOW {self.show_number}, {self.misses} misses")
+
+    def publish(self):
+        # 只保留尚未結束的 cue，timeline 的大小與 lookahead 成正比
+        playhead = self.playhead
+        events = [e for e in self.events if e[0] + e[1] > playhead or e[0] >= playhead]
+        self.events = events
+        self.starts = [e[0] for e in events]
+        timeline = Timeline(self.show_number, events, tempo_sections(self.tempo_changes, self.compiler.default_bpm))
+        if self.renderer is not None:
+            self.renderer.schedule_timeline(timeline, at=0.0)
+        else:
+            self.ir.timelines[self.show_number] = timeline
+
+    def wait_ready(self, t, first=False):
+        # 播放執行緒在 render 時間 t 之前呼叫；需要的 cue 還沒準備好時計為一次 miss 並等待
+        self.playhead = t
+        self._wake.set()
+        if t < self.frontier or self.done:
+            return True
+        if not first:
+            self.misses += 1
+            Pymetrics.count('lookahead_misses')
+            logger.warning(f"Cue needed at {t:.3f}s before lookahead compile finished")
+        while t >= self.frontier and not self.done and not self._stop.is_set():
+            time.sleep(POLL_INTERVAL / 5)
+        return not self._stop.is_set()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name='lookahead-compiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+if __name__ == "__main__":
+    import sys
+    from show_project import ShowProject
+    from show_player import ShowPlayer
+    from dmx_output import NullOutput
+    project = ShowProject(sys.argv[1] if len(sys.argv) > 1 else "../example/show250601/show/show1.tw")
+    compiler = LookaheadCompiler(project)
+    player = ShowPlayer(compiler.ir, NullOutput(compiler.ir.universes), lookahead=compiler)
+    player.run()
+    player.close()
+    print(f"Played {player.frames_rendered} frames, {compiler.compiled} cues compiled, {compiler.misses} misses")
@@ -0,0 +1,131 @@
+import json
+import time
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import Pylogger
+import Pymetrics
+
+logger = Pylogger.get_logger()
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 9464
+PREFIX = 'twiskalq'
+
+
+def prometheus_text(snap, player_stats=None):
+    # 轉成 Prometheus text exposition format
+    lines = []
+    lines.append(f'# TYPE {PREFIX}_metrics_enabled gauge')
+    lines.append(f'{PREFIX}_metrics_enabled {int(snap["enabled"])}')
+    lines.append(f'# TYPE {PREFIX}_uptime_seconds gauge')
+    lines.append(f'{PREFIX}_uptime_seconds {snap["uptime_sec"]:.6f}')
+
+    lines.append(f'# TYPE {PREFIX}_duration_seconds histogram')
+    for name, hist in snap['histograms'].items():
+        cumulative = 0
+        for bound, n in zip(Pymetrics.BUCKET_BOUNDS, hist['bucket_counts']):
+            cumulative += n
+            lines.append(f'{PREFIX}_duration_seconds_bucket{{phase="{name}",le="{bound:.6g}"}} {cumulative}')
+        lines.append(f'{PREFIX}_duration_seconds_bucket{{phase="{name}",le="+Inf"}} {hist["count"]}')
+        lines.append(f'{PREFIX}_duration_seconds_sum{{phase="{name}"}} {hist["total_sec"]:.9f}')
+        lines.append(f'{PREFIX}_duration_seconds_count{{phase="{name}"}} {hist["count"]}')
+
+    for name, value in snap['counters'].items():
+        lines.append(f'# TYPE {PREFIX}_{name}_total counter')
+        lines.append(f'{PREFIX}_{name}_total {value}')
+    gauges = dict(snap['gauges'])
+    if player_stats:
+        gauges.update(player_stats)
+    for name, value in gauges.items():
+        lines.append(f'# TYPE {PREFIX}_{name} gauge')
+        lines.append(f'{PREFIX}_{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    # 在背景執行緒提供 /metrics (Prometheus) 與 /metrics.json
+    # 只讀取 Pymetrics.snapshot() 與 player.stats()，不會取得 render loop 使用的 lock
+    def __init__(self, player=None, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self.player = player
+        self._last = None
+        self.httpd = HTTPServer((host, port), self.make_handler())
+        self.host, self.port = self.httpd.server_address[:2]
+        self._thread = None
+
+    def collect(self):
+        snap = Pymetrics.snapshot()
+        stats = self.player.stats() if self.player is not None else {}
+        if stats:
+            # 以兩次抓取間的 frame 差計算實際 fps，只有 metrics 執行緒會寫入 _last
+            now = time.monotonic()
+            frames = stats['frames_rendered']
+            if self._last is not None and now > self._last[0]:
+                stats['fps'] = (frames - self._last[1]) / (now - self._last[0])
+            else:
+                stats['fps'] = 0.0
+            self._last = (now, frames)
+            frame_time = snap['histograms'].get('frame_time')
+            if frame_time and frame_time['count']:
+                stats['render_time_per_frame_sec'] = frame_time['mean_sec']
+        return snap, stats
+
+    def make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if path in ('/metrics', '/'):
+                    snap, stats = server.collect()
+                    body = prometheus_text(snap, stats).encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif path == '/metrics.json':
+                    snap, stats = server.collect()
+                    snap['player'] = stats
+                    body = json.dumps(snap, indent=2).encode('utf-8')
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                logger.debug(f"metrics {self.address_string()} {fmt % args}")
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='metrics-server', daemon=True)
+        self._thread.start()
+        logger.info(f"Metrics endpoint on http://{self.host}:{self.port}/metrics")
+        return self
+
+    def close(self):
+        if self._thread is not None:
+            self.httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    import sys
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT
+    Pymetrics.enable()
+    with MetricsServer(port=port) as server:
+        print(f"Serving http://{server.host}:{server.port}/metrics, Ctrl-C to stop")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,111 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from frame_file import FrameFileWriter, CODECS, encode_chunk
+from renderer import FrameRenderer, DEFAULT_FPS
+import Pylogger
+
+logger = Pylogger.get_logger()
+
+DEFAULT_CHUNK_FRAMES = 256
+
+# worker process 內的 renderer，由 initializer 建立一次
+_worker_renderer = None
+
+
+def load_ir(path):
+    # .twc 直接 mmap 載入，.tw 則完整編譯
+    if path.endswith('.twc'):
+        from twc_format import load_twc
+        return load_twc(path)
+    from show_project import ShowProject
+    from show_compiler import ShowCompiler
+    from show_ir import build_ir
+    project = ShowProject(path)
+    return build_ir(project, ShowCompiler(project).compile())
+
+
+def _init_worker(source, show_number, fps):
+    global _worker_renderer
+    # source 為 .twc 路徑 (各 process 共用 page cache) 或已編譯好的 ShowIR
+    ir = load_ir(source) if isinstance(source, str) else source
+    _worker_renderer = FrameRenderer(ir, show_number, fps)
+
+
+def _render_chunk(args):
+    first, count, codec = args
+    t0 = time.perf_counter()
+    renderer = _worker_renderer
+    renderer.prime(first)
+    frames = [renderer.render(i).tobytes() for i in range(first, first + count)]
+    data = encode_chunk(frames, codec)
+    return first, count, data, time.perf_counter() - t0
+
+
+def render_show(source, out_path, show_number=None, fps=DEFAULT_FPS, workers=None,
+                codec='delta', chunk_frames=DEFAULT_CHUNK_FRAMES):
+    workers = workers or os.cpu_count() or 1
+    codec = CODECS[codec]
+    t_start = time.perf_counter()
+    if isinstance(source, str) and not source.endswith('.twc'):
+        # 只編譯一次，再把 ShowIR 傳給各 worker
+        source = load_ir(source)
+    ir = load_ir(source) if isinstance(source, str) else source
+    renderer = FrameRenderer(ir, show_number, fps)
+    frame_count = renderer.frame_count
+    jobs = [(first, min(chunk_frames, frame_count - first), codec)
+            for first in range(0, frame_count, chunk_frames)]
+    logger.info(f"Rendering SHOW {renderer.show_number}: {frame_count} frames at {fps} fps "
+                f"in {len(jobs)} chunks on {workers} workers")
+
+    busy = 0.0
+    with FrameFileWriter(out_path, ir.universes, fps, codec, chunk_frames) as writer:
+        if workers == 1:
+            _init_worker(ir, renderer.show_number, fps)
+            results = map(_render_chunk, jobs)
+            pool = None
+        else:
+            pool = ProcessPoolExecutor(workers, initializer=_init_worker,
+                                       initargs=(source, renderer.show_number, fps))
+            results = pool.map(_render_chunk, jobs)
+        try:
+            for first, count, data, elapsed in results:
+                times = [(first + i) / fps for i in range(count)]
+                writer.write_encoded_chunk(first, count, times, data)
+                busy += elapsed
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    wall = time.perf_counter() - t_start
+    stats = {
+        'show': renderer.show_number,
+        'frames': frame_count,
+        'fps': fps,
+        'workers': workers,
+        'wall_sec': wall,
+        'frames_per_sec': frame_count / wall if wall else 0.0,
+        'frames_per_sec_per_core': frame_count / busy if busy else 0.0,
+        'bytes': os.path.getsize(out_path),
+    }
+    logger.info(f"Rendered {frame_count} frames in {wall:.3f}s, "
+                f"{stats['frames_per_sec_per_core']:.1f} frames/sec per core")
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Render a show to a DMX frame file")
+    parser.add_argument('show', help=".tw show file or compiled .twc")
+    parser.add_argument('out', nargs='?', help="output frame file (default: <show>.twf)")
+    parser.add_argument('--show-number', type=int, default=None)
+    parser.add_argument('--fps', type=float, default=DEFAULT_FPS)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--codec', choices=sorted(CODECS), default='delta')
+    parser.add_argument('--chunk-frames', type=int, default=DEFAULT_CHUNK_FRAMES)
+    args = parser.parse_args()
+    out = args.out or os.path.splitext(args.show)[0] + '.twf'
+    stats = render_show(args.show, out, args.show_number, args.fps, args.workers, args.codec, args.chunk_frames)
+    print(f"{stats['frames']} frames -> {out} ({stats['bytes']} bytes)")
+    print(f"{stats['wall_sec']:.3f}s wall, {stats['frames_per_sec']:.1f} frames/sec, "
+          f"{stats['frames_per_sec_per_core']:.1f} frames/sec per core on {stats['workers']} workers")
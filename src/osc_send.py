@@ -0,0 +1,103 @@
+import sys
+import time
+import socket
+import statistics
+from trigger_input import encode_osc, DEFAULT_HOST, DEFAULT_PORT
+
+ARTNET_PORT = 6454
+ARTNET_DATA_OFFSET = 18
+
+
+def parse_arg(text):
+    # 數字以 int / float 傳送，其餘為字串
+    for kind in (int, float):
+        try:
+            return kind(text)
+        except ValueError:
+            pass
+    return text
+
+
+def wait_for_change(sock, last, timeout):
+    # 等待第一個內容與上一個 frame 不同的 ArtDMX 封包，回傳收到的時間
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        sock.settimeout(remaining)
+        try:
+            packet = sock.recv(1024)
+        except socket.timeout:
+            return None
+        now = time.monotonic()
+        universe = packet[14:16]
+        data = packet[ARTNET_DATA_OFFSET:]
+        changed = universe in last and last[universe] != data
+        last[universe] = data
+        if changed:
+            return now
+
+
+def measure(sock, target, names, count, artnet_port, gap):
+    # 端對端延遲：送出 /cue 到第一個改變的 Art-Net frame 到達
+    # 播放端需以 --live 播放並輸出 Art-Net 到這台機器，例如 --artnet 127.0.0.1
+    listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('', artnet_port))
+    last = {}
+    latencies = []
+    for i in range(count):
+        # 先讓輸出穩定，只保留最新的 frame
+        time.sleep(gap)
+        listener.setblocking(False)
+        try:
+            while True:
+                packet = listener.recv(1024)
+                last[packet[14:16]] = packet[ARTNET_DATA_OFFSET:]
+        except BlockingIOError:
+            pass
+        listener.setblocking(True)
+        name = names[i % len(names)]
+        sent = time.monotonic()
+        sock.sendto(encode_osc('/cue', name), target)
+        arrived = wait_for_change(listener, last, 1.0)
+        if arrived is None:
+            print(f"{name}: no frame change within 1 s")
+            continue
+        latencies.append(arrived - sent)
+        print(f"{name}: {(arrived - sent) * 1000:.2f} ms")
+    listener.close()
+    if latencies:
+        latencies.sort()
+        print(f"{len(latencies)} triggers: median {statistics.median(latencies) * 1000:.2f} ms, "
+              f"max {latencies[-1] * 1000:.2f} ms")
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Send OSC trigger messages to a playing show")
+    parser.add_argument('address', help="OSC address, e.g. /cue, /bpm, /release")
+    parser.add_argument('args', nargs='*', help="message arguments, e.g. a cue name or BPM")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--measure', type=int, default=0, metavar='N',
+                        help="send N /cue triggers and measure the latency to the first changed Art-Net frame")
+    parser.add_argument('--artnet-port', type=int, default=ARTNET_PORT)
+    parser.add_argument('--gap', type=float, default=0.5, help="seconds between measured triggers")
+    args = parser.parse_args(argv)
+
+    target = (args.host, args.port)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if args.measure:
+        if args.address != '/cue' or not args.args:
+            parser.error("--measure needs /cue and at least one cue name")
+        measure(sock, target, args.args, args.measure, args.artnet_port, args.gap)
+    else:
+        sock.sendto(encode_osc(args.address, *[parse_arg(a) for a in args.args]), target)
+    sock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+from array import array
+from collections import namedtuple
+import Pylogger
+
+logger = Pylogger.get_logger()
+
+# Lexer 產生的 token 種類與關鍵字，轉成整數代碼後比對
+TOKEN_TYPES = (
+    'EOF', 'UNKNOWN',
+    'NUMBER', 'ID', 'OP', 'DOT', 'COLON', 'LBRACE', 'RBRACE', 'LSQUARE', 'RSQUARE',
+    'COMMA', 'LT', 'GT', 'LPAREN', 'RPAREN', 'STRING', 'NEWLINE', 'COMMENT',
+    'CUE', 'IN', 'FUNC', 'INTERVAL', 'DIMMER', 'COLOR', 'STROBE', 'OTHERS', 'START', 'END',
+    'VALUE', 'FROM', 'TO', 'SETTING', 'PLAYBACK', 'SHOW', 'WAIT', 'LIBS', 'FIXTURE', 'PATCH', 'GROUP',
+)
+TOKEN_IDS = {name: i for i, name in enumerate(TOKEN_TYPES)}
+(T_EOF, T_UNKNOWN,
+ T_NUMBER, T_ID, T_OP, T_DOT, T_COLON, T_LBRACE, T_RBRACE, T_LSQUARE, T_RSQUARE,
+ T_COMMA, T_LT, T_GT, T_LPAREN, T_RPAREN, T_STRING, T_NEWLINE, T_COMMENT,
+ T_CUE, T_IN, T_FUNC, T_INTERVAL, T_DIMMER, T_COLOR, T_STROBE, T_OTHERS, T_START, T_END,
+ T_VALUE, T_FROM, T_TO, T_SETTING, T_PLAYBACK, T_SHOW, T_WAIT, T_LIBS, T_FIXTURE, T_PATCH, T_GROUP,
+ ) = range(len(TOKEN_TYPES))
+
+# 可恢復模式下記錄的語法錯誤
+ParseError = namedtuple('ParseError', ['line', 'column', 'message'])
+
+
+def token_ids(tokens):
+    ids = TOKEN_IDS
+    get = ids.get
+    # 最後多放一個 EOF，peek 不需要檢查邊界
+    return array('B', [get(t[0], T_UNKNOWN) for t in tokens] + [T_EOF, T_EOF])
+
+
+class ParserCore:
+    # 三個 parser 共用：token 種類預先轉成整數陣列，consume 只做必要的比對
+    # trace_level 為逐 token 記錄的日誌等級名稱，只在該等級啟用時才格式化訊息
+    trace_level = None
+
+    def __init__(self, tokens, pos=0, types=None, errors=None):
+        self.tokens = tokens
+        # 內嵌解析時可直接共用外層 parser 的 types
+        self.types = types if types is not None else token_ids(tokens)
+        self.pos = pos
+        # errors 為 list 時錯誤不直接拋出，記錄後跳到同步點繼續解析
+        self.errors = errors
+        self.recovered = -1
+        self.trace = bool(self.trace_level) and logger.isEnabledFor(Pylogger.Levels[self.trace_level])
+
+    def current_token(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return None
+
+    def peek(self, offset=0):
+        return self.types[self.pos + offset] if self.pos + offset < len(self.types) else T_EOF
+
+    def consume(self, expected=None, expected_value=None):
+        pos = self.pos
+        tid = self.types[pos]
+        if tid == T_EOF:
+            logger.error(f"Unexpected end of input at pos {pos}")
+            raise ValueError("Unexpected end of input")
+        token = self.tokens[pos]
+        if expected is not None and tid != expected:
+            raise self.expected_error(TOKEN_TYPES[expected], token)
+        if expected_value is not None and token[1] != expected_value:
+            raise self.expected_error(expected_value, token, token[1])
+        if self.trace:
+            logger.log(Pylogger.Levels[self.trace_level], "\t\t\t Consume (%r,%r) at pos %d", token[0], token[1], pos)
+        self.pos = pos + 1
+        return token
+
+    def accept(self, expected, expected_value=None):
+        # 目前的 token 符合時吃掉並回傳，否則回傳 None
+        pos = self.pos
+        if self.types[pos] != expected:
+            return None
+        token = self.tokens[pos]
+        if expected_value is not None and token[1] != expected_value:
+            return None
+        self.pos = pos + 1
+        return token
+
+    def skip(self, tid):
+        pos = self.pos
+        types = self.types
+        while types[pos] == tid:
+            pos += 1
+        self.pos = pos
+
+    def expected_error(self, expected, token, got=None):
+        got = token.type if got is None else got
+        message = f"Expected {expected} but got {got} at line {token.line}, column {token.column}"
+        logger.error(message)
+        return ValueError(message)
+
+    def unexpected(self, token, where=''):
+        if token is None:
+            message = f"Unexpected end of input{where}"
+        else:
+            message = f"Unexpected token {token.type}{where} at line {token.line}, column {token.column}"
+        logger.error(message)
+        return ValueError(message)
+
+    def span(self, start):
+        # 從 start 到目前位置之前的 token 的來源範圍 (開始行, 開始列, 結束行)，傳給語法節點
+        tokens = self.tokens
+        first = tokens[start]
+        last = tokens[max(start, min(self.pos, len(tokens)) - 1)]
+        return first.line, first.column, last.line
+
+    def comma_list(self, expected):
+        # a, b, c 形式的列表
+        values = [self.consume(expected)[1]]
+        while self.accept(T_COMMA):
+            values.append(self.consume(expected)[1])
+        return values
+
+    def recover(self, error, start, restart, close=None):
+        # 由各 parser 的敘述迴圈在 except 中呼叫，start 為出錯敘述的開頭
+        # 緊接在上一次恢復位置之後 (中間只有換行) 的錯誤通常是連鎖錯誤，不再記錄
+        # 恢復時以配對的括號或結尾關鍵字結束了出錯的敘述時，下一個敘述重新開始，其中的錯誤是獨立的錯誤
+        # (例如下一個區塊中的另一個錯誤)；連鎖錯誤之後的錯誤也視為同一串連鎖錯誤
+        types = self.types
+        chained = 0 <= self.recovered <= start and all(types[i] == T_NEWLINE for i in range(self.recovered, start))
+        if not chained:
+            token = self.tokens[min(self.pos, len(self.tokens) - 1)] if self.tokens else None
+            line, column = (token.line, token.column) if token is not None else (0, 0)
+            self.errors.append(ParseError(line, column, str(error)))
+        closed = self.synchronize(start, restart, close)
+        self.recovered = self.pos if chained or not closed else -1
+
+    def synchronize(self, start, restart, close=None):
+        # 從敘述開頭重新掃描：括號配對結束、遇到 restart 中的敘述開頭或 CUE END / SHOW END 時停止
+        # close 為該敘述自己的結尾關鍵字 (例如 show 中的 CUE ... CUE END)，一併吃掉
+        # 回傳是否以配對的括號或 close 結束了敘述
+        types = self.types
+        pos = start
+        depth = 0
+        closed = False
+        while True:
+            tid = types[pos]
+            if tid == T_EOF:
+                break
+            if tid == T_LBRACE:
+                depth += 1
+            elif tid == T_RBRACE:
+                depth -= 1
+                if depth <= 0:
+                    pos += 1
+                    closed = depth == 0
+                    if close is not None and types[pos] == close and types[pos + 1] == T_END:
+                        pos += 2
+                    break
+            elif depth == 0 and pos > start:
+                if tid == close and types[pos + 1] == T_END:
+                    pos += 2
+                    closed = True
+                    break
+                if tid in restart or (tid in (T_CUE, T_SHOW) and types[pos + 1] == T_END):
+                    break
+            pos += 1
+        self.pos = max(pos, start + 1) if types[start] != T_EOF else start
+        return closed
@@ -0,0 +1,357 @@
+import math
+from collections import deque
+import numpy as np
+from show_ir import CH_DIMMER, CH_COLOR, CH_STROBE, MODE_FUNC, lut_lookup
+from cue_instance import OTHERS_MODES
+from frame_file import UNIVERSE_SIZE
+from fixture_kernels import ATTRS, A_DIMMER, A_R, A_WHITE, A_STROBE, RigKernel
+from tempo_map import TempoMap
+from sweep import SweepCache
+import Pylogger
+import Pymetrics
+
+logger = Pylogger.get_logger()
+
+DEFAULT_FPS = 40.0
+# warm 預先計算 FUNC 取值的範圍 (秒)，之後的事件在第一次播放時計算
+WARM_SEC = 5.0
+
+OTHERS_OFF = OTHERS_MODES.index('off')
+OTHERS_FULL = OTHERS_MODES.index('full')
+
+# 指令通道寫入的屬性
+CHANNEL_ATTRS = {
+    CH_DIMMER: (A_DIMMER,),
+    CH_COLOR: tuple(range(A_R, A_WHITE + 1)),
+    CH_STROBE: (A_STROBE,),
+}
+
+
+class RenderCache:
+    # 只與 IR 有關的 render 資料，同一份 IR 的多個 FrameRenderer (例如同時播放多個 SHOW) 可以共用
+    # kernel 為燈具通道配置，prepared / baked 為整理好的指令，fixture_arrays 為燈具陣列
+    def __init__(self, ir):
+        self.ir = ir
+        self.kernel = RigKernel(ir)
+        self.prepared = {}
+        self.baked = {}
+        self.fixture_arrays = {}
+
+
+class FrameRenderer:
+    def __init__(self, ir, show_number=None, fps=DEFAULT_FPS, cache=None):
+        # cache 為 RenderCache，未給時自己建立一個
+        if cache is None:
+            cache = RenderCache(ir)
+        elif cache.ir is not ir:
+            raise ValueError("RenderCache belongs to a different show IR")
+        self.ir = ir
+        if show_number is None:
+            show_number = min(ir.timelines) if ir.timelines else None
+        if show_number not in ir.timelines:
+            raise ValueError(f"SHOW {show_number} not found, available: {sorted(ir.timelines)}")
+        self.show_number = show_number
+        self.fps = fps
+        # timeline 與指令皆以 score 時間表示，播放時間經過 tempo 換算，改變速度不需要重新編譯
+        self.tempo = TempoMap()
+        # timeline 上 FUNC 指令每個 frame 的值，依 fps 與速度預先算好
+        self.sweeps = SweepCache(ir, fps, self.tempo)
+        self.set_timeline(ir.timelines[show_number])
+        self._pending = None
+        self.last_t = 0.0
+        self.attrs = np.zeros((ir.fixture_count, len(ATTRS)), dtype=np.float32)
+        self.values = self.attrs.reshape(-1)
+        self.frame = np.zeros(len(ir.universes) * UNIVERSE_SIZE, dtype=np.uint8)
+        # 每個 frame 依序記錄寫入 (token, slots)：slots 為寫入的 (燈具, 屬性) 對應的輸出通道位置
+        # token 相同代表寫入相同的值；與上一個 frame 比較後只重算有增減的寫入涵蓋的通道，其餘沿用上一個 frame
+        # 寫入的先後順序改變時 (LTP 的結果可能不同) 重算全部通道
+        # _full 為 True 時 (第一個 frame、換 timeline、prime 之後) 重算全部通道
+        self._writes = []
+        self._last_writes = []
+        self._full = True
+        # 上一次 write_frame 有改變的 universe，輸出裝置可以只送出這些 universe
+        self.dirty_universes = np.ones(len(ir.universes), dtype=bool)
+        self.changed_channels = 0
+        self._prepared = cache.prepared
+        # 整理好的指令以 (指令範圍, INTERVAL 長度, 數量, OTHERS) 共用，燈具陣列以燈具範圍共用
+        self._baked = cache.baked
+        self._fixture_arrays = cache.fixture_arrays
+        self.active_count = 0
+        # 現場觸發的 cue：其他執行緒放入 _triggers，render 執行緒在 apply 時取出
+        # live 為 (開始時間, 結束時間, instance)，疊在 timeline 之上 (LTP)
+        self._triggers = deque()
+        self.live = []
+        self.fired = []
+        # 各燈具類型的通道配置合併成一個 kernel，屬性值經由它寫入 frame
+        self.kernel = cache.kernel
+
+    def set_timeline(self, timeline):
+        # 換上新的 timeline 時 cue 的套用順序可能改變，下一個 frame 重算全部通道
+        self.timeline = timeline
+        self._full = True
+        self.tempo.set_sections(getattr(timeline, 'tempo', None))
+        self.update_frame_count()
+
+    def update_frame_count(self):
+        # 速度改變後 timeline 結束的實際時間也跟著改變
+        self._tempo_version = self.tempo.version
+        self.sweeps.clear()
+        end = self.tempo.time_at(self.timeline.duration)
+        if not math.isinf(end):
+            self.frame_count = int(math.ceil(end * self.fps))
+
+    def schedule_timeline(self, timeline, at=None):
+        # 由其他執行緒呼叫：在目前 cue 的下一個 INTERVAL 邊界換上新的 timeline，at 指定時直接使用該時間
+        # 只寫入一個 tuple，render 執行緒在 apply 時取用，不需要 lock
+        if at is not None:
+            self._pending = (timeline, at)
+            return at
+        t = self.last_t
+        at = t
+        current = self.timeline
+        active = current.active_indices(t)
+        if active:
+            j = max(active, key=lambda k: current.starts[k])
+            s = current.starts[j]
+            isec = self.ir.inst_interval_sec[current.instances[j]]
+            at = s + math.ceil((t - s) / isec - 1e-9) * isec
+        self._pending = (timeline, at)
+        return at
+
+    def swap_pending(self, t):
+        # score 時間 t 已到 schedule_timeline 指定的時間時換上新的 timeline
+        # 由 render 執行緒呼叫：apply 時，以及播放器判斷 show 是否結束之前 (frame_count 跟著新的 timeline)
+        pending = self._pending
+        if pending is not None and t >= pending[1]:
+            self._pending = None
+            self.set_timeline(pending[0])
+            self.ir.timelines[self.show_number] = pending[0]
+
+    def trigger(self, inst, received=None):
+        # 由其他執行緒呼叫，cue 從下一次 apply 的時間開始；received 為收到觸發的 time.monotonic()
+        self._triggers.append((inst, received))
+
+    def release(self):
+        self._triggers.append((None, None))
+
+    def start_triggers(self, t):
+        fired = []
+        ir = self.ir
+        while self._triggers:
+            inst, received = self._triggers.popleft()
+            if inst is None:
+                self.live = []
+                continue
+            self.live.append((t, t + ir.inst_interval_sec[inst] * ir.inst_interval_count[inst], inst))
+            if received is not None:
+                fired.append(received)
+        self.fired = fired
+
+    def prepare(self, inst):
+        # 每個 cue instance 只整理一次指令資料
+        prepared = self._prepared.get(inst)
+        if prepared is not None:
+            return prepared
+        ir = self.ir
+        isec = ir.inst_interval_sec[inst]
+        c0 = ir.inst_cmd_offset[inst]
+        key = (c0, ir.inst_cmd_count[inst], isec, ir.inst_interval_count[inst], ir.inst_others[inst])
+        prepared = self._baked.get(key)
+        if prepared is not None:
+            self._prepared[inst] = prepared
+            return prepared
+        commands = []
+        kernel = self.kernel
+        mask = np.zeros(self.attrs.shape, dtype=bool)
+        used = []
+        for c in range(c0, c0 + ir.inst_cmd_count[inst]):
+            fixtures = self.fixture_array(ir.cmd_fix_offset[c], ir.cmd_fix_count[c])
+            channel = ir.cmd_channel[c]
+            attrs = CHANNEL_ATTRS[channel]
+            # 依燈具類型的能力只寫入有輸出通道的屬性，例如 COLOR 對 FOG 不寫入任何值
+            all_keys = self.attr_keys(fixtures, attrs)
+            keys = kernel.output_keys(all_keys)
+            start, end = ir.cmd_start[c], ir.cmd_end[c]
+            if channel == CH_COLOR:
+                color = int(ir.cmd_value[c])
+                value = np.array(ir.color_values[color * 5:color * 5 + 5], dtype=np.float32)
+                value = value[keys % len(ATTRS) - A_R]
+            else:
+                # 屬性值限制在 0~255，kernel 輸出時不需要再檢查
+                value = min(max(float(ir.cmd_value[c]), 0.0), 255.0)
+            lut = ir.cmd_lut[c] if ir.cmd_mode[c] == MODE_FUNC else -1
+            commands.append((start, end, (start - 1) * isec, (end - start + 1) * isec,
+                             keys, value, lut, kernel.slots(keys)))
+            mask[fixtures] = True
+            used.append(all_keys)
+        others = None
+        mode = ir.inst_others[inst]
+        if mode in (OTHERS_OFF, OTHERS_FULL) and mask.any():
+            mask = mask.reshape(-1)
+            for keys in used:
+                mask[keys] = False
+            keys = kernel.output_keys(np.flatnonzero(mask))
+            others = (keys, 0.0 if mode == OTHERS_OFF else 255.0, kernel.slots(keys))
+        prepared = (isec, ir.inst_interval_count[inst], commands, others)
+        self._prepared[inst] = self._baked[key] = prepared
+        return prepared
+
+    def warm(self, start=0.0):
+        # 播放前先整理 timeline 上所有 cue 的指令，播放中第一次出現的 cue 不會讓 frame 延遲
+        # FUNC 的值只先算從播放時間 start 起 WARM_SEC 秒內的事件，整個 show 的值不會同時留在記憶體中
+        timeline = self.timeline
+        for inst in set(timeline.instances):
+            self.prepare(inst)
+        t0 = self.tempo.position(start)
+        t1 = self.tempo.position(start + WARM_SEC)
+        for j in timeline.events_between(0.0, t1):
+            if timeline.ends[j] > t0:
+                inst = timeline.instances[j]
+                self.sweeps.event(inst, timeline.starts[j], self.prepare(inst), timeline.ends[j])
+
+    def attr_keys(self, fixtures, attrs):
+        # (燈具, 屬性) -> 攤平後的屬性索引
+        return (fixtures[:, None] * len(ATTRS) + np.array(attrs, dtype=np.intp)).ravel()
+
+    def fixture_array(self, f0, count):
+        fixtures = self._fixture_arrays.get((f0, count))
+        if fixtures is None:
+            fixtures = np.array(self.ir.cmd_fixtures[f0:f0 + count], dtype=np.intp)
+            self._fixture_arrays[(f0, count)] = fixtures
+        return fixtures
+
+    def apply_instance(self, inst, local_t, sweep=None, frame=0):
+        # sweep 為 SweepCache.event 的結果，frame 在其範圍內時 FUNC 指令直接取用預先算好的值
+        isec, interval_count, commands, others = self.prepare(inst)
+        interval = int(local_t / isec) + 1
+        if interval < 1 or interval > interval_count:
+            return
+        values = self.values
+        writes = self._writes
+        if others is not None:
+            values[others[0]] = others[1]
+            writes.append((id(others[2]), others[2]))
+        if sweep is not None:
+            k = frame - sweep[0]
+            sweep = sweep[1]
+        for c, (start, end, t0, span, keys, value, lut, slots) in enumerate(commands):
+            if interval < start or interval > end:
+                continue
+            if lut >= 0:
+                if sweep is not None and 0 <= k < len(sweep[c]):
+                    v = sweep[c][k]
+                else:
+                    v = min(max(lut_lookup(self.ir, lut, (local_t - t0) / span) * 255.0, 0.0), 255.0)
+                values[keys] = v
+                writes.append(((id(slots), v), slots))
+                continue
+            # 固定值的指令每個 frame 寫入相同的值，以 slots 的 id 當作 token
+            writes.append((id(slots), slots))
+            values[keys] = value
+
+    def apply(self, t, frame=None):
+        # t 為播放時間，以下皆使用換算後的 score 時間
+        # frame 為 t 對應的 frame 索引 (t = frame / fps)，觸發時的額外 frame 沒有索引，FUNC 指令逐一計算
+        t0 = Pymetrics.now()
+        tempo = self.tempo
+        if tempo.version != self._tempo_version:
+            self.update_frame_count()
+        t = tempo.position(t)
+        self.swap_pending(t)
+        self.last_t = t
+        timeline = self.timeline
+        active = timeline.active_indices(t)
+        sweeps = self.sweeps if frame is not None else None
+        if sweeps is not None:
+            sweeps.evict(t)
+        for j in sorted(active):
+            inst, s = timeline.instances[j], timeline.starts[j]
+            if sweeps is None:
+                self.apply_instance(inst, t - s)
+            else:
+                self.apply_instance(inst, t - s, sweeps.event(inst, s, self.prepare(inst), timeline.ends[j]), frame)
+        if self._triggers:
+            self.start_triggers(t)
+        elif self.fired:
+            self.fired = []
+        if self.live:
+            self.live = [cue for cue in self.live if cue[1] > t]
+            for start, end, inst in self.live:
+                self.apply_instance(inst, t - start)
+        self.active_count = len(active) + len(self.live)
+        Pymetrics.record('render', t0)
+
+    def write_frame(self):
+        # 只重算寫入與上一個 frame 不同的通道，並記錄有改變的 universe
+        t0 = Pymetrics.now()
+        writes, last = self._writes, self._last_writes
+        self._writes, self._last_writes = [], writes
+        dirty = self.dirty_universes
+        dirty[:] = False
+        if self._full:
+            self._full = False
+            slots = slice(None)
+            dirty[:] = True
+        else:
+            # 有增減的寫入重算它涵蓋的通道；其餘寫入的先後順序改變時 (例如兩個 cue 交替)，
+            # LTP 的結果可能改變，直接重算全部通道
+            counts = {}
+            for token, slots in writes:
+                counts[token] = counts.get(token, 0) + 1
+            for token, slots in last:
+                counts[token] = counts.get(token, 0) - 1
+            changed = [slots for token, slots in writes if counts[token]]
+            changed += [slots for token, slots in last if counts[token]]
+            reordered = ([token for token, slots in writes if not counts[token]] !=
+                         [token for token, slots in last if not counts[token]])
+            if not changed and not reordered:
+                self.changed_channels = 0
+                Pymetrics.record('merge', t0)
+                return self.frame
+            # 重複的通道不需要去除，重算兩次的結果相同；要重算的數量超過整個 frame 時直接全部重算
+            if reordered or sum(map(len, changed)) >= len(self.kernel.index):
+                slots = slice(None)
+            else:
+                slots = np.concatenate(changed) if len(changed) > 1 else changed[0]
+        changed = self.kernel.write(self.values, self.frame, slots)
+        dirty[changed // UNIVERSE_SIZE] = True
+        # 同一個 frame 重複寫入的通道會計算兩次
+        self.changed_channels = len(changed)
+        Pymetrics.record('merge', t0)
+        return self.frame
+
+    def render(self, frame_index):
+        self.apply(frame_index / self.fps, frame_index)
+        return self.write_frame()
+
+    def prime(self, frame_index):
+        # 從中間開始算時，bypass 會保留之前的值
+        # 只需依序重算每個 cue 與每個指令在 frame_index 之前的最後一個 frame，就能得到相同的狀態
+        timeline = self.timeline
+        fps = self.fps
+        t_end = frame_index / fps
+        frames = set()
+        for j in range(timeline.seek(t_end)):
+            s = timeline.starts[j]
+            first = math.ceil(s * fps)
+            last = min(frame_index - 1, math.ceil(timeline.ends[j] * fps) - 1)
+            if last < first:
+                continue
+            frames.add(last)
+            inst = timeline.instances[j]
+            isec = self.prepare(inst)[0]
+            for start, end, t0, span, keys, value, lut, slots in self.prepare(inst)[2]:
+                cmd_last = min(last, math.ceil((s + t0 + span) * fps) - 1)
+                # 以與 apply_instance 相同的方式判斷 INTERVAL，避免邊界上的浮點誤差
+                while cmd_last >= first and int((cmd_last / fps - s) / isec) + 1 > end:
+                    cmd_last -= 1
+                while cmd_last < last and int(((cmd_last + 1) / fps - s) / isec) + 1 <= end:
+                    cmd_last += 1
+                if cmd_last >= first and int((cmd_last / fps - s) / isec) + 1 >= start:
+                    frames.add(cmd_last)
+        self.attrs[:] = 0.0
+        for f in sorted(frames):
+            self.apply(f / fps, f)
+        self._writes = []
+        self._last_writes = []
+        self._full = True
@@ -1,152 +1,175 @@
+import re
+from array import array
+from itertools import accumulate
 from collections import namedtuple
+from ast_nodes import Setting, Fixture, Patch, Group
+from parser_core import (ParserCore, T_EOF, T_ID, T_OP, T_COLON, T_LBRACE, T_RBRACE, T_LSQUARE, T_RSQUARE,
+                         T_COMMA, T_LT, T_GT, T_NUMBER, T_STRING, T_LIBS, T_FIXTURE, T_PATCH, T_GROUP)
 
 Token = namedtuple('Token', ['type', 'value', 'line', 'column'])
 
-class SettingParser:
-    def __init__(self, tokens):
-        self.tokens = tokens
-        self.pos = 0
-
-    def current_token(self):
-        if self.pos < len(self.tokens):
-            return self.tokens[self.pos]
-        return None
-
-    def consume(self, expected_type=None):
-        token = self.current_token()
-        if not token:
-            raise ValueError("Unexpected end of input")
-        if expected_type and token.type != expected_type:
-            raise ValueError(f"Expected {expected_type} but got {token.type} at line {token.line}")
-        self.pos += 1
-        return token
-
+# alias 範圍："PAR{1-64}" 展開為 PAR1 ... PAR64，"PAR{01-64}" 補零為 PAR01 ... PAR64
+_alias_range_re = re.compile(r'\{(\d+)-(\d+)\}')
+
+
+def expand_aliases(text):
+    m = _alias_range_re.search(text)
+    if m is None:
+        return [text]
+    first, last = m.group(1), m.group(2)
+    a, b = int(first), int(last)
+    if b < a:
+        raise ValueError(f"Invalid alias range {text!r}")
+    prefix, suffix = text[:m.start()], text[m.end():]
+    width = len(first) if first.startswith('0') and len(first) > 1 else 0
+    return [f"{prefix}{i:0{width}d}{suffix}" for i in range(a, b + 1)]
+
+
+def expand_patch(patch, widths=None):
+    # 將 PATCH 的 run 展開成 (aliases, addresses)
+    # stride 為 0 的 run 依燈具的通道數連續排列，widths 為 alias -> 通道數
+    addresses = array('H')
+    offset = 0
+    aliases = patch.aliases
+    for count, start, stride in zip(patch.run_count, patch.run_start, patch.run_stride):
+        run = aliases[offset:offset + count]
+        if stride or count == 1:
+            addresses.extend(range(start, start + stride * count, stride) if stride else (start,))
+        else:
+            if widths is None:
+                raise ValueError(f"Patch range starting at {run[0]!r} needs fixture channel counts")
+            try:
+                steps = [widths[alias] for alias in run[:-1]]
+            except KeyError as e:
+                raise ValueError(f"Cannot auto-patch unknown fixture {e.args[0]!r}")
+            addresses.extend(accumulate(steps, initial=start))
+        offset += count
+    return aliases, addresses
+
+
+class SettingParser(ParserCore):
     def parse(self):
-        result = {
-            "LIBS": [],
-            "FIXTURES": [],
-            "PATCHES": [],
-            "GROUPS": []
-        }
-        while self.current_token():
-            token = self.current_token()
-            if token.type == 'LIBS':
-                result['LIBS'] = self.parse_libs()
-            elif token.type == 'FIXTURE':
-                result['FIXTURES'].append(self.parse_fixture())
-            elif token.type == 'PATCH':
-                result['PATCHES'].extend(self.parse_patch())
-            elif token.type == 'GROUP':
-                result['GROUPS'].append(self.parse_group())
-            else:
-                raise ValueError(f"Unexpected token {token.type} at line {token.line}")
+        result = Setting()
+        types = self.types
+        handlers = self.HANDLERS
+        while True:
+            tid = types[self.pos]
+            if tid == T_EOF:
+                break
+            start = self.pos
+            try:
+                handler = handlers.get(tid)
+                if handler is None:
+                    raise self.unexpected(self.tokens[start])
+                handler(self, result)
+            except ValueError as e:
+                if self.errors is None:
+                    raise
+                self.recover(e, start, STARTS)
         return result
 
+    def top_libs(self, result):
+        result.libs = self.parse_libs()
+
+    def top_fixture(self, result):
+        result.fixtures.append(self.parse_fixture())
+
+    def top_patch(self, result):
+        result.patches.extend(self.parse_patch())
+
+    def top_group(self, result):
+        result.groups.append(self.parse_group())
+
     def parse_libs(self):
-        self.consume('LIBS')
-        self.consume('LSQUARE')
-        libs = []
-        while True:
-            token = self.consume('STRING')
-            libs.append(token.value.strip('"'))
-            if self.current_token() and self.current_token().type == 'COMMA':
-                self.consume('COMMA')
-            else:
-                break
-        self.consume('RSQUARE')
+        self.consume(T_LIBS)
+        self.consume(T_LSQUARE)
+        libs = [value.strip('"') for value in self.comma_list(T_STRING)]
+        self.consume(T_RSQUARE)
         return libs
 
-    def parse_fixture(self):
-        self.consume('FIXTURE')
-        fixture_type = self.consume('ID').value
-        number = int(self.consume('NUMBER').value)
+    def parse_alias_list(self):
+        # ["A","B","PAR{1-64}"]，字串可以是 alias 範圍
         aliases = []
-        if self.current_token() and self.current_token().type == 'LSQUARE':
-            self.consume('LSQUARE')
-            while True:
-                token = self.consume('STRING')
-                aliases.append(token.value.strip('"'))
-                if self.current_token() and self.current_token().type == 'COMMA':
-                    self.consume('COMMA')
-                else:
-                    break
-            self.consume('RSQUARE')
-        return {
-            "fixture_type": fixture_type,
-            "number": number,
-            "aliases": aliases
-        }
+        if self.accept(T_LSQUARE):
+            for value in self.comma_list(T_STRING):
+                aliases.extend(expand_aliases(value.strip('"')))
+            self.consume(T_RSQUARE)
+        return aliases
+
+    def parse_fixture(self):
+        start = self.pos
+        self.consume(T_FIXTURE)
+        fixture_type = self.consume(T_ID).value
+        number = int(self.consume(T_NUMBER).value)
+        aliases = self.parse_alias_list()
+        return Fixture(fixture_type, number, aliases, *self.span(start))
+
+    def parse_key(self, key):
+        token = self.consume(T_STRING)
+        if token.value.strip('"') != key:
+            raise ValueError(f"Expected '{key}' key at line {token.line}")
+        self.consume(T_COLON)
 
     def parse_patch(self):
-        self.consume('PATCH')
-        self.consume('LBRACE')
+        self.consume(T_PATCH)
+        self.consume(T_LBRACE)
         patches = []
-        while self.current_token() and self.current_token().type == 'LBRACE':
-            self.consume('LBRACE')
-            universe_token = self.consume('STRING')
-            if universe_token.value.strip('"') != "UNIVERSE":
-                raise ValueError(f"Expected 'UNIVERSE' key at line {universe_token.line}")
-            self.consume('COLON')
-            universe_name = self.consume('STRING').value.strip('"')
-            self.consume('COMMA')
-
-            patches_token = self.consume('STRING')
-            if patches_token.value.strip('"') != "PATCHES":
-                raise ValueError(f"Expected 'PATCHES' key at line {patches_token.line}")
-            self.consume('COLON')
-            self.consume('LBRACE')
-            patch_dict = {}
-            while self.current_token() and self.current_token().type == 'STRING':
-                alias = self.consume('STRING').value.strip('"')
-                self.consume('COLON')
-                addr = int(self.consume('NUMBER').value)
-                if self.current_token() and self.current_token().type == 'COMMA':
-                    self.consume('COMMA')
-                patch_dict[alias] = addr
-            self.consume('RBRACE')
-            self.consume('RBRACE')
-            patches.append({"UNIVERSE": universe_name, "PATCHES": patch_dict})
+        types = self.types
+        while types[self.pos] == T_LBRACE:
+            start = self.pos
+            self.pos += 1
+            self.parse_key("UNIVERSE")
+            universe_name = self.consume(T_STRING).value.strip('"')
+            self.consume(T_COMMA)
+            self.parse_key("PATCHES")
+            self.consume(T_LBRACE)
+            # 以 run 儲存：每個 run 為連續的 alias、起始位址與間隔
+            # "A": 1 為單一燈具；"PAR{1-64}": 1 依通道數自動排列；"PAR{1-64}": 1 + 10 為固定間隔
+            aliases = []
+            run_count, run_start, run_stride = array('I'), array('H'), array('H')
+            while types[self.pos] == T_STRING:
+                names = expand_aliases(self.consume().value.strip('"'))
+                self.consume(T_COLON)
+                addr = int(self.consume(T_NUMBER).value)
+                stride = 0
+                if self.accept(T_OP, '+'):
+                    stride = int(self.consume(T_NUMBER).value)
+                self.accept(T_COMMA)
+                aliases.extend(names)
+                run_count.append(len(names))
+                run_start.append(addr)
+                run_stride.append(stride)
+            self.consume(T_RBRACE)
+            self.consume(T_RBRACE)
+            patches.append(Patch(universe_name, aliases, run_count, run_start, run_stride, *self.span(start)))
             # 可能有多組，逗號可選擇性忽略
-            if self.current_token() and self.current_token().type == 'COMMA':
-                self.consume('COMMA')
-        self.consume('RBRACE')
+            self.accept(T_COMMA)
+        self.consume(T_RBRACE)
         return patches
 
     def parse_group(self):
-        self.consume('GROUP')
+        start = self.pos
+        self.consume(T_GROUP)
         group_types = []
         # 判斷是否有 < ... > 群組類型
-        if self.current_token() and self.current_token().type == 'LT':
-            self.consume('LT')  # 吃掉 '<'
-            while True:
-                token = self.consume('ID')
-                group_types.append(token.value)
-                if self.current_token() and self.current_token().type == 'COMMA':
-                    self.consume('COMMA')
-                    continue
-                else:
-                    break
-            self.consume('GT')  # 吃掉 '>'
-
-        group_name = self.consume('ID').value
+        if self.accept(T_LT):
+            group_types = self.comma_list(T_ID)
+            self.consume(T_GT)
 
-        aliases = []
-        if self.current_token() and self.current_token().type == 'LSQUARE':
-            self.consume('LSQUARE')
-            while True:
-                token = self.consume('STRING')
-                aliases.append(token.value.strip('"'))
-                if self.current_token() and self.current_token().type == 'COMMA':
-                    self.consume('COMMA')
-                else:
-                    break
-            self.consume('RSQUARE')
-
-        return {
-            "group_types": group_types,
-            "group_name": group_name,
-            "aliases": aliases
-        }
+        group_name = self.consume(T_ID).value
+        aliases = self.parse_alias_list()
+
+        return Group(group_name, group_types, aliases, *self.span(start))
+
+
+SettingParser.HANDLERS = {
+    T_LIBS: SettingParser.top_libs,
+    T_FIXTURE: SettingParser.top_fixture,
+    T_PATCH: SettingParser.top_patch,
+    T_GROUP: SettingParser.top_group,
+}
+# 錯誤恢復時可重新開始解析的敘述
+STARTS = frozenset(SettingParser.HANDLERS)
 
 
 if __name__ == "__main__":
@@ -197,4 +220,18 @@ GROUP <OE,LR> BACK ["C","D","E","F","G","H"]
     result = parser.parse()
 
     import pprint
-    pprint.pprint(result)
\ No newline at end of file
+    pprint.pprint(result)
+    pprint.pprint([expand_patch(patch, {a: 8 for a in "ABCDEFGH"}) for patch in result.patches])
+
+    # 10k 燈具的範圍與自動 patch
+    import time
+    lines = ['FIXTURE PAR_4W54 10000 ["PAR{1-10000}"]', 'PATCH {']
+    lines.append(',\n'.join(f'{{"UNIVERSE": "U{u + 1}", "PATCHES": {{"PAR{{{u * 64 + 1}-{u * 64 + 64}}}": 1}}}}'
+                            for u in range(157)))
+    lines.append('}')
+    lines.append('GROUP <LR,OE> RIG ["PAR{1-10000}"]')
+    text = '\n'.join(lines)
+    t0 = time.perf_counter()
+    result = SettingParser(list(Lexer(text).generate_tokens())).parse()
+    patched = [expand_patch(patch, {}.fromkeys(patch.aliases, 8)) for patch in result.patches]
+    print(f"10k fixtures parsed and patched in {(time.perf_counter() - t0) * 1000:.1f} ms")
\ No newline at end of file
@@ -0,0 +1,212 @@
+import heapq
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from ast_nodes import CueCall, InlineCue, Wait
+import Pylogger
+
+logger = Pylogger.get_logger()
+
+DEFAULT_BPM = 120.0
+
+# WAIT 的時間單位換算成秒，beat/bar 依照目前的 BPM
+WAIT_UNITS = {
+    'ms': 0.001,
+    's': 1.0,
+    'sec': 1.0,
+    'second': 1.0,
+    'seconds': 1.0,
+}
+BEAT_UNITS = {
+    'beat': 1,
+    'beats': 1,
+    'bar': 4,
+    'bars': 4,
+}
+
+TimelineEvent = namedtuple('TimelineEvent', ['start', 'duration', 'instance'])
+
+
+def tempo_sections(cues, default_bpm=DEFAULT_BPM):
+    # cues 為依 SHOW 順序的 (開始時間, BPM)，每個 CUE 之後的速度為該 cue 的 BPM (與 WAIT beat 的換算相同)
+    sections = [(0.0, float(default_bpm))]
+    for start, bpm in cues:
+        bpm = float(bpm)
+        if bpm == sections[-1][1]:
+            continue
+        if start <= sections[-1][0]:
+            sections[-1] = (sections[-1][0], bpm)
+        else:
+            sections.append((start, bpm))
+    return sections
+
+
+class Timeline:
+    # 每 CHECKPOINT 個事件記錄一次當下仍在播放的事件
+    # 查詢時間 t 時只需從最近的 checkpoint 開始掃描
+    CHECKPOINT = 64
+
+    def __init__(self, number, events, tempo=None):
+        events = sorted(events, key=lambda e: e[0])
+        self.number = number
+        # 編譯時的速度段 [(開始時間, BPM)]，供 TempoMap 在播放時換算拍數
+        self.tempo = tempo
+        self.starts = array('d', (e[0] for e in events))
+        self.durations = array('d', (e[1] for e in events))
+        self.ends = array('d', (e[0] + e[1] for e in events))
+        self.instances = [e[2] for e in events]
+        self.duration = max(self.ends) if events else 0.0
+        self.checkpoints = self.build_checkpoints()
+
+    @classmethod
+    def from_columns(cls, number, starts, durations, ends, instances, checkpoints, tempo=None):
+        # 由已排序的欄位直接建立，不重新排序也不重算 checkpoint (例如從 .twc 載入)
+        timeline = cls.__new__(cls)
+        timeline.number = number
+        timeline.tempo = tempo
+        timeline.starts = starts
+        timeline.durations = durations
+        timeline.ends = ends
+        timeline.instances = instances
+        timeline.duration = max(ends) if len(ends) else 0.0
+        timeline.checkpoints = checkpoints
+        return timeline
+
+    def __len__(self):
+        return len(self.instances)
+
+    def __getitem__(self, index):
+        return TimelineEvent(self.starts[index], self.durations[index], self.instances[index])
+
+    def build_checkpoints(self):
+        checkpoints = []
+        heap = []
+        for i in range(len(self.starts)):
+            if i % self.CHECKPOINT == 0:
+                t = self.starts[i]
+                while heap and heap[0][0] <= t:
+                    heapq.heappop(heap)
+                checkpoints.append(tuple(sorted(j for end, j in heap)))
+            heapq.heappush(heap, (self.ends[i], i))
+        return checkpoints
+
+    def seek(self, t):
+        # 回傳開始時間 <= t 的事件數量，即下一個要觸發的事件索引
+        return bisect_right(self.starts, t)
+
+    def active_indices(self, t):
+        idx = self.seek(t)
+        if idx == 0:
+            return []
+        cp = (idx - 1) // self.CHECKPOINT
+        ends = self.ends
+        active = [j for j in self.checkpoints[cp] if ends[j] > t]
+        for j in range(cp * self.CHECKPOINT, idx):
+            if ends[j] > t:
+                active.append(j)
+        return active
+
+    def active_at(self, t):
+        return [self[j] for j in self.active_indices(t)]
+
+    def events_between(self, t0, t1):
+        # 開始時間落在 [t0, t1) 的事件
+        return range(bisect_left(self.starts, t0), bisect_left(self.starts, t1))
+
+
+class ShowCompiler:
+    def __init__(self, project, default_bpm=DEFAULT_BPM):
+        self.project = project
+        self.default_bpm = default_bpm
+
+    def compile(self, show_ast=None):
+        show_ast = show_ast or self.project.show
+        timelines = {}
+        for show in show_ast.shows:
+            if show.number in timelines:
+                raise ValueError(f"{show.where(show_ast.path)}: SHOW {show.number} is declared more than once")
+            timelines[show.number] = self.compile_show(show)
+        return timelines
+
+    def compile_show(self, show):
+        logger.info(f"Compiling SHOW {show.number}")
+        events = list(self.iter_events(show))
+        tempo = tempo_sections(((start, instance.bpm) for start, _, instance in events), self.default_bpm)
+        timeline = Timeline(show.number, events, tempo)
+        logger.info(f"SHOW {show.number} compiled: {len(timeline)} events, {timeline.duration:.3f}s")
+        return timeline
+
+    def iter_events(self, show):
+        # 依 SHOW 內容的順序逐一綁定 cue，產生 (開始時間, 長度, instance)
+        cursor = 0.0
+        bpm = self.default_bpm
+        last = None
+        for command in show.body:
+            if isinstance(command, Wait):
+                cursor += self.wait_seconds(command, bpm, last)
+                continue
+            try:
+                instance = self.bind_cue(command)
+            except ValueError as e:
+                # 錯誤訊息加上 SHOW 中呼叫的位置
+                raise ValueError(f"{e} (called from {command.where(self.project.show.path)})")
+            yield cursor, instance.duration, instance
+            bpm = instance.bpm
+            last = instance
+
+    def find_show(self, number=None, show_ast=None):
+        shows = (show_ast or self.project.show).shows
+        if number is None and shows:
+            return min(shows, key=lambda s: s.number)
+        for show in shows:
+            if show.number == number:
+                return show
+        raise ValueError(f"SHOW {number} not found, available: {sorted(s.number for s in shows)}")
+
+    def bind_cue(self, call):
+        if isinstance(call, InlineCue):
+            # inline cue，沒有呼叫參數
+            return self.project.binder.bind(call.cue)
+        if not isinstance(call, CueCall):
+            raise ValueError(f"Unknown show command {call!r}")
+        return self.project.binder.bind(self.project.cues.get(call.name), call.params)
+
+    def wait_seconds(self, wait, bpm, last=None):
+        unit = wait.unit
+        duration = wait.duration
+        if unit in WAIT_UNITS:
+            return duration * WAIT_UNITS[unit]
+        if unit in BEAT_UNITS:
+            return duration * BEAT_UNITS[unit] * 60.0 / bpm
+        if unit in ('interval', 'intervals'):
+            interval_sec = last.interval_sec if last else 60.0 / bpm
+            return duration * interval_sec
+        raise ValueError(f"Unknown WAIT unit {unit!r}")
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    import random
+    from show_project import ShowProject
+
+    project = ShowProject(sys.argv[1] if len(sys.argv) > 1 else "../example/show250601/show/show1.tw")
+    timelines = ShowCompiler(project).compile()
+    for number, timeline in timelines.items():
+        print(f"SHOW {number}: {len(timeline)} events, {timeline.duration:.3f}s")
+        for i in range(len(timeline)):
+            print("   ", timeline[i])
+
+    # 大量事件的 seek 測試
+    events = []
+    t = 0.0
+    for i in range(50000):
+        events.append((t, random.uniform(0.5, 8.0), i))
+        t += random.uniform(0.0, 0.2)
+    timeline = Timeline(0, events)
+    probes = [random.uniform(0, timeline.duration) for _ in range(10000)]
+    t0 = time.perf_counter()
+    for p in probes:
+        timeline.active_indices(p)
+    elapsed = time.perf_counter() - t0
+    print(f"{len(events)} events, {elapsed / len(probes) * 1e6:.1f} us per scrub")
@@ -0,0 +1,220 @@
+import os
+import json
+import random
+
+# 產生大量、結構接近真實演出的 setting / cue / show 文字，供 benchmark 與壓力測試使用
+
+FIXTURE_TYPES = {
+    'PAR_4W54': ['dimmer', 'r', 'g', 'b', 'amber', 'strobe', 'function', 'function speed'],
+    'PAR_3W54': ['dimmer', 'r', 'g', 'b', 'strobe', 'function', 'function speed'],
+    'COB': ['dimmer', 'strobe', 'function', 'function speed', 'amber', 'white'],
+    'FOG_XL': ['dimmer'],
+}
+COLORS = ['red_a', 'green_a', 'blue_a', 'white_a', 'amber_a', 'cyan_a', 'magenta_a', 'yellow_a']
+FUNC_TERMS = ['sin(x)', 'cos(x)', 'sin(2*x)', 'cos(3*x)', 'x/4', 'sin(x)*cos(x)', 'exp(-x)', 'Abs(sin(x))']
+SELECTORS = ['LIGHT.ALL', 'LIGHT.L', 'LIGHT.R', 'LIGHT.O', 'LIGHT.E']
+UNIVERSE_SIZE = 512
+
+
+class ShowGenerator:
+    def __init__(self, seed=0, fixtures=200, cues=100, show_calls=1000, intervals=16,
+                 blocks_per_channel=8, commands_per_block=4, func_terms=6):
+        self.rng = random.Random(seed)
+        self.fixture_count = fixtures
+        self.cue_count = cues
+        self.show_calls = show_calls
+        self.intervals = intervals
+        self.blocks_per_channel = blocks_per_channel
+        self.commands_per_block = commands_per_block
+        self.func_terms = func_terms
+        self.fixtures = self.make_fixtures()
+        self.groups = self.make_groups()
+
+    def make_fixtures(self):
+        # 回傳 [(alias, fixture_type, universe, address)]，依通道數自動排 patch
+        fixtures = []
+        universe = 0
+        address = 1
+        types = list(FIXTURE_TYPES)
+        for i in range(self.fixture_count):
+            fixture_type = types[i % len(types)]
+            width = len(FIXTURE_TYPES[fixture_type])
+            if address + width - 1 > UNIVERSE_SIZE:
+                universe += 1
+                address = 1
+            fixtures.append((f"F{i + 1}", fixture_type, f"U{universe + 1}", address))
+            address += width
+        return fixtures
+
+    def make_groups(self):
+        aliases = [f[0] for f in self.fixtures]
+        groups = [('ALL_RIG', ['LR', 'OE'], aliases[:len(aliases) // 2 * 2])]
+        size = max(2, min(16, len(aliases) // 8 // 2 * 2))
+        for g, start in enumerate(range(0, len(aliases) - size + 1, size)):
+            groups.append((f"G{g + 1}", ['LR', 'OE'], aliases[start:start + size]))
+        return groups
+
+    def func_expr(self):
+        return '+'.join(self.rng.choice(FUNC_TERMS) for _ in range(self.func_terms))
+
+    def setting_text(self, lib_names):
+        lines = ['LIBS [']
+        lines.append(',\n'.join(f'    "{name}"' for name in lib_names))
+        lines.append(']')
+        lines.append('')
+        by_type = {}
+        for alias, fixture_type, universe, address in self.fixtures:
+            by_type.setdefault(fixture_type, []).append(alias)
+        for fixture_type, aliases in by_type.items():
+            quoted = ','.join(f'"{a}"' for a in aliases)
+            lines.append(f'FIXTURE {fixture_type} {len(aliases)} [{quoted}]')
+        lines.append('')
+        by_universe = {}
+        for alias, fixture_type, universe, address in self.fixtures:
+            by_universe.setdefault(universe, []).append((alias, address))
+        lines.append('PATCH {')
+        blocks = []
+        for universe, patches in by_universe.items():
+            entries = ',\n'.join(f'            "{alias}": {address}' for alias, address in patches)
+            blocks.append(f'    {{\n        "UNIVERSE": "{universe}",\n        "PATCHES": {{\n{entries}\n        }}\n    }}')
+        lines.append(',\n'.join(blocks))
+        lines.append('}')
+        lines.append('')
+        for name, types, aliases in self.groups:
+            quoted = ','.join(f'"{a}"' for a in aliases)
+            type_text = f"<{','.join(types)}> " if types else ''
+            lines.append(f'GROUP {type_text}{name} [{quoted}]')
+        return '\n'.join(lines) + '\n'
+
+    def interval_ranges(self):
+        ranges = []
+        for _ in range(self.blocks_per_channel):
+            start = self.rng.randint(1, self.intervals)
+            end = self.rng.randint(start, min(self.intervals, start + 4))
+            ranges.append((start, end))
+        return sorted(set(ranges))
+
+    def cue_body(self, indent='    '):
+        rng = self.rng
+        lines = [f'{indent}IN BPM, RATE, LIGHT', '']
+        lines.append(f'{indent}FUNC wave_a(x) = {self.func_expr()}')
+        lines.append(f'{indent}FUNC wave_b(x) = {self.func_expr()}')
+        lines.append('')
+        lines.append(f'{indent}INTERVAL {self.intervals}')
+        lines.append('')
+        for channel in ('DIMMER', 'COLOR', 'STROBE'):
+            lines.append(f'{indent}{channel}{{')
+            for start, end in self.interval_ranges():
+                key = f'{start}' if start == end else f'{start}-{end}'
+                lines.append(f'{indent}    INTERVAL[{key}]{{')
+                for _ in range(self.commands_per_block):
+                    selector = rng.choice(SELECTORS)
+                    if channel == 'COLOR':
+                        cmd = f'{selector} COLOR value "{rng.choice(COLORS)}"'
+                    elif channel == 'DIMMER' and rng.random() < 0.6:
+                        cmd = f'{selector} DIMMER func {rng.choice(["wave_a", "wave_b", "wave1"])} from 0 to PI'
+                    else:
+                        cmd = f'{selector} {channel} value {rng.randint(0, 255)}'
+                    lines.append(f'{indent}        {cmd}')
+                lines.append(f'{indent}    }}')
+            lines.append(f'{indent}}}')
+            lines.append('')
+        lines.append(f'{indent}OTHERS{{{rng.choice(["bypass", "off", "full"])}}}')
+        return lines
+
+    def cue_text(self, name):
+        lines = [f'CUE {name} START']
+        lines.extend(self.cue_body())
+        lines.append('')
+        lines.append('CUE END')
+        return '\n'.join(lines) + '\n'
+
+    def cue_names(self):
+        return [f'cue_{i:05d}' for i in range(self.cue_count)]
+
+    def show_text(self, setting_name, playback_name, shows=1):
+        rng = self.rng
+        names = self.cue_names()
+        group_names = [g[0] for g in self.groups]
+        lines = [f'SETTING "{setting_name}"', f'PLAYBACK "{playback_name}"', '']
+        for number in range(1, shows + 1):
+            lines.append(f'SHOW {number} START')
+            for i in range(self.show_calls):
+                if i % 50 == 0:
+                    lines.append('    CUE {')
+                    lines.extend(self.cue_body('        '))
+                    lines.append('    } CUE END')
+                    continue
+                bpm = rng.choice([90, 100, 120, 128, 140])
+                rate = rng.choice([1, 2, 4])
+                group = rng.choice(group_names)
+                lines.append(f'    CUE {rng.choice(names)}({bpm}, RATE={rate}, LIGHT={group}.ALL) CUE END')
+                lines.append(f'    WAIT {rng.choice([1, 2, 4])} beats')
+            lines.append('SHOW END')
+            lines.append('')
+        return '\n'.join(lines)
+
+    def color_lib(self):
+        rng = self.rng
+        return [{
+            "color": [rng.randint(0, 255) for _ in range(3)],
+            "amber": str(rng.randint(0, 255)),
+            "white": "0",
+            "alias": name,
+            "description": f"generated color {name}",
+        } for name in COLORS]
+
+    def fixture_lib(self):
+        lib = [{"enable_list": [{name: 1} for name in FIXTURE_TYPES]}]
+        for i, (name, channels) in enumerate(FIXTURE_TYPES.items()):
+            lib.append({
+                "id": i,
+                "fixture": f"GEN_{name}",
+                "manufacturer": "GEN",
+                "type": "FOG" if name.startswith('FOG') else "LED_PAR",
+                "alias": name,
+                "channel_number": len(channels),
+                "channels": [{"id": c, "name": ch, "min": 0, "max": 1 if name.startswith('FOG') else 255}
+                             for c, ch in enumerate(channels)],
+            })
+        return lib
+
+    def func_lib(self):
+        return [{"name": "wave1", "alias": "wave1", "description": "sine wave function", "func": "sin(x)"}]
+
+    def playback_lib(self):
+        return [{"name": name, "alias": name, "description": "generated cue", "file": f"{name}.tw"}
+                for name in self.cue_names()]
+
+    def write_project(self, root, shows=1):
+        # 產生與 example/show250601 相同結構的目錄，回傳 show 檔案路徑
+        show_dir = os.path.join(root, 'show')
+        lib_dir = os.path.join(root, 'show_lib')
+        playback_dir = os.path.join(lib_dir, 'playback_lib')
+        for d in (show_dir, playback_dir):
+            os.makedirs(d, exist_ok=True)
+        libs = {
+            'color_lib_gen': self.color_lib(),
+            'fixture_lib_gen': self.fixture_lib(),
+            'func_lib': self.func_lib(),
+            'playback_lib_gen': self.playback_lib(),
+        }
+        for name, data in libs.items():
+            with open(os.path.join(lib_dir, name + '.json'), 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=4)
+        for name in self.cue_names():
+            with open(os.path.join(playback_dir, name + '.tw'), 'w', encoding='utf-8') as f:
+                f.write(self.cue_text(name))
+        with open(os.path.join(show_dir, 'setting.tw'), 'w', encoding='utf-8') as f:
+            f.write(self.setting_text(list(libs)))
+        show_path = os.path.join(show_dir, 'show1.tw')
+        with open(show_path, 'w', encoding='utf-8') as f:
+            f.write(self.show_text('setting', 'playback_lib_gen', shows))
+        return show_path
+
+
+if __name__ == "__main__":
+    import sys
+    root = sys.argv[1] if len(sys.argv) > 1 else 'generated_show'
+    gen = ShowGenerator()
+    print(gen.write_project(root))
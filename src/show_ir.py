@@ -0,0 +1,338 @@
+from array import array
+from show_compiler import Timeline
+from cue_instance import OTHERS_MODES
+from setting_parser import expand_patch
+import Pylogger
+
+logger = Pylogger.get_logger()
+
+# 指令的通道與模式代碼
+CHANNELS = ('DIMMER', 'COLOR', 'STROBE')
+MODES = ('value', 'func')
+CH_DIMMER, CH_COLOR, CH_STROBE = range(3)
+MODE_VALUE, MODE_FUNC = range(2)
+
+# 燈具通道的種類代碼，依 fixture_lib 中 channel 的 name 判斷
+CHANNEL_KINDS = ('other', 'dimmer', 'r', 'g', 'b', 'amber', 'white', 'strobe', 'function', 'func_speed')
+CHANNEL_KIND_NAMES = {
+    'dimmer': 1, 'r': 2, 'red': 2, 'g': 3, 'green': 3, 'b': 4, 'blue': 4,
+    'amber': 5, 'white': 6, 'strobe': 7, 'function': 8, 'function speed': 9,
+}
+
+GROUP_TYPE_FLAGS = {'LR': 1, 'OE': 2}
+NO_UNIVERSE = 0xFFFF
+LUT_SIZE = 256
+# sample_lut 的結果：(id(func), domain) -> (func, 取樣值)
+_lut_samples = {}
+
+
+def parse_color(entry):
+    # color 可以是 "#rrggbb" 或 [r, g, b]，amber/white 是字串或數字
+    color = entry['color']
+    if isinstance(color, str):
+        color = color.lstrip('#')
+        if len(color) != 6:
+            raise ValueError(f"Invalid color {entry['color']!r} for {entry.get('alias')!r}")
+        rgb = [int(color[i:i + 2], 16) for i in (0, 2, 4)]
+    else:
+        rgb = [int(c) for c in color]
+        if len(rgb) != 3:
+            raise ValueError(f"Invalid color {entry['color']!r} for {entry.get('alias')!r}")
+    values = rgb + [int(entry.get('amber', 0)), int(entry.get('white', 0))]
+    for v in values:
+        if not 0 <= v <= 255:
+            raise ValueError(f"Color value {v} out of range for {entry.get('alias')!r}")
+    return values
+
+
+class ShowIR:
+    # 以欄位 (array / memoryview) 儲存的編譯結果，所有引用都是整數索引
+    # 同一份結構可以在記憶體中建立，也可以由 .twc 檔案 mmap 載入
+    def __init__(self):
+        self.universes = []
+        self.fix_alias = []
+        self.fix_type = array('H')
+        self.fix_universe = array('H')
+        self.fix_address = array('H')
+
+        self.type_alias = []
+        self.type_channel_offset = array('I')
+        self.type_channel_count = array('H')
+        self.ch_kind = array('B')
+        self.ch_min = array('H')
+        self.ch_max = array('H')
+
+        self.group_name = []
+        self.group_flags = array('B')
+        self.group_member_offset = array('I')
+        self.group_member_count = array('I')
+        self.group_members = array('I')
+
+        self.color_alias = []
+        self.color_values = array('B')  # 每個顏色 5 個值：r, g, b, amber, white
+
+        self.inst_name = []
+        self.inst_bpm = array('d')
+        self.inst_rate = array('d')
+        self.inst_interval_sec = array('d')
+        self.inst_interval_count = array('I')
+        self.inst_others = array('B')
+        self.inst_cmd_offset = array('I')
+        self.inst_cmd_count = array('I')
+
+        self.cmd_channel = array('B')
+        self.cmd_mode = array('B')
+        self.cmd_start = array('H')
+        self.cmd_end = array('H')
+        self.cmd_fix_offset = array('I')
+        self.cmd_fix_count = array('I')
+        self.cmd_value = array('d')
+        self.cmd_lut = array('i')
+        self.cmd_fixtures = array('I')
+
+        self.lut_name = []
+        self.lut_from = array('d')
+        self.lut_to = array('d')
+        self.lut_values = array('f')
+
+        self.timelines = {}
+
+    @property
+    def fixture_count(self):
+        return len(self.fix_alias)
+
+    @property
+    def instance_count(self):
+        return len(self.inst_interval_sec)
+
+    def fixture_index(self):
+        return {alias: i for i, alias in enumerate(self.fix_alias)}
+
+    def color_index(self):
+        return {alias: i for i, alias in enumerate(self.color_alias)}
+
+
+# build_setting 之後仍會增加的欄位
+ROLLBACK_FIELDS = (
+    'inst_name', 'inst_bpm', 'inst_rate', 'inst_interval_sec', 'inst_interval_count', 'inst_others',
+    'inst_cmd_offset', 'inst_cmd_count',
+    'cmd_channel', 'cmd_mode', 'cmd_start', 'cmd_end', 'cmd_fix_offset', 'cmd_fix_count',
+    'cmd_value', 'cmd_lut', 'cmd_fixtures',
+    'lut_name', 'lut_from', 'lut_to', 'lut_values',
+)
+
+
+class IRBuilder:
+    def __init__(self, project):
+        self.project = project
+        self.ir = ShowIR()
+        self._instances = {}
+        # 指令串列與燈具 tuple 由 CueBinder 共用，同一個物件只寫入一次欄位，其他 instance 指向相同的範圍
+        self._command_ranges = {}
+        self._fixture_ranges = {}
+        self._luts = {}
+        self._fixtures = {}
+        self._colors = {}
+
+    def build(self, timelines):
+        self.build_setting()
+        for number, timeline in timelines.items():
+            self.ir.timelines[number] = self.add_timeline(timeline)
+        logger.info(f"Built show IR: {self.ir.fixture_count} fixtures, {self.ir.instance_count} cue instances, "
+                    f"{len(self.ir.cmd_channel)} commands, {len(self.ir.lut_name)} function tables")
+        return self.ir
+
+    def add_timeline(self, timeline):
+        # 已加入過的 instance 沿用原本的 id，只有新的 instance 會附加到欄位後面
+        ids = [self.add_instance(instance) for instance in timeline.instances]
+        return Timeline.from_columns(timeline.number, timeline.starts, timeline.durations, timeline.ends,
+                                     array('I', ids), timeline.checkpoints, timeline.tempo)
+
+    def build_setting(self):
+        ir = self.ir
+        project = self.project
+        types = {}
+        for name, fixture_type in project.fixture_types.items():
+            types[name] = len(ir.type_alias)
+            ir.type_alias.append(name)
+            ir.type_channel_offset.append(len(ir.ch_kind))
+            ir.type_channel_count.append(len(fixture_type.channels))
+            for channel in fixture_type.channels:
+                ir.ch_kind.append(channel.kind)
+                ir.ch_min.append(channel.min)
+                ir.ch_max.append(channel.max)
+
+        widths = {}
+        for fixture in project.setting.fixtures:
+            t = types.get(fixture.fixture_type)
+            if t is not None:
+                widths.update(dict.fromkeys(fixture.aliases, ir.type_channel_count[t]))
+        patch = {}
+        for universe in project.setting.patches:
+            if universe.universe not in ir.universes:
+                ir.universes.append(universe.universe)
+            u = ir.universes.index(universe.universe)
+            aliases, addresses = expand_patch(universe, widths)
+            patch.update(zip(aliases, zip([u] * len(aliases), addresses)))
+
+        for fixture in project.setting.fixtures:
+            if fixture.fixture_type not in types:
+                raise ValueError(f"{fixture.where(project.setting.path)}: "
+                                 f"Unknown fixture type {fixture.fixture_type!r}")
+            for alias in fixture.aliases:
+                self._fixtures[alias] = len(ir.fix_alias)
+                ir.fix_alias.append(alias)
+                ir.fix_type.append(types[fixture.fixture_type])
+                u, address = patch.get(alias, (NO_UNIVERSE, 0))
+                ir.fix_universe.append(u)
+                ir.fix_address.append(address)
+
+        for group in project.setting.groups:
+            ir.group_name.append(group.name)
+            flags = 0
+            for t in group.types:
+                flags |= GROUP_TYPE_FLAGS.get(t, 0)
+            ir.group_flags.append(flags)
+            ir.group_member_offset.append(len(ir.group_members))
+            ir.group_member_count.append(len(group.aliases))
+            ir.group_members.extend(self.fixture_id(alias) for alias in group.aliases)
+
+        for alias, color in project.colors.items():
+            self._colors[alias] = len(ir.color_alias)
+            ir.color_alias.append(alias)
+            ir.color_values.extend(color.values)
+
+    def fixture_id(self, alias):
+        if alias not in self._fixtures:
+            raise ValueError(f"Unknown fixture alias {alias!r}")
+        return self._fixtures[alias]
+
+    def add_instance(self, instance):
+        # 以內容為 key：hot reload 重新綁定出內容相同的 instance (例如重新解析後的 inline cue) 時沿用原本的列，
+        # IR 不會在每次存檔時變大；內容相同的指令串列由 CueBinder 共用，寫在同一個 offset
+        offset = self.add_commands(instance)
+        key = (instance.name or '', instance.bpm, instance.rate, instance.interval_count, instance.others,
+               offset, len(instance.commands))
+        if key in self._instances:
+            return self._instances[key]
+        ir = self.ir
+        inst_id = self._instances[key] = len(ir.inst_interval_sec)
+        ir.inst_name.append(instance.name or '')
+        ir.inst_bpm.append(instance.bpm)
+        ir.inst_rate.append(instance.rate)
+        ir.inst_interval_sec.append(instance.interval_sec)
+        ir.inst_interval_count.append(instance.interval_count)
+        ir.inst_others.append(OTHERS_MODES.index(instance.others))
+        ir.inst_cmd_offset.append(offset)
+        ir.inst_cmd_count.append(len(instance.commands))
+        return inst_id
+
+    def add_commands(self, instance):
+        commands = instance.commands
+        shared = self._command_ranges.get(id(commands))
+        if shared is not None:
+            return shared[0]
+        offset = len(self.ir.cmd_channel)
+        for command in commands:
+            self.add_command(instance, command)
+        self._command_ranges[id(commands)] = (offset, commands)
+        return offset
+
+    def add_command(self, instance, command):
+        # 先解析顏色、燈具與函式表，全部成功後才寫入指令欄位，出錯時各欄位的長度仍然相同
+        ir = self.ir
+        channel = CHANNELS.index(command.channel)
+        if command.mode == 'value':
+            mode, lut = MODE_VALUE, -1
+            value = command.value
+            if channel == CH_COLOR:
+                if value not in self._colors:
+                    raise ValueError(f"Unknown color {value!r} in cue {instance.name}")
+                value = self._colors[value]
+        elif channel == CH_COLOR:
+            raise ValueError(f"COLOR does not support func in cue {instance.name}")
+        else:
+            mode, value = MODE_FUNC, 0.0
+        fix_offset = self.add_fixtures(command.aliases)
+        if mode == MODE_FUNC:
+            lut = self.add_lut(command.value, command.func, command.domain)
+        ir.cmd_channel.append(channel)
+        ir.cmd_start.append(command.start)
+        ir.cmd_end.append(command.end)
+        ir.cmd_fix_offset.append(fix_offset)
+        ir.cmd_fix_count.append(len(command.aliases))
+        ir.cmd_mode.append(mode)
+        ir.cmd_value.append(value)
+        ir.cmd_lut.append(lut)
+
+    def add_fixtures(self, aliases):
+        shared = self._fixture_ranges.get(id(aliases))
+        if shared is not None:
+            return shared[0]
+        fixtures = [self.fixture_id(alias) for alias in aliases]
+        offset = len(self.ir.cmd_fixtures)
+        self.ir.cmd_fixtures.extend(fixtures)
+        self._fixture_ranges[id(aliases)] = (offset, aliases)
+        return offset
+
+    def add_lut(self, name, func, domain):
+        # 同一個函式與定義域只取樣一次
+        key = (id(func), domain)
+        if key in self._luts:
+            return self._luts[key][0]
+        ir = self.ir
+        values = sample_lut(func, domain)
+        lut_id = len(ir.lut_name)
+        self._luts[key] = (lut_id, func)
+        ir.lut_name.append(name)
+        ir.lut_from.append(domain[0])
+        ir.lut_to.append(domain[1])
+        ir.lut_values.extend(values)
+        return lut_id
+
+    def mark(self):
+        # 目前 cue instance、指令與函式表欄位及索引表的長度；hot reload 失敗時以 rollback 回到這個狀態
+        ir = self.ir
+        return ({name: len(getattr(ir, name)) for name in ROLLBACK_FIELDS},
+                [len(table) for table in self.tables()])
+
+    def rollback(self, mark):
+        columns, lengths = mark
+        for name, n in columns.items():
+            del getattr(self.ir, name)[n:]
+        # 索引表依加入順序排列，刪除 mark 之後加入的 key
+        for table, n in zip(self.tables(), lengths):
+            for key in list(table)[n:]:
+                del table[key]
+
+    def tables(self):
+        return self._instances, self._command_ranges, self._fixture_ranges, self._luts
+
+
+def sample_lut(func, domain):
+    # 取樣結果在 process 內共用，多個 show 的 IR 使用同一個 FUNC 時不需要重新取樣
+    # FUNC 由 cue_parser 以 (變數, 運算式) 共用，保留 func 的參照讓 id 不會被重複使用
+    key = (id(func), domain)
+    cached = _lut_samples.get(key)
+    if cached is None:
+        a, b = domain
+        step = (b - a) / (LUT_SIZE - 1)
+        cached = _lut_samples[key] = (func, array('f', [float(func(a + step * i)) for i in range(LUT_SIZE)]))
+    return cached[1]
+
+
+def build_ir(project, timelines):
+    return IRBuilder(project).build(timelines)
+
+
+def lut_lookup(ir, lut_id, u):
+    # u 為 0~1 的相對位置，線性內插
+    if u <= 0.0:
+        return ir.lut_values[lut_id * LUT_SIZE]
+    if u >= 1.0:
+        return ir.lut_values[lut_id * LUT_SIZE + LUT_SIZE - 1]
+    pos = u * (LUT_SIZE - 1)
+    i = int(pos)
+    base = lut_id * LUT_SIZE + i
+    v0 = ir.lut_values[base]
+    return v0 + (ir.lut_values[base + 1] - v0) * (pos - i)
@@ -0,0 +1,254 @@
+import sys
+import time
+import threading
+from renderer import FrameRenderer, DEFAULT_FPS
+from dmx_output import RecordingOutput
+from frame_recorder import FrameRecorder
+import Pylogger
+import Pymetrics
+
+logger = Pylogger.get_logger()
+
+# 觸發時若距離下一個 frame 不到這個時間，就不另外送出 frame
+TRIGGER_FRAME_MIN_GAP = 0.002
+
+
+class ShowPlayer:
+    def __init__(self, ir, output, show_number=None, fps=DEFAULT_FPS, record_path=None, lookahead=None,
+                 live=False, cache=None):
+        # lookahead 為 LookaheadCompiler 時，cue 在播放中由背景執行緒編譯
+        # live 為 True 時 timeline 結束後繼續輸出，等待現場觸發的 cue
+        # cache 為與其他 player 共用的 RenderCache (同一份 IR)
+        if lookahead is not None and show_number is None:
+            show_number = lookahead.show_number
+        self.renderer = FrameRenderer(ir, show_number, fps, cache)
+        self.fps = fps
+        self.lookahead = lookahead
+        if lookahead is not None:
+            lookahead.attach(self.renderer)
+        self.recorder = None
+        if record_path:
+            self.recorder = FrameRecorder(record_path, ir.universes, fps)
+            output = RecordingOutput(output, self.recorder)
+        self.output = output
+        self.frame_index = 0
+        self.frames_rendered = 0
+        self.dropped_frames = 0
+        self.live = live
+        self.trigger_frames = 0
+        self.last_trigger_latency = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    @property
+    def position(self):
+        return self.frame_index / self.fps
+
+    def run(self, start=0.0, end=None):
+        renderer = self.renderer
+        period = 1.0 / self.fps
+        frame_index = int(round(start * self.fps))
+        end_frame = None if end is None else int(end * self.fps)
+        lookahead = self.lookahead
+        if lookahead is not None:
+            if frame_index:
+                raise ValueError("Lookahead playback can only start from the beginning of the show")
+            if lookahead._thread is None:
+                lookahead.start()
+            lookahead.wait_ready(0.0, first=True)
+        else:
+            renderer.prime(frame_index)
+        t_origin = time.monotonic() - frame_index * period
+        logger.info(f"Playing SHOW {renderer.show_number} from frame {frame_index} to "
+                    f"{renderer.frame_count if end_frame is None else end_frame}")
+        finished = True
+        while not self._stop.is_set():
+            if lookahead is not None:
+                if not lookahead.wait_ready(renderer.tempo.position(frame_index * period)):
+                    break
+                finished = lookahead.done
+            # hot reload 換上新的 timeline 時長度可能改變，每個 frame 重新取得
+            # lookahead 在第一個 frame 之前就編譯完時，timeline 仍在等待換上，先換上再判斷是否結束
+            renderer.swap_pending(renderer.tempo.position(frame_index * period))
+            last_frame = renderer.frame_count if end_frame is None else min(renderer.frame_count, end_frame)
+            if frame_index >= last_frame and (finished or frame_index >= (end_frame or float('inf'))):
+                if not self.live or end_frame is not None:
+                    break
+            deadline = t_origin + frame_index * period
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                self.wait_frame(deadline, t_origin)
+            elif delay < -period:
+                # 落後超過一個 frame 時直接跳到目前時間
+                behind = int(-delay / period)
+                self.dropped_frames += behind
+                Pymetrics.count('dropped_frames', behind)
+                frame_index += behind
+                if finished and not self.live:
+                    frame_index = min(frame_index, last_frame - 1)
+                deadline = t_origin + frame_index * period
+            self.frame_index = frame_index
+            frame_start = time.monotonic()
+            frame = renderer.render(frame_index)
+            self.send(frame, frame_index * period)
+            Pymetrics.frame_tick(deadline, frame_start, time.monotonic(), period)
+            self.frames_rendered += 1
+            frame_index += 1
+        self.frame_index = frame_index
+
+    def wait_frame(self, deadline, t_origin):
+        # 等待下一個 frame；期間收到觸發時立即多送一個 frame，觸發的延遲不受 frame 週期限制
+        while not self._stop.is_set():
+            delay = deadline - time.monotonic()
+            if delay <= 0 or not self._wake.wait(delay):
+                return
+            self._wake.clear()
+            if self._stop.is_set() or delay < TRIGGER_FRAME_MIN_GAP:
+                continue
+            t = time.monotonic() - t_origin
+            renderer = self.renderer
+            renderer.apply(t)
+            self.send(renderer.write_frame(), t)
+            self.trigger_frames += 1
+
+    def send(self, frame, t):
+        t0 = Pymetrics.now()
+        self.output.send(frame, t, self.renderer.dirty_universes)
+        Pymetrics.record('send', t0)
+        fired = self.renderer.fired
+        if fired:
+            # 觸發到第一個含有該 cue 的 frame 送出的時間
+            now = time.monotonic()
+            for received in fired:
+                self.last_trigger_latency = now - received
+                Pymetrics.observe('trigger_latency', self.last_trigger_latency)
+            self.renderer.fired = []
+
+    def trigger(self, inst, received=None):
+        # 由其他執行緒呼叫，inst 為 IR 中的 cue instance id
+        self.renderer.trigger(inst, time.monotonic() if received is None else received)
+        self._wake.set()
+
+    def release(self):
+        self.renderer.release()
+        self._wake.set()
+
+    def set_bpm(self, bpm, ramp=0.0):
+        # 由其他執行緒呼叫，下一個 frame 開始使用新的速度，ramp 秒內線性漸變
+        self.renderer.tempo.set_bpm(bpm, self.position, ramp)
+
+    def follow_tempo(self):
+        # 回到 SHOW 編譯時的速度
+        self.renderer.tempo.follow(self.position)
+
+    def stats(self):
+        # 只讀取屬性，不取得任何 lock，供 metrics 執行緒呼叫
+        stats = {
+            'position_sec': self.frame_index / self.fps,
+            'frame_index': self.frame_index,
+            'frames_rendered': self.frames_rendered,
+            'dropped_frames': self.dropped_frames,
+            'active_cues': self.renderer.active_count,
+            'frames_sent': self.output.frames_sent,
+            'fps_target': self.fps,
+            'playing': int(self._thread is not None and self._thread.is_alive()),
+            'live_cues': len(self.renderer.live),
+            'trigger_frames': self.trigger_frames,
+            'bpm': self.renderer.tempo.bpm_at(self.frame_index / self.fps),
+            'changed_channels': self.renderer.changed_channels,
+            'dirty_universes': int(self.renderer.dirty_universes.sum()),
+        }
+        if self.last_trigger_latency is not None:
+            stats['last_trigger_latency_sec'] = self.last_trigger_latency
+        if self.recorder is not None:
+            stats['recorder_queue_depth'] = self.recorder.queue_depth
+        if self.lookahead is not None:
+            stats['lookahead_ready'] = self.lookahead.ahead()
+            stats['lookahead_misses'] = self.lookahead.misses
+        return stats
+
+    def start(self, start=0.0, end=None):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, args=(start, end), name='show-player', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        self.stop()
+        if self.lookahead is not None:
+            self.lookahead.stop()
+        self.output.close()
+
+
+def main(argv=None):
+    import argparse
+    from offline_render import load_ir
+    from dmx_output import ArtNetOutput, NullOutput
+    parser = argparse.ArgumentParser(description="Play a show in real time")
+    parser.add_argument('show', nargs='?', default="../example/show250601/show/show1.tw",
+                        help=".tw show file or compiled .twc")
+    parser.add_argument('record', nargs='?', default=None, help="also record the output to this frame file")
+    parser.add_argument('--artnet', nargs='?', const='255.255.255.255', default=None, metavar='HOST',
+                        help="send Art-Net (default: broadcast)")
+    parser.add_argument('--metrics', action='store_true', help="serve metrics on http://127.0.0.1:9464/metrics")
+    parser.add_argument('--osc', nargs='?', type=int, const=9000, default=None, metavar='PORT',
+                        help="fire cues from OSC messages on this UDP port (needs a .tw show)")
+    parser.add_argument('--bpm', type=float, default=None, help="play the show at this BPM instead of the cues' own")
+    parser.add_argument('--live', action='store_true', help="keep running after the show ends")
+    args = parser.parse_args(argv)
+
+    project = builder = None
+    if args.osc is not None:
+        # 觸發的 cue 需要加入同一份 IR，因此保留 project 與 IRBuilder
+        from show_project import ShowProject
+        from show_compiler import ShowCompiler
+        from show_ir import IRBuilder
+        project = ShowProject(args.show)
+        builder = IRBuilder(project)
+        ir = builder.build(ShowCompiler(project).compile())
+    else:
+        ir = load_ir(args.show)
+    output = ArtNetOutput(ir.universes, host=args.artnet) if args.artnet else NullOutput(ir.universes)
+    player = ShowPlayer(ir, output, record_path=args.record, live=args.live)
+    if args.bpm is not None:
+        player.set_bpm(args.bpm)
+    server = None
+    if args.metrics:
+        # curl http://127.0.0.1:9464/metrics
+        from metrics_server import MetricsServer
+        Pymetrics.enable()
+        server = MetricsServer(player).start()
+    trigger_server = None
+    if args.osc is not None:
+        # python osc_send.py /cue cross
+        from trigger_input import CueTriggers, TriggerServer
+        Pymetrics.enable()
+        triggers = CueTriggers(project, builder, player.renderer)
+        trigger_server = TriggerServer(player, triggers, port=args.osc).start()
+    try:
+        player.run()
+    except KeyboardInterrupt:
+        pass
+    if trigger_server is not None:
+        trigger_server.close()
+    player.close()
+    if server is not None:
+        server.close()
+    print(f"Played {player.frames_rendered} frames, {player.dropped_frames} dropped")
+    if player.last_trigger_latency is not None:
+        latency = Pymetrics.snapshot()['histograms']['trigger_latency']
+        print(f"{latency['count']} triggers, mean latency {latency['mean_sec'] * 1000:.2f} ms, "
+              f"max {latency['max_sec'] * 1000:.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
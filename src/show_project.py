@@ -0,0 +1,218 @@
+import os
+from lexer import Lexer
+from cue_parser import CueParser
+from show_parser import ShowParser
+from setting_parser import SettingParser
+from ast_nodes import InlineCue, Setting
+from intern_pool import InternPool
+from tw_source import read_text
+from cue_instance import SelectorResolver, CueBinder
+from lib_loader import LIB_KINDS, lib_kind, LibraryCache, load_libraries, CACHE_DIR
+import Pylogger
+import Pymetrics
+
+logger = Pylogger.get_logger()
+
+def tokenize(text):
+    t0 = Pymetrics.now()
+    tokens = list(Lexer(text).generate_tokens())
+    Pymetrics.record('lex', t0)
+    return tokens
+
+
+def parse_with(parser_class, tokens):
+    t0 = Pymetrics.now()
+    result = parser_class(tokens).parse()
+    Pymetrics.record('parse', t0)
+    return result
+
+
+def parse_show(path, pool=None):
+    # show 檔案與其中的 inline cue 都記錄來源路徑，錯誤訊息可以指向 file:line
+    # 給了 pool 時與同一個 project 中已解析的內容共用相同的子樹
+    show = parse_with(ShowParser, tokenize(read_text(path)))
+    show.path = path
+    for block in show.shows:
+        for command in block.body:
+            if isinstance(command, InlineCue):
+                command.cue.path = path
+    return pool.share(show) if pool is not None else show
+
+
+# 同一個 process 中解析過的 cue 檔案：路徑 -> (mtime_ns, size, Cue)
+# 多個 show 使用同一個 playback_lib 時只解析一次，檔案改變後重新解析
+_parsed_cues = {}
+
+
+def parse_cue(path, pool=None):
+    cue = parse_with(CueParser, tokenize(read_text(path)))
+    cue.path = path
+    return pool.share(cue) if pool is not None else cue
+
+
+def load_cue(path, pool=None):
+    # parse_cue 加上 process 內的快取，hot reload 請直接使用 parse_cue
+    try:
+        st = os.stat(path)
+    except OSError:
+        return parse_cue(path, pool)
+    key = (st.st_mtime_ns, st.st_size)
+    cached = _parsed_cues.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    cue = parse_cue(path, pool)
+    _parsed_cues[path] = (key, cue)
+    return cue
+
+
+def search_dirs(show_dir):
+    parent = os.path.dirname(show_dir)
+    return [show_dir, os.path.join(parent, 'show_lib'), os.path.join(parent, 'lib')]
+
+
+def locate(show_dir, name, ext):
+    # 依 search_dirs 的順序尋找 SETTING / LIBS 檔案，找不到時回傳 None
+    for directory in search_dirs(show_dir):
+        path = os.path.join(directory, name + ext)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def locate_playback_dir(show_dir):
+    for directory in search_dirs(show_dir):
+        path = os.path.join(directory, 'playback_lib')
+        if os.path.isdir(path):
+            return path
+    return show_dir
+
+
+def compile_func_lib(records):
+    # func_lib.json 的 "func" 以 x 為變數
+    builder = CueParser([])
+    funcs = {}
+    for record in records:
+        func = builder.build_func_with_sympy(record.arg, record.expr)
+        funcs[record.name] = func
+        if record.alias:
+            funcs[record.alias] = func
+    return funcs
+
+
+class CueLibrary:
+    def __init__(self, records, directory, pool=None):
+        # records 為 playback_lib 的 CueFileRecord，cue 檔案在第一次使用時才解析
+        self.directory = directory
+        self.pool = pool
+        self.files = {}
+        self._cues = {}
+        for record in records:
+            path = os.path.join(directory, record.file)
+            stem = os.path.splitext(record.file)[0]
+            for key in (stem, record.name, record.alias):
+                if key:
+                    self.files[key] = path
+
+    def __contains__(self, name):
+        return name in self._cues or name in self.files
+
+    def get(self, name):
+        cue = self._cues.get(name)
+        if cue is None:
+            path = self.files.get(name)
+            if path is None:
+                logger.error(f"Unknown cue {name!r}")
+                raise ValueError(f"Unknown cue {name!r}")
+            cue = self.load_file(path)
+            self._cues[name] = cue
+        return cue
+
+    def loaded(self):
+        # 已解析的 cue，name / alias / 檔名指向同一個 cue 時只列出一次
+        return list({id(cue): cue for cue in self._cues.values()}.values())
+
+    def load_file(self, path):
+        logger.info(f"Loading cue file {path}")
+        cue = load_cue(path, self.pool)
+        # 以檔案內宣告的 cue 名稱也可以呼叫
+        self._cues.setdefault(cue.name, cue)
+        return cue
+
+    def reload(self, path):
+        # 重新解析檔案，回傳受影響的 cue 名稱
+        cue = parse_cue(path, self.pool)
+        names = [name for name, p in self.files.items() if p == path]
+        names.append(cue.name)
+        for name in names:
+            self._cues[name] = cue
+        return cue, names
+
+    def mark(self):
+        # 已解析的 cue，hot reload 失敗時以 rollback 還原
+        return dict(self._cues)
+
+    def rollback(self, mark):
+        self._cues = dict(mark)
+
+
+class ShowProject:
+    def __init__(self, show_path, use_cache=True):
+        self.show_path = os.path.abspath(show_path)
+        self.show_dir = os.path.dirname(self.show_path)
+        # show 與 cue 檔案的解析結果都經過同一個 pool，相同的子樹只保留一份
+        self.pool = InternPool()
+        self.show = parse_show(self.show_path, self.pool)
+
+        self.setting = Setting()
+        self.setting_path = None
+        if self.show.setting:
+            self.setting_path = self.find_file(self.show.setting, '.tw')
+            self.setting = parse_with(SettingParser, tokenize(read_text(self.setting_path)))
+            self.setting.path = self.setting_path
+
+        lib_names = list(self.setting.libs)
+        if self.show.playback and self.show.playback not in lib_names:
+            lib_names.append(self.show.playback)
+        self.lib_paths = {name: self.find_file(name, '.json') for name in lib_names}
+        if use_cache:
+            self.library = LibraryCache(os.path.join(self.show_dir, CACHE_DIR)).load(self.lib_paths)
+        else:
+            self.library = load_libraries(self.lib_paths)
+
+        self.colors = {c.alias: c for c in self.library.colors}
+        self.fixture_types = {f.alias: f for f in self.library.fixture_types}
+        self.funcs = compile_func_lib(self.library.funcs)
+        playback_dir = self.find_playback_dir()
+        self.cues = CueLibrary(self.library.playback, playback_dir, self.pool)
+        self.resolver = SelectorResolver(self.setting)
+        self.binder = CueBinder(self.resolver, self.funcs)
+
+    def source_files(self):
+        # 所有會影響編譯結果的來源檔案
+        files = [self.show_path]
+        if self.setting_path:
+            files.append(self.setting_path)
+        files.extend(self.lib_paths.values())
+        files.extend(sorted(set(self.cues.files.values())))
+        return files
+
+    def search_dirs(self):
+        return search_dirs(self.show_dir)
+
+    def find_file(self, name, ext):
+        path = locate(self.show_dir, name, ext)
+        if path is None:
+            logger.error(f"Cannot find {name}{ext} for show {self.show_path}")
+            raise ValueError(f"Cannot find {name}{ext} in {self.search_dirs()}")
+        return path
+
+    def find_playback_dir(self):
+        return locate_playback_dir(self.show_dir)
+
+
+if __name__ == "__main__":
+    import sys
+    import pprint
+    project = ShowProject(sys.argv[1] if len(sys.argv) > 1 else "../example/show250601/show/show1.tw")
+    pprint.pprint(project.setting)
+    pprint.pprint(sorted(project.cues.files))
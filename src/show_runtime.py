@@ -0,0 +1,244 @@
+import os
+import sys
+import time
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from renderer import RenderCache, DEFAULT_FPS
+from show_player import ShowPlayer
+from dmx_output import NullOutput
+import Pylogger
+import Pymetrics
+
+logger = Pylogger.get_logger()
+
+# 播放期間的 GIL 切換間隔：render 執行緒佔住 GIL 時，排程執行緒最多延遲這麼久才能醒來
+SWITCH_INTERVAL = 0.0005
+
+
+class Stage:
+    # 一個舞台：自己的 ShowPlayer (timeline、tempo、frame buffer、輸出裝置)
+    # phase 為相對共同時鐘的偏移秒數，各舞台錯開 render 的時間，不會在同一個瞬間搶同一個 CPU
+    def __init__(self, name, player):
+        self.name = name
+        self.player = player
+        self.phase = 0.0
+        self.origin = 0.0
+        self.frame_index = 0
+        self.busy = False
+        self.done = False
+        self.error = None
+        self.late_frames = 0
+        self.jitter = Pymetrics.Histogram(f'stage_jitter:{name}')
+
+    def deadline(self, frame_index):
+        return self.origin + frame_index / self.player.fps
+
+    def stats(self):
+        stats = self.player.stats()
+        jitter = self.jitter.snapshot()
+        stats.update({
+            'phase_sec': self.phase,
+            'late_frames': self.late_frames,
+            'jitter_mean_sec': jitter['mean_sec'],
+            'jitter_p99_sec': jitter['p99_sec'],
+            'jitter_max_sec': jitter['max_sec'],
+        })
+        return stats
+
+
+class ShowRuntime:
+    # 一個 process 播放多個舞台，每個舞台有自己的 setting 與 universe
+    # 函式庫、cue 檔案、FUNC 與 LUT 取樣在 process 內共用；同一個 show 檔案只編譯一次，
+    # 播放其中不同 SHOW 的舞台共用 IR 與整理好的指令 (RenderCache)
+    # 排程執行緒依各舞台的 deadline 先後把 frame 交給 worker pool，
+    # 某個舞台來不及算完時只有它自己跳過 frame，其他舞台的時間不受影響
+    def __init__(self, fps=DEFAULT_FPS, workers=None):
+        self.fps = fps
+        self.workers = workers
+        self.stages = {}
+        self._shows = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def load(self, show_path):
+        # 回傳 (ShowIR, RenderCache)
+        from offline_render import load_ir
+        key = os.path.abspath(show_path)
+        shared = self._shows.get(key)
+        if shared is None:
+            t0 = time.perf_counter()
+            ir = load_ir(show_path)
+            shared = self._shows[key] = (ir, RenderCache(ir))
+            logger.info(f"Loaded {show_path} in {time.perf_counter() - t0:.3f}s")
+        return shared
+
+    def add_stage(self, name, show_path, show_number=None, output=None, record_path=None, live=False):
+        if name in self.stages:
+            raise ValueError(f"Stage {name!r} already exists")
+        ir, cache = self.load(show_path)
+        if output is None:
+            output = NullOutput(ir.universes)
+        player = ShowPlayer(ir, output, show_number, self.fps, record_path, live=live, cache=cache)
+        stage = self.stages[name] = Stage(name, player)
+        logger.info(f"Stage {name}: SHOW {player.renderer.show_number} of {show_path}, "
+                    f"{len(ir.universes)} universes")
+        return stage
+
+    def run(self, start=0.0, end=None):
+        stages = list(self.stages.values())
+        if not stages:
+            return
+        period = 1.0 / self.fps
+        first = int(round(start * self.fps))
+        end_frame = None if end is None else int(end * self.fps)
+        for stage in stages:
+            stage.player.renderer.warm(start)
+            stage.player.renderer.prime(first)
+            stage.frame_index = first
+            stage.done = False
+            stage.error = None
+        workers = self.workers or min(len(stages), os.cpu_count() or 1)
+        t_origin = time.monotonic() - first * period
+        heap = []
+        for k, stage in enumerate(stages):
+            stage.phase = k * period / len(stages)
+            stage.origin = t_origin + stage.phase
+            heap.append((stage.deadline(first), k, stage))
+        heapq.heapify(heap)
+        logger.info(f"Playing {len(stages)} stages on {workers} workers at {self.fps} fps")
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(switch_interval, SWITCH_INTERVAL))
+        try:
+            with ThreadPoolExecutor(workers, thread_name_prefix='stage-render') as pool:
+                while heap and not self._stop.is_set():
+                    deadline, k, stage = heap[0]
+                    delay = deadline - time.monotonic()
+                    if delay > 0:
+                        self._stop.wait(delay)
+                        continue
+                    heapq.heappop(heap)
+                    if self.schedule(pool, stage, end_frame):
+                        heapq.heappush(heap, (stage.deadline(stage.frame_index), k, stage))
+        finally:
+            sys.setswitchinterval(switch_interval)
+        for stage in stages:
+            stage.player.frame_index = stage.frame_index
+        errors = [stage for stage in stages if stage.error is not None]
+        if errors:
+            raise errors[0].error
+
+    def schedule(self, pool, stage, end_frame):
+        # 把 stage 目前的 frame 交給 pool，回傳 stage 是否還有下一個 frame
+        player = stage.player
+        if stage.error is not None:
+            return False
+        frame_index = stage.frame_index
+        last_frame = player.renderer.frame_count
+        if end_frame is not None:
+            last_frame = min(last_frame, end_frame)
+        if frame_index >= last_frame and (not player.live or end_frame is not None):
+            stage.done = True
+            return False
+        behind = int((time.monotonic() - stage.deadline(frame_index)) * self.fps)
+        if stage.busy or behind > 0:
+            # 上一個 frame 還沒算完或已經落後：只有這個 stage 跳過 frame
+            skip = max(behind, 1)
+            player.dropped_frames += skip
+            Pymetrics.count('dropped_frames', skip)
+            stage.frame_index = frame_index + skip
+            return True
+        stage.busy = True
+        stage.frame_index = frame_index + 1
+        pool.submit(self.render_frame, stage, frame_index)
+        return True
+
+    def render_frame(self, stage, frame_index):
+        player = stage.player
+        deadline = stage.deadline(frame_index)
+        start = time.monotonic()
+        try:
+            frame = player.renderer.render(frame_index)
+            player.frame_index = frame_index
+            player.send(frame, frame_index / player.fps)
+        except Exception as e:
+            logger.error(f"Stage {stage.name} stopped at frame {frame_index}: {e}")
+            stage.error = e
+            return
+        finally:
+            stage.busy = False
+        end = time.monotonic()
+        period = 1.0 / player.fps
+        stage.jitter.add(abs(start - deadline))
+        if end > deadline + period:
+            stage.late_frames += 1
+        Pymetrics.frame_tick(deadline, start, end, period)
+        player.frames_rendered += 1
+
+    def stats(self):
+        return {name: stage.stats() for name, stage in self.stages.items()}
+
+    def start(self, start=0.0, end=None):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, args=(start, end), name='show-runtime', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        self.stop()
+        for stage in self.stages.values():
+            stage.player.close()
+
+
+def parse_stage(text):
+    # 'path/show1.tw' 或 'path/show1.tw@2' (SHOW 2)
+    path, sep, number = text.rpartition('@')
+    if not sep or not number.isdigit():
+        return text, None
+    return path, int(number)
+
+
+def main(argv=None):
+    import argparse
+    from dmx_output import ArtNetOutput
+    parser = argparse.ArgumentParser(description="Play several shows at once, one per stage")
+    parser.add_argument('stages', nargs='+', metavar='SHOW[@N]',
+                        help=".tw show file or compiled .twc, @N selects SHOW N (default: the first)")
+    parser.add_argument('--artnet', action='append', default=[], metavar='HOST',
+                        help="send the n-th stage to this Art-Net host, repeat once per stage")
+    parser.add_argument('--fps', type=float, default=DEFAULT_FPS)
+    parser.add_argument('--workers', type=int, default=None, help="render threads (default: one per stage)")
+    parser.add_argument('--duration', type=float, default=None, help="stop after this many seconds")
+    parser.add_argument('--live', action='store_true', help="keep running after the shows end")
+    args = parser.parse_args(argv)
+
+    runtime = ShowRuntime(args.fps, args.workers)
+    t0 = time.perf_counter()
+    for k, text in enumerate(args.stages):
+        path, number = parse_stage(text)
+        output = None
+        if k < len(args.artnet):
+            output = ArtNetOutput(runtime.load(path)[0].universes, host=args.artnet[k])
+        runtime.add_stage(f"stage{k + 1}", path, number, output, live=args.live)
+    print(f"{len(runtime.stages)} stages from {len(runtime._shows)} shows loaded in "
+          f"{time.perf_counter() - t0:.3f}s")
+    try:
+        runtime.run(end=args.duration)
+    except KeyboardInterrupt:
+        pass
+    runtime.close()
+    for name, stats in runtime.stats().items():
+        print(f"{name}: {stats['frames_rendered']} frames, {stats['dropped_frames']} dropped, "
+              f"{stats['late_frames']} late, jitter mean {stats['jitter_mean_sec'] * 1000:.3f} ms "
+              f"max {stats['jitter_max_sec'] * 1000:.3f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+import math
+import heapq
+import numpy as np
+from show_ir import LUT_SIZE
+import Pylogger
+
+logger = Pylogger.get_logger()
+
+
+def lut_sweep(table, lut_id, u):
+    # lut_lookup 的陣列版本，u 為相對位置的陣列，運算順序與 lut_lookup 相同，結果完全一致
+    # table 為 ir.lut_values 轉成的 float64 陣列
+    base = lut_id * LUT_SIZE
+    pos = u * (LUT_SIZE - 1)
+    i = np.clip(pos.astype(np.intp), 0, LUT_SIZE - 2)
+    v0 = table[base + i]
+    v = v0 + (table[base + i + 1] - v0) * (pos - i)
+    v[u <= 0.0] = table[base]
+    v[u >= 1.0] = table[base + LUT_SIZE - 1]
+    return v
+
+
+class SweepCache:
+    # FUNC 指令 (例如 func wave1 from 0 to PI) 在 timeline 上的每個 frame 的值
+    # 每個 timeline 事件 (instance, 開始時間) 第一次播放時，以目前的 fps 與速度一次算出整段的 frame 位置，
+    # 每個 FUNC 指令呼叫一次 lut_sweep；之後每個 frame 只需要以 frame 索引取值
+    # 已經結束的事件由 evict 移除，只保留播放中的事件，記憶體不會隨 show 的長度增加；速度改變或換 timeline 時整個清除
+    def __init__(self, ir, fps, tempo):
+        self.ir = ir
+        self.fps = fps
+        self.tempo = tempo
+        self.table = None
+        self._events = {}
+        # (事件結束的 score 時間, key) 的 heap
+        self._ends = []
+
+    def __len__(self):
+        return len(self._events)
+
+    def clear(self):
+        self._events.clear()
+        self._ends.clear()
+
+    def event(self, inst, start, prepared, end=math.inf):
+        # 回傳 (第一個 frame, 各指令每個 frame 的值)，非 FUNC 指令為 None；沒有 FUNC 指令或無法預先計算時回傳 None
+        # prepared 為 FrameRenderer.prepare 整理好的 (INTERVAL 長度, 數量, 指令, OTHERS)，end 為事件結束的 score 時間
+        key = (inst, start)
+        if key in self._events:
+            return self._events[key]
+        sweep = self._events[key] = self.build(start, prepared)
+        heapq.heappush(self._ends, (end, key))
+        return sweep
+
+    def evict(self, t):
+        # 移除在 score 時間 t 之前已經結束的事件；往回 seek 時再次播放的事件會重新計算
+        ends = self._ends
+        while ends and ends[0][0] <= t:
+            self._events.pop(heapq.heappop(ends)[1], None)
+
+    def build(self, start, prepared):
+        isec, interval_count, commands, others = prepared
+        if all(cmd[6] < 0 for cmd in commands):
+            return None
+        fps = self.fps
+        t_start = self.tempo.time_at(start)
+        t_end = self.tempo.time_at(start + isec * interval_count)
+        if math.isinf(t_end):
+            return None
+        if self.table is None or len(self.table) != len(self.ir.lut_values):
+            # hot reload 可能加入新的 LUT
+            self.table = np.frombuffer(self.ir.lut_values, dtype=np.float32).astype(np.float64)
+        # 邊界前後各多算一個 frame，超出範圍的 frame 由 lut_lookup 計算
+        f0 = max(int(math.floor(t_start * fps)) - 1, 0)
+        frames = np.arange(f0, int(math.ceil(t_end * fps)) + 2)
+        local = self.tempo.positions(frames / fps) - start
+        values = []
+        for cmd_start, cmd_end, t0, span, keys, value, lut, slots in commands:
+            if lut < 0:
+                values.append(None)
+                continue
+            v = np.minimum(np.maximum(lut_sweep(self.table, lut, (local - t0) / span) * 255.0, 0.0), 255.0)
+            values.append(v.tolist())
+        return f0, values
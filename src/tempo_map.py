@@ -0,0 +1,175 @@
+import math
+from array import array
+from bisect import bisect_right
+from show_compiler import DEFAULT_BPM
+import Pylogger
+
+logger = Pylogger.get_logger()
+
+
+class TempoMap:
+    # 把播放的實際時間對應到 timeline 上的時間 (編譯時以 cue 的 BPM 算出的秒數，以下稱 score 時間)
+    # sections 為編譯時的速度段 [(score 時間, BPM)]，換算成拍數後 score 時間與拍數可以互相對應
+    # 現場改變速度時只改變拍數推進的速度，cue 與 timeline 都不需要重新編譯
+    # 沒有改變速度時 score 時間就是實際時間，播放結果與原本完全相同
+    def __init__(self, sections=None):
+        self.set_sections(sections)
+        # 現場的速度段 (開始時間, 開始的 score 時間, BPM, 每秒 BPM 變化)，BPM 為 None 時跟隨編譯時的速度
+        # 只會整個換掉，render 執行緒讀取時不需要 lock
+        self.segments = [(0.0, 0.0, None, 0.0)]
+        self.version = 0
+
+    def set_sections(self, sections):
+        # hot reload 換上新的 timeline 時呼叫，現場的速度段保持不變
+        sections = sections or [(0.0, DEFAULT_BPM)]
+        starts, beats, bpms = array('d'), array('d'), array('d')
+        beat = 0.0
+        for start, bpm in sections:
+            if bpms:
+                beat += (start - starts[-1]) * bpms[-1] / 60.0
+            starts.append(start)
+            beats.append(beat)
+            bpms.append(bpm)
+        self.sections = (starts, beats, bpms)
+
+    def beat_at(self, score):
+        starts, beats, bpms = self.sections
+        i = max(bisect_right(starts, score) - 1, 0)
+        return beats[i] + (score - starts[i]) * bpms[i] / 60.0
+
+    def score_at(self, beat):
+        starts, beats, bpms = self.sections
+        i = max(bisect_right(beats, beat) - 1, 0)
+        return starts[i] + (beat - beats[i]) * 60.0 / bpms[i]
+
+    def score_bpm(self, score):
+        starts, beats, bpms = self.sections
+        return bpms[max(bisect_right(starts, score) - 1, 0)]
+
+    def segment(self, t):
+        segments = self.segments
+        for seg in reversed(segments):
+            if seg[0] <= t:
+                return seg
+        return segments[0]
+
+    def position(self, t):
+        # 實際時間 t 對應的 score 時間
+        t0, s0, bpm, slope = self.segment(t)
+        dt = t - t0
+        if bpm is None:
+            return s0 + dt
+        return self.score_at(self.beat_at(s0) + (bpm + slope * dt / 2) * dt / 60.0)
+
+    def positions(self, times):
+        # position 的陣列版本，times 為 numpy 陣列，結果與逐一呼叫 position 完全相同
+        import numpy as np
+        segments = self.segments
+        if len(segments) == 1 and segments[0][2] is None:
+            t0, s0 = segments[0][:2]
+            return s0 + (times - t0)
+        which = np.maximum(np.searchsorted([seg[0] for seg in segments], times, side='right') - 1, 0)
+        out = np.empty(len(times), dtype=np.float64)
+        for k, (t0, s0, bpm, slope) in enumerate(segments):
+            sel = np.flatnonzero(which == k)
+            if bpm is None:
+                out[sel] = s0 + (times[sel] - t0)
+            else:
+                out[sel] = [self.position(t) for t in times[sel].tolist()]
+        return out
+
+    def bpm_at(self, t):
+        t0, s0, bpm, slope = self.segment(t)
+        if bpm is None:
+            return self.score_bpm(s0 + t - t0)
+        return bpm + slope * (t - t0)
+
+    def time_at(self, score):
+        # position 的反函數，用來計算 timeline 結束的實際時間
+        for t0, s0, bpm, slope in reversed(self.segments):
+            if s0 > score:
+                continue
+            if bpm is None:
+                return t0 + score - s0
+            beats = (self.beat_at(score) - self.beat_at(s0)) * 60.0
+            if not slope:
+                return t0 + beats / bpm
+            disc = bpm * bpm + 2.0 * slope * beats
+            if disc < 0:
+                return math.inf
+            return t0 + (math.sqrt(disc) - bpm) / slope
+        return score
+
+    def set_bpm(self, bpm, t, ramp=0.0):
+        # 從實際時間 t 開始以 bpm 播放，ramp 大於 0 時在 ramp 秒內線性漸變
+        bpm = float(bpm)
+        if bpm <= 0:
+            raise ValueError(f"BPM must be positive, got {bpm}")
+        score = self.position(t)
+        current = self.bpm_at(t)
+        segments = [seg for seg in self.segments if seg[0] < t]
+        if ramp > 0:
+            slope = (bpm - current) / ramp
+            segments.append((t, score, current, slope))
+            beat = self.beat_at(score) + (current + bpm) / 2 * ramp / 60.0
+            segments.append((t + ramp, self.score_at(beat), bpm, 0.0))
+        else:
+            segments.append((t, score, bpm, 0.0))
+        self.swap(segments)
+        logger.info(f"Tempo {current:.2f} -> {bpm:.2f} BPM at {t:.3f}s" + (f" over {ramp:.3f}s" if ramp > 0 else ''))
+
+    def follow(self, t):
+        # 從實際時間 t 開始回到編譯時的速度
+        score = self.position(t)
+        self.swap([seg for seg in self.segments if seg[0] < t] + [(t, score, None, 0.0)])
+        logger.info(f"Tempo follows the show again at {t:.3f}s")
+
+    def swap(self, segments):
+        self.segments = segments or [(0.0, 0.0, None, 0.0)]
+        self.version += 1
+
+
+if __name__ == "__main__":
+    # 1000 個 cue 的 SHOW：現場改變速度與改寫 BPM 後完整重新編譯的比較
+    import re
+    import sys
+    import time
+    import tempfile
+    from show_generator import ShowGenerator
+    from show_project import ShowProject
+    from show_compiler import ShowCompiler
+    from show_ir import build_ir
+    from renderer import FrameRenderer
+
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    with tempfile.TemporaryDirectory() as root:
+        show_path = ShowGenerator(fixtures=200, cues=50, show_calls=calls).write_project(root)
+        t0 = time.perf_counter()
+        project = ShowProject(show_path)
+        ir = build_ir(project, ShowCompiler(project).compile())
+        print(f"initial compile: {len(ir.timelines[1])} cues, {time.perf_counter() - t0:.3f}s")
+        renderer = FrameRenderer(ir)
+        renderer.render(100)
+
+        # 舊的做法：改寫 SHOW 中每個 cue 的 BPM，重新解析、綁定與取樣
+        with open(show_path, encoding='utf-8') as f:
+            text = f.read()
+        with open(show_path, 'w', encoding='utf-8') as f:
+            f.write(re.sub(r'\((\d+),', '(150,', text))
+        t0 = time.perf_counter()
+        project = ShowProject(show_path)
+        recompiled = build_ir(project, ShowCompiler(project).compile())
+        FrameRenderer(recompiled).render(101)
+        recompile = time.perf_counter() - t0
+
+        # TempoMap：下一個 frame 就使用新的速度
+        times = []
+        for i, bpm in enumerate((150.0, 90.0, 128.0, 150.0)):
+            t0 = time.perf_counter()
+            renderer.tempo.set_bpm(bpm, (101 + i) / renderer.fps, ramp=2.0 if i % 2 else 0.0)
+            renderer.render(102 + i)
+            times.append(time.perf_counter() - t0)
+        live = sorted(times)[len(times) // 2]
+        print(f"full recompile at 150 BPM: {recompile * 1000:.1f} ms")
+        print(f"tempo map change + next frame: {live * 1000:.3f} ms ({recompile / live:.0f}x faster), "
+              f"show length {renderer.frame_count / renderer.fps:.1f}s")
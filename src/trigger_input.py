@@ -0,0 +1,233 @@
+import time
+import struct
+import asyncio
+import threading
+import Pylogger
+import Pymetrics
+
+logger = Pylogger.get_logger()
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 9000
+
+
+def osc_pad(data):
+    # OSC 字串以 NUL 結尾並補齊到 4 bytes
+    return data + b'\0' * (4 - len(data) % 4)
+
+
+def read_osc_string(data, pos):
+    end = data.index(b'\0', pos)
+    return data[pos:end].decode('utf-8'), (end + 4) & ~3
+
+
+def encode_osc(address, *args):
+    tags = ','
+    payload = b''
+    for arg in args:
+        if isinstance(arg, bool):
+            tags += 'T' if arg else 'F'
+        elif isinstance(arg, int):
+            tags += 'i'
+            payload += struct.pack('>i', arg)
+        elif isinstance(arg, float):
+            tags += 'f'
+            payload += struct.pack('>f', arg)
+        else:
+            tags += 's'
+            payload += osc_pad(str(arg).encode('utf-8'))
+    return osc_pad(address.encode('utf-8')) + osc_pad(tags.encode('ascii')) + payload
+
+
+def decode_osc(data):
+    # OSC 1.0 訊息：address、type tag 與 int32 / float32 / string / T / F 參數
+    # 沒有 NUL 的純文字 "/cue cross" 也接受，方便用 nc 測試
+    if data.startswith(b'#bundle'):
+        raise ValueError("OSC bundles are not supported")
+    if not data.startswith(b'/'):
+        raise ValueError("OSC address should start with '/'")
+    if b'\0' not in data:
+        parts = data.decode('utf-8').split()
+        return parts[0], parts[1:]
+    address, pos = read_osc_string(data, 0)
+    if pos >= len(data):
+        return address, []
+    tags, pos = read_osc_string(data, pos)
+    if not tags.startswith(','):
+        raise ValueError(f"Invalid OSC type tags {tags!r}")
+    args = []
+    for tag in tags[1:]:
+        if tag == 'i':
+            args.append(struct.unpack_from('>i', data, pos)[0])
+            pos += 4
+        elif tag == 'f':
+            args.append(struct.unpack_from('>f', data, pos)[0])
+            pos += 4
+        elif tag == 's':
+            value, pos = read_osc_string(data, pos)
+            args.append(value)
+        elif tag in 'TF':
+            args.append(tag == 'T')
+        else:
+            raise ValueError(f"Unsupported OSC type tag {tag!r}")
+    return address, args
+
+
+class CueTriggers:
+    # 播放前把 playback 函式庫的 cue 名稱綁定成 IR 中的 instance，觸發時只需查表
+    # 現場的速度由 renderer 的 TempoMap 換算，BPM 改變時不需要重新綁定
+    def __init__(self, project, builder, renderer=None, bpm=None, names=None):
+        self.project = project
+        self.builder = builder
+        self.renderer = renderer
+        self.bpm = bpm
+        self.names = list(names) if names is not None else sorted(project.cues.files)
+        self.table = {}
+        self._cache = {}
+        self.resolve_all()
+
+    def bind(self, name):
+        # 同一個檔案的 name / alias / 檔名共用同一個 instance
+        key = (self.project.cues.files.get(name, name), self.bpm)
+        inst = self._cache.get(key)
+        if inst is None:
+            cue = self.project.cues.get(name)
+            params = []
+            if self.bpm is not None and 'BPM' in cue.params:
+                params.append(('BPM', str(self.bpm)))
+            t0 = Pymetrics.now()
+            inst = self.builder.add_instance(self.project.binder.bind(cue, params))
+            if self.renderer is not None:
+                self.renderer.prepare(inst)
+            Pymetrics.record('trigger_bind', t0)
+            self._cache[key] = inst
+        return inst
+
+    def resolve_all(self):
+        table = {}
+        for name in self.names:
+            try:
+                table[name] = self.bind(name)
+            except ValueError as e:
+                logger.error(f"Cannot prepare cue {name!r} for triggering: {e}")
+        # 整個表一次換上，接收執行緒不會看到一半的結果
+        self.table = table
+        logger.info(f"{len(table)} cue names ready for triggering at BPM {self.bpm or 'default'}")
+
+    def get(self, name):
+        inst = self.table.get(name)
+        if inst is None:
+            raise ValueError(f"Unknown cue {name!r}, available: {sorted(self.table)}")
+        return inst
+
+
+class TriggerProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+
+    def datagram_received(self, data, addr):
+        self.server.handle(data, addr, time.monotonic())
+
+
+class TriggerServer:
+    # 以 asyncio 接收 UDP 上的 OSC 訊息，event loop 在獨立的執行緒執行
+    # /cue <name> 或 /cue/<name>：觸發 cue
+    # /bpm <value> [ramp 秒數]：下一個 frame 開始改變速度，沒有參數或 0 時回到 SHOW 的速度
+    # /release：停止所有觸發的 cue
+    def __init__(self, player, triggers, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self.player = player
+        self.triggers = triggers
+        self.host = host
+        self.port = port
+        self.received = 0
+        self.errors = 0
+        self.loop = None
+        self.transport = None
+        self.error = None
+        self._ready = threading.Event()
+        self._thread = None
+
+    def handle(self, data, addr, received):
+        self.received += 1
+        try:
+            address, args = decode_osc(data)
+            if address == '/cue' or address.startswith('/cue/'):
+                name = address[5:] or (str(args[0]) if args else '')
+                self.player.trigger(self.triggers.get(name), received)
+                Pymetrics.count('triggers')
+            elif address == '/bpm':
+                bpm = float(args[0]) if args else 0.0
+                if bpm:
+                    self.player.set_bpm(bpm, float(args[1]) if len(args) > 1 else 0.0)
+                else:
+                    self.player.follow_tempo()
+            elif address == '/release':
+                self.player.release()
+            else:
+                raise ValueError(f"Unknown OSC address {address!r}")
+        except (ValueError, IndexError, struct.error) as e:
+            self.errors += 1
+            logger.warning(f"Ignored OSC message from {addr[0]}:{addr[1]}: {e}")
+
+    def run(self):
+        loop = self.loop = asyncio.new_event_loop()
+        try:
+            self.transport, _ = loop.run_until_complete(loop.create_datagram_endpoint(
+                lambda: TriggerProtocol(self), local_addr=(self.host, self.port)))
+        except OSError as e:
+            self.error = e
+            self._ready.set()
+            loop.close()
+            return
+        self.host, self.port = self.transport.get_extra_info('sockname')[:2]
+        self._ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            self.transport.close()
+            loop.run_until_complete(asyncio.sleep(0))
+            loop.close()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='trigger-input', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self.error is not None:
+            raise self.error
+        logger.info(f"Listening for OSC triggers on udp://{self.host}:{self.port}")
+        return self
+
+    def close(self):
+        if self._thread is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    import sys
+    from show_project import ShowProject
+    from show_compiler import ShowCompiler
+    from show_ir import IRBuilder
+    from show_player import ShowPlayer
+    from dmx_output import NullOutput
+    project = ShowProject(sys.argv[1] if len(sys.argv) > 1 else "../example/show250601/show/show1.tw")
+    builder = IRBuilder(project)
+    ir = builder.build(ShowCompiler(project).compile())
+    Pymetrics.enable()
+    player = ShowPlayer(ir, NullOutput(ir.universes), live=True)
+    triggers = CueTriggers(project, builder, player.renderer)
+    with TriggerServer(player, triggers) as server:
+        print(f"Send OSC to udp://{server.host}:{server.port}, e.g. python osc_send.py /cue cross; Ctrl-C to stop")
+        try:
+            player.run()
+        except KeyboardInterrupt:
+            pass
+    player.close()
+    print(Pymetrics.snapshot()['histograms'].get('trigger_latency'))
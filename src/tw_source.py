@@ -0,0 +1,66 @@
+import re
+from lexer import Lexer
+from parser_core import ParseError
+from cue_parser import CueParser
+from show_parser import ShowParser
+from setting_parser import SettingParser
+
+# 單一 .tw 檔案的語法檢查，只需要 lexer 與 parser，命令列的 parse 與 lint 共用
+# .tw 檔案依第一個 token 判斷種類
+FILE_KINDS = {
+    'CUE': 'cue',
+    'SETTING': 'show', 'PLAYBACK': 'show', 'SHOW': 'show',
+    'LIBS': 'setting', 'FIXTURE': 'setting', 'PATCH': 'setting', 'GROUP': 'setting',
+}
+PARSERS = {'cue': CueParser, 'show': ShowParser, 'setting': SettingParser}
+
+# 錯誤訊息中的位置，輸出時改放在檔名後面
+_location_re = re.compile(r' at line (\d+),? column (\d+)')
+
+
+def error_from(e):
+    m = _location_re.search(str(e))
+    if m is None:
+        return ParseError(0, 0, str(e))
+    return ParseError(int(m.group(1)), int(m.group(2)), str(e))
+
+
+def read_text(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def parse_source(path):
+    # 以錯誤恢復模式解析，回傳 (kind, parser, ast, errors)；無法判斷種類或無法恢復時 ast 為 None
+    # FUNC 運算式不在這裡編譯
+    try:
+        tokens = list(Lexer(read_text(path)).generate_tokens())
+    except (OSError, ValueError, RuntimeError) as e:
+        return None, None, None, [error_from(e)]
+    if not tokens:
+        return None, None, None, []
+    kind = FILE_KINDS.get(tokens[0].type)
+    if kind is None:
+        token = tokens[0]
+        return None, None, None, [ParseError(token.line, token.column,
+                                             f"Unknown file type, unexpected {token.type} at start of file")]
+    errors = []
+    parser = PARSERS[kind](tokens, errors=errors)
+    try:
+        ast = parser.parse()
+    except ValueError as e:
+        # 無法恢復的錯誤，例如缺少 CUE END / SHOW END
+        token = tokens[min(parser.pos, len(tokens) - 1)]
+        errors.append(ParseError(token.line, token.column, str(e)))
+        return kind, parser, None, errors
+    ast.path = path
+    return kind, parser, ast, errors
+
+
+def format_error(path, line, column, severity, message):
+    message = ' '.join(_location_re.sub('', message).split())
+    if line and column:
+        return f"{path}:{line}:{column}: {severity}: {message}"
+    if line:
+        return f"{path}:{line}: {severity}: {message}"
+    return f"{path}: {severity}: {message}"
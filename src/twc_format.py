@@ -0,0 +1,238 @@
+import os
+import sys
+import mmap
+import struct
+import zlib
+import hashlib
+from array import array
+from show_ir import ShowIR, build_ir
+from show_compiler import Timeline, tempo_sections
+import Pylogger
+
+logger = Pylogger.get_logger()
+
+# .twc 檔案格式
+# header: magic, version, byte order, section 數量, payload 長度, payload crc32, 來源檔案摘要
+# section 目錄: 每筆 name(24), typecode(1), offset(8), nbytes(8)
+# payload: 各 section 依 8 bytes 對齊，數值欄位可直接以 memoryview.cast 使用
+TWC_MAGIC = b'TWC\x00'
+TWC_VERSION = 2
+HEADER = struct.Struct('<4sHHIQI32s')
+SECTION = struct.Struct('<24scxxxxxxxQQ')
+ALIGN = 8
+STRING_CODE = b's'
+# 字串欄位: 字串數量 (uint32) 後接以 \0 分隔的 UTF-8 字串
+STRING_COUNT = struct.Struct('<I')
+BYTE_ORDERS = {'little': 1, 'big': 2}
+
+# ShowIR 中要寫入的欄位
+STRING_FIELDS = (
+    'universes', 'fix_alias', 'type_alias', 'group_name', 'color_alias', 'inst_name', 'lut_name',
+)
+ARRAY_FIELDS = (
+    'fix_type', 'fix_universe', 'fix_address',
+    'type_channel_offset', 'type_channel_count', 'ch_kind', 'ch_min', 'ch_max',
+    'group_flags', 'group_member_offset', 'group_member_count', 'group_members',
+    'color_values',
+    'inst_bpm', 'inst_rate', 'inst_interval_sec', 'inst_interval_count', 'inst_others',
+    'inst_cmd_offset', 'inst_cmd_count',
+    'cmd_channel', 'cmd_mode', 'cmd_start', 'cmd_end', 'cmd_fix_offset', 'cmd_fix_count',
+    'cmd_value', 'cmd_lut', 'cmd_fixtures',
+    'lut_from', 'lut_to', 'lut_values',
+)
+
+
+class StaleArtifactError(ValueError):
+    pass
+
+
+def source_digest(paths):
+    # 以檔案路徑、大小與修改時間計算摘要，來源變更時 .twc 即視為過期
+    h = hashlib.blake2b(digest_size=32)
+    for path in paths:
+        st = os.stat(path)
+        h.update(f"{os.path.abspath(path)}\0{st.st_size}\0{st.st_mtime_ns}\n".encode('utf-8'))
+    return h.digest()
+
+
+def timeline_sections(ir):
+    numbers = array('i')
+    event_offset = array('I')
+    event_count = array('I')
+    starts = array('d')
+    durations = array('d')
+    ends = array('d')
+    instances = array('I')
+    cp_offset = array('I')
+    cp_count = array('I')
+    cp_members = array('I')
+    show_cp_offset = array('I')
+    for number, timeline in sorted(ir.timelines.items()):
+        numbers.append(number)
+        event_offset.append(len(starts))
+        event_count.append(len(timeline))
+        starts.extend(timeline.starts)
+        durations.extend(timeline.durations)
+        ends.extend(timeline.ends)
+        instances.extend(timeline.instances)
+        show_cp_offset.append(len(cp_offset))
+        for checkpoint in timeline.checkpoints:
+            cp_offset.append(len(cp_members))
+            cp_count.append(len(checkpoint))
+            cp_members.extend(checkpoint)
+    return {
+        'show_number': numbers, 'show_ev_offset': event_offset, 'show_ev_count': event_count,
+        'show_cp_offset': show_cp_offset, 'ev_start': starts, 'ev_duration': durations, 'ev_end': ends,
+        'ev_instance': instances, 'cp_offset': cp_offset, 'cp_count': cp_count, 'cp_members': cp_members,
+    }
+
+
+def encode_strings(values):
+    # 記錄字串數量，[''] (一個空字串，例如只有 inline cue 的 inst_name) 與 [] 才能區分
+    return STRING_COUNT.pack(len(values)) + '\0'.join(values).encode('utf-8')
+
+
+def decode_strings(data):
+    if len(data) < STRING_COUNT.size:
+        raise ValueError("String section is too small")
+    count, = STRING_COUNT.unpack_from(data)
+    if not count:
+        return []
+    values = bytes(data[STRING_COUNT.size:]).decode('utf-8').split('\0')
+    if len(values) != count:
+        raise ValueError(f"String section has {len(values)} strings, expected {count}")
+    return values
+
+
+def write_twc(ir, path, sources=()):
+    sections = []
+    for name in STRING_FIELDS:
+        sections.append((name, STRING_CODE, encode_strings(getattr(ir, name))))
+    sections.append(('sources', STRING_CODE, encode_strings([os.path.abspath(p) for p in sources])))
+    for name in ARRAY_FIELDS:
+        column = getattr(ir, name)
+        if not isinstance(column, array):
+            column = array(column.format, column)
+        sections.append((name, column.typecode.encode('ascii'), column.tobytes()))
+    for name, column in timeline_sections(ir).items():
+        sections.append((name, column.typecode.encode('ascii'), column.tobytes()))
+
+    directory_size = SECTION.size * len(sections)
+    offset = HEADER.size + directory_size
+    offset += -offset % ALIGN
+    data_start = offset
+    directory = []
+    for name, code, data in sections:
+        directory.append(SECTION.pack(name.encode('ascii'), code, offset, len(data)))
+        offset += len(data)
+        offset += -offset % ALIGN
+
+    payload = bytearray(offset - HEADER.size)
+    payload[:directory_size] = b''.join(directory)
+    for (name, code, data), entry in zip(sections, directory):
+        _, _, sec_offset, nbytes = SECTION.unpack(entry)
+        start = sec_offset - HEADER.size
+        payload[start:start + nbytes] = data
+    header = HEADER.pack(TWC_MAGIC, TWC_VERSION, BYTE_ORDERS[sys.byteorder], len(sections),
+                         len(payload), zlib.crc32(payload), source_digest(sources))
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(payload)
+    os.replace(tmp_path, path)
+    logger.info(f"Wrote {path}: {len(sections)} sections, {HEADER.size + len(payload)} bytes, data at {data_start}")
+    return path
+
+
+def load_twc(path, verify=True, check_sources=True):
+    f = open(path, 'rb')
+    try:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        f.close()
+    return read_sections(path, mm, memoryview(mm), verify, check_sources)
+
+
+def read_sections(path, mm, view, verify, check_sources):
+    if len(mm) < HEADER.size:
+        raise ValueError(f"{path} is too small to be a .twc file")
+    magic, version, byte_order, count, payload_size, crc, digest = HEADER.unpack_from(mm, 0)
+    if magic != TWC_MAGIC:
+        raise ValueError(f"{path} is not a .twc file")
+    if version != TWC_VERSION:
+        raise StaleArtifactError(f"{path} has format version {version}, expected {TWC_VERSION}")
+    if byte_order != BYTE_ORDERS[sys.byteorder]:
+        raise StaleArtifactError(f"{path} was compiled on a machine with a different byte order")
+    if HEADER.size + payload_size != len(mm):
+        raise ValueError(f"{path} is truncated")
+    if verify and zlib.crc32(view[HEADER.size:]) != crc:
+        raise ValueError(f"{path} checksum mismatch")
+
+    sections = {}
+    for i in range(count):
+        name, code, offset, nbytes = SECTION.unpack_from(mm, HEADER.size + i * SECTION.size)
+        name = name.rstrip(b'\0').decode('ascii')
+        data = view[offset:offset + nbytes]
+        if code == STRING_CODE:
+            try:
+                sections[name] = decode_strings(data)
+            except ValueError as e:
+                raise ValueError(f"{path} section {name}: {e}")
+        else:
+            sections[name] = data.cast(code.decode('ascii'))
+
+    if check_sources:
+        sources = sections['sources']
+        try:
+            current = source_digest(sources)
+        except OSError as e:
+            raise StaleArtifactError(f"{path} source is missing: {e}")
+        if current != digest:
+            raise StaleArtifactError(f"{path} is older than its sources, recompile it")
+
+    ir = ShowIR()
+    for name in STRING_FIELDS + ARRAY_FIELDS:
+        setattr(ir, name, sections[name])
+    ir.sources = sections['sources']
+    for i, number in enumerate(sections['show_number']):
+        ev0 = sections['show_ev_offset'][i]
+        ev1 = ev0 + sections['show_ev_count'][i]
+        cp0 = sections['show_cp_offset'][i]
+        cp1 = cp0 + (sections['show_ev_count'][i] + Timeline.CHECKPOINT - 1) // Timeline.CHECKPOINT
+        checkpoints = []
+        for c in range(cp0, cp1):
+            m0 = sections['cp_offset'][c]
+            checkpoints.append(sections['cp_members'][m0:m0 + sections['cp_count'][c]])
+        # 速度段由各 cue instance 的 BPM 重建，與編譯時相同
+        instances = sections['ev_instance'][ev0:ev1]
+        tempo = tempo_sections(zip(sections['ev_start'][ev0:ev1], (ir.inst_bpm[j] for j in instances)))
+        ir.timelines[number] = Timeline.from_columns(
+            number, sections['ev_start'][ev0:ev1], sections['ev_duration'][ev0:ev1],
+            sections['ev_end'][ev0:ev1], instances, checkpoints, tempo)
+    # 保留 mmap，ShowIR 的欄位直接指向檔案內容
+    ir._mmap = mm
+    logger.info(f"Loaded {path}: {ir.fixture_count} fixtures, {ir.instance_count} cue instances")
+    return ir
+
+
+def compile_show_file(show_path, out_path=None):
+    from show_project import ShowProject
+    from show_compiler import ShowCompiler
+    project = ShowProject(show_path)
+    timelines = ShowCompiler(project).compile()
+    ir = build_ir(project, timelines)
+    out_path = out_path or os.path.splitext(show_path)[0] + '.twc'
+    return write_twc(ir, out_path, project.source_files())
+
+
+if __name__ == "__main__":
+    import time
+    show_path = sys.argv[1] if len(sys.argv) > 1 else "../example/show250601/show/show1.tw"
+    out_path = sys.argv[2] if len(sys.argv) > 2 else None
+    out_path = compile_show_file(show_path, out_path)
+    t0 = time.perf_counter()
+    ir = load_twc(out_path)
+    elapsed = time.perf_counter() - t0
+    print(f"Loaded {out_path} in {elapsed * 1000:.2f} ms")
+    for number, timeline in ir.timelines.items():
+        print(f"SHOW {number}: {len(timeline)} events, {timeline.duration:.3f}s")
@@ -0,0 +1,122 @@
+import os
+import sys
+import time
+import Pylogger
+
+logger = Pylogger.get_logger()
+
+# 命令列入口：python twiskalq.py [--log [PATH]] [--log-level LEVEL] <command> ...
+# 各指令需要的模組 (sympy、numpy、renderer 等) 在執行該指令時才匯入，parse 只需要 lexer 與 parser
+COMMANDS = {
+    'parse': "check the syntax of .tw files",
+    'lint': "check a whole show directory (libraries, fixtures, FUNCs, cue calls)",
+    'compile': "compile a show to a .twc file",
+    'play': "play a show in real time",
+    'stages': "play several shows at once, one per stage",
+    'diff': "compare two frame streams (recordings or rendered shows)",
+}
+LOG_LEVELS = list(Pylogger.Levels) + ['DEBUG', 'INFO', 'WARNING', 'ERROR']
+
+
+def tw_files(paths):
+    # 目錄中的 .tw 檔案依名稱排序，略過 __twcache__ 與隱藏目錄
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for directory, dirs, names in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if not d.startswith(('.', '__')))
+            for name in sorted(names):
+                if name.endswith('.tw'):
+                    yield os.path.join(directory, name)
+
+
+def cmd_parse(argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog='twiskalq parse', description="Check the syntax of .tw files. "
+                                     "FUNC expressions and libraries are not checked, use lint for that.")
+    parser.add_argument('paths', nargs='+', help=".tw files or directories")
+    parser.add_argument('--ast', action='store_true', help="print the syntax tree of each file")
+    args = parser.parse_args(argv)
+    from tw_source import parse_source, format_error
+
+    t0 = time.perf_counter()
+    files = errors = 0
+    for path in tw_files(args.paths):
+        files += 1
+        kind, _, ast, file_errors = parse_source(path)
+        for error in file_errors:
+            print(format_error(path, error.line, error.column, 'error', error.message))
+        errors += len(file_errors)
+        if args.ast and ast is not None:
+            import pprint
+            print(f"{path}: {kind}")
+            pprint.pprint(ast)
+    print(f"{files} files parsed in {(time.perf_counter() - t0) * 1000:.1f} ms: {errors} errors")
+    return 1 if errors else 0
+
+
+def cmd_lint(argv):
+    from lint import main
+    return main(argv)
+
+
+def cmd_compile(argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog='twiskalq compile', description="Compile a show to a .twc file")
+    parser.add_argument('show', help=".tw show file")
+    parser.add_argument('-o', '--out', default=None, help="output path (default: <show>.twc)")
+    args = parser.parse_args(argv)
+    from twc_format import compile_show_file
+
+    t0 = time.perf_counter()
+    out = compile_show_file(args.show, args.out)
+    print(f"{args.show} -> {out} in {time.perf_counter() - t0:.2f} s")
+    return 0
+
+
+def cmd_play(argv):
+    from show_player import main
+    return main(argv)
+
+
+def cmd_stages(argv):
+    from show_runtime import main
+    return main(argv)
+
+
+def cmd_diff(argv):
+    from frame_diff import main
+    return main(argv)
+
+
+HANDLERS = {'parse': cmd_parse, 'lint': cmd_lint, 'compile': cmd_compile, 'play': cmd_play, 'stages': cmd_stages,
+            'diff': cmd_diff}
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog='twiskalq', description="Twiskalq show tools",
+        epilog='\n'.join(f"  {name:10s}{text}" for name, text in COMMANDS.items()),
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--log', nargs='?', const='', default=None, metavar='PATH',
+                        help="write a log file (default: twiskalq_run.log)")
+    parser.add_argument('--log-level', choices=LOG_LEVELS, default='SHOW_PARSER', metavar='LEVEL',
+                        help=f"lowest level written to the log file: {', '.join(LOG_LEVELS)}")
+    parser.add_argument('command', choices=sorted(COMMANDS), help="see below, '<command> -h' for its options")
+    parser.add_argument('args', nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.log is not None:
+        level = Pylogger.Levels.get(args.log_level) or getattr(Pylogger.logging, args.log_level)
+        Pylogger.logger_enable(args.log or None, level)
+    try:
+        return HANDLERS[args.command](args.args)
+    except (OSError, ValueError) as e:
+        logger.error(str(e))
+        print(f"twiskalq {args.command}: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
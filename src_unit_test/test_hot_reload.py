@@ -0,0 +1,56 @@
+import os
+import sys
+import shutil
+import tempfile
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from hot_reload import HotReloader
+from show_project import ShowProject
+from show_compiler import ShowCompiler
+from show_ir import build_ir, ROLLBACK_FIELDS
+from renderer import FrameRenderer
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example', 'show250601')
+
+
+def edit(path, old, new):
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    assert old in text
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text.replace(old, new, 1))
+
+
+def render_all(renderer):
+    return [renderer.render(i).tobytes() for i in range(renderer.frame_count)]
+
+
+def test_failed_reload_is_rolled_back():
+    # 錯誤的存檔不改變 IR，之後正確的存檔照常換上
+    with tempfile.TemporaryDirectory() as tmp:
+        root = os.path.join(tmp, 'show')
+        shutil.copytree(EXAMPLE, root, ignore=shutil.ignore_patterns('__twcache__', '*.twc'))
+        reloader = HotReloader(os.path.join(root, 'show', 'show1.tw'))
+        ir = reloader.ir
+        renderer = reloader.attach(FrameRenderer(ir))
+        renderer.render(0)
+        cue_path = reloader.project.cues.files['cross_back_01']
+        lengths = {name: len(getattr(ir, name)) for name in ROLLBACK_FIELDS}
+
+        edit(cue_path, 'LIGHT.L COLOR value "red_a"', 'LIGHT.L COLOR value "nope"')
+        with pytest.raises(ValueError, match="Unknown color"):
+            reloader.reload([cue_path])
+        assert {name: len(getattr(ir, name)) for name in ROLLBACK_FIELDS} == lengths
+        assert renderer._pending is None
+
+        edit(cue_path, 'LIGHT.L COLOR value "nope"', 'LIGHT.L COLOR value "green_a"')
+        assert reloader.reload([cue_path])
+        assert len({len(getattr(ir, name)) for name in ROLLBACK_FIELDS if name.startswith('cmd_')
+                    and name != 'cmd_fixtures'}) == 1
+        render_all(renderer)
+
+        project = ShowProject(reloader.project.show_path, use_cache=False)
+        expected = render_all(FrameRenderer(build_ir(project, ShowCompiler(project).compile())))
+    assert render_all(FrameRenderer(ir)) == expected
@@ -0,0 +1,44 @@
+import os
+import sys
+import random
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from lexer import Lexer
+
+CUE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example', 'show250601', 'show_lib',
+                   'playback_lib', 'cross_back_01.tw')
+
+
+def read_cue():
+    with open(CUE, encoding='utf-8') as f:
+        return f.read()
+
+
+def test_newline_edits_match_full_lex():
+    # 新增或刪除換行後，增量結果與重新完整掃描一致
+    lx = Lexer(read_cue() * 20)
+    lx.tokenize()
+    rng = random.Random(1)
+    for _ in range(200):
+        offset = rng.randrange(len(lx.text) + 1)
+        deleted = min(rng.randrange(3), len(lx.text) - offset)
+        try:
+            lx.update(offset, deleted, rng.choice(['\n', '\n\n', '', ' x ', 'a\nb']))
+        except RuntimeError:
+            continue
+        if rng.random() < 0.1:
+            assert lx.tokens == Lexer(lx.text).tokenize()
+    assert lx.tokens == Lexer(lx.text).tokenize()
+
+
+def test_failed_update_keeps_text():
+    # 掃描出錯時文字與 token 保持原狀
+    lx = Lexer(read_cue())
+    tokens = list(lx.tokenize())
+    text = lx.text
+    with pytest.raises(RuntimeError):
+        lx.update(len(text) // 2, 0, '@')
+    assert lx.text == text
+    assert lx.tokens == tokens
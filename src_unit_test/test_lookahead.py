@@ -0,0 +1,31 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from show_project import ShowProject
+from show_compiler import ShowCompiler
+from show_ir import build_ir
+from lookahead import LookaheadCompiler
+from show_player import ShowPlayer
+from dmx_output import NullOutput
+from renderer import FrameRenderer
+
+SHOW = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example', 'show250601', 'show', 'show1.tw')
+
+
+def test_short_show_plays_to_the_end():
+    # cue 數量不超過 lookahead：第一個 frame 之前就全部編譯完，仍要播放整個 show
+    project = ShowProject(SHOW, use_cache=False)
+    frame_count = FrameRenderer(build_ir(project, ShowCompiler(project).compile())).frame_count
+    compiler = LookaheadCompiler(ShowProject(SHOW, use_cache=False))
+    assert len(compiler.show.body) <= compiler.lookahead
+    player = ShowPlayer(compiler.ir, NullOutput(compiler.ir.universes), lookahead=compiler)
+    compiler.start()
+    compiler._thread.join()
+    player.run()
+    player.close()
+    compiler.stop()
+    assert compiler.done and compiler.error is None
+    assert player.frames_rendered > 0
+    assert player.frame_index == frame_count
@@ -0,0 +1,71 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from show_project import ShowProject
+from show_compiler import ShowCompiler
+from show_ir import build_ir
+from renderer import FrameRenderer
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example', 'show250601')
+
+# 兩個寫入相同燈具的 cue 重疊並重複出現：套用順序改變時 LTP 的結果也要跟著改變
+DIM_CUE = """CUE {name} START
+    IN BPM, RATE, LIGHT
+    INTERVAL 4
+    DIMMER{{
+        INTERVAL[1-4]{{
+            LIGHT.ALL DIMMER value {value}
+        }}
+    }}
+    OTHERS{{bypass}}
+CUE END
+"""
+
+SHOW = """SETTING "setting"
+PLAYBACK "playback_lib_250601"
+
+SHOW 1 START
+    CUE dimA(60, RATE=1) CUE END
+    WAIT 2 beats
+    CUE dimB(60, RATE=1) CUE END
+    WAIT 2 beats
+    CUE dimA(60, RATE=1) CUE END
+    WAIT 2 beats
+    CUE host(60, RATE=2) CUE END
+    CUE dimB(60, RATE=1) CUE END
+SHOW END
+"""
+
+
+def make_project(root):
+    shutil.copytree(EXAMPLE, root, ignore=shutil.ignore_patterns('__twcache__', '*.twc'))
+    lib = os.path.join(root, 'show_lib')
+    for name, value in (('dimA', 100), ('dimB', 200)):
+        with open(os.path.join(lib, 'playback_lib', f'{name}.tw'), 'w', encoding='utf-8') as f:
+            f.write(DIM_CUE.format(name=name, value=value))
+    playback = os.path.join(lib, 'playback_lib_250601.json')
+    with open(playback, encoding='utf-8') as f:
+        records = json.load(f)
+    records += [{'name': name, 'alias': name, 'file': f'{name}.tw'} for name in ('dimA', 'dimB')]
+    with open(playback, 'w', encoding='utf-8') as f:
+        json.dump(records, f)
+    show_path = os.path.join(root, 'show', 'show_dim.tw')
+    with open(show_path, 'w', encoding='utf-8') as f:
+        f.write(SHOW)
+    return show_path
+
+
+def test_sparse_matches_full_render():
+    with tempfile.TemporaryDirectory() as tmp:
+        project = ShowProject(make_project(os.path.join(tmp, 'show')), use_cache=False)
+        ir = build_ir(project, ShowCompiler(project).compile())
+    sparse, full = FrameRenderer(ir), FrameRenderer(ir)
+    assert sparse.frame_count > 160
+    for i in range(sparse.frame_count):
+        full._full = True
+        assert sparse.render(i).tobytes() == full.render(i).tobytes(), f"frame {i} differs"